@@ -0,0 +1,159 @@
+#!/usr/bin/python
+
+"""
+Analysis of many positions at once over several processes.
+
+Positions are read as FEN, one per line, from a file or standard input.
+For each one a line of JSON is written, in the same order, saying
+whether the player to move is in check, checkmated or stalemated and
+listing their legal moves (see moves.toText()):
+
+ {"check": true, "checkmate": false, "fen": "...", "moves": ["e1d1", ...], "stalemate": false}
+
+Lines that are not positions get {"error": ..., "fen": ...} instead, so
+the output always has one line per position. Blank lines are skipped.
+
+Input is handed to the worker processes in chunks of lines as it is
+read, and only a few chunks per worker are held at once, so files of
+any size are analysed in bounded memory:
+
+ $ ./batch_analysis.py positions.fen --workers 8 > results.jsonl
+ $ cat positions.fen | ./batch_analysis.py > results.jsonl
+"""
+import argparse
+import collections
+import itertools
+import json
+import multiprocessing
+import sys
+
+import bitboard
+import board_analyzer
+import constants
+import fen
+import moves
+
+#Positions given to a worker at a time
+CHUNK_SIZE = 256
+
+_KINGS = (constants.KING, constants.KING | constants.BLACK_PIECE)
+
+def analysePosition(text):
+    """
+    Analyses one position.
+
+    @param text:    Position in FEN (see fen.py).
+    @return:        Dictionary with the FEN and whether the player to move
+                    is in check ("check"), checkmated ("checkmate") or
+                    stalemated ("stalemate"), and their legal moves
+                    ("moves"), or the FEN and an "error" if it could not
+                    be read.
+    """
+    try:
+        board, player = fen.boardFromFen(text)
+    except ValueError as error:
+        return {"fen": text, "error": str(error)}
+    for king in _KINGS:
+        if bitboard.popCount(board.getBitboard(king)) != 1:
+            return {"fen": text, "error": "each player needs one king"}
+
+    legalMoves = board.getLegalMoves(player)
+    check = board_analyzer.isCheckStatic(board, player)
+    return {"fen": text,
+            "check": check,
+            "checkmate": check and not legalMoves,
+            "stalemate": not check and not legalMoves,
+            "moves": [moves.toText(move) for move in legalMoves]}
+
+def _analyseChunk(lines):
+    """
+    Analyses a chunk of positions (in a worker process).
+
+    @return:    List of JSON lines.
+    """
+    return [json.dumps(analysePosition(line), sort_keys=True) for line in lines]
+
+def _chunks(lines, chunkSize):
+    """
+    Groups the non-blank lines into lists of at most chunkSize.
+    """
+    positions = (line.strip() for line in lines)
+    positions = (line for line in positions if line)
+    while True:
+        chunk = list(itertools.islice(positions, chunkSize))
+        if not chunk:
+            return
+        yield chunk
+
+def analyseLines(lines, workers=1, chunkSize=CHUNK_SIZE):
+    """
+    Analyses a stream of positions.
+
+    @param lines:       Iterable of FEN lines (e.g. an open file).
+    @param workers:     Number of processes to analyse positions with.
+    @param chunkSize:   Positions given to a worker at a time.
+    @return:            Generator of JSON lines (see analysePosition()),
+                        in input order.
+    @raise ValueError:  If chunkSize is less than 1.
+    """
+    if chunkSize < 1:
+        raise ValueError("chunk size must be at least 1, not %d" % chunkSize)
+    if workers <= 1:
+        for chunk in _chunks(lines, chunkSize):
+            for result in _analyseChunk(chunk):
+                yield result
+        return
+
+    #Keep a few chunks per worker in flight, so memory use stays
+    #bounded however far the reader falls behind
+    pool = multiprocessing.Pool(workers)
+    try:
+        pending = collections.deque()
+        for chunk in _chunks(lines, chunkSize):
+            pending.append(pool.apply_async(_analyseChunk, (chunk,)))
+            if len(pending) >= 2 * workers:
+                for result in pending.popleft().get():
+                    yield result
+        while pending:
+            for result in pending.popleft().get():
+                yield result
+    finally:
+        pool.terminate()
+        pool.join()
+
+def _positive(text):
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError("must be at least 1, not %d" % value)
+    return value
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Analyse positions given as FEN lines.")
+    parser.add_argument("input", nargs="?", default="-",
+                        help="file of FEN lines, or - for standard input (the default)")
+    parser.add_argument("--output", metavar="FILE",
+                        help="file to write JSON lines to (default standard output)")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count(),
+                        help="processes to analyse positions with (default one per core)")
+    parser.add_argument("--chunk-size", type=_positive, default=CHUNK_SIZE,
+                        help="positions given to a worker at a time (default %d)" % CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    source = sys.stdin
+    if args.input != "-":
+        source = open(args.input, "r")
+    output = sys.stdout
+    if args.output:
+        output = open(args.output, "w")
+    try:
+        for result in analyseLines(source, args.workers, args.chunk_size):
+            output.write(result + "\n")
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
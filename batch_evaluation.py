@@ -0,0 +1,237 @@
+#!/usr/bin/python
+
+"""
+Evaluation of many positions at once with NumPy.
+
+Boards are packed into an array of shape (N, 12, 64): one plane of 64
+squares (a1 = 0) per piece, in the order of constants.WHITE_PIECES
+followed by constants.BLACK_PIECES. Every
+feature is then computed for all N positions with array operations
+instead of Python loops.
+
+Without mobility, the scores are the same as evaluation.evaluate(),
+including the blend of middlegame and endgame values.
+
+NumPy is optional: the rest of the game runs without it, and the
+functions here raise ImportError if it is missing.
+"""
+import constants
+import bitboard
+import evaluation
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+#Piece code of each plane
+PIECES = constants.WHITE_PIECES + constants.BLACK_PIECES
+
+#Centipawns per square a knight, bishop, rook or queen can move to
+MOBILITY_WEIGHT = 4
+
+_PLANE = dict((piece, index) for index, piece in enumerate(PIECES))
+
+#Column and row step of each sliding direction
+_ORTHOGONAL_STEPS = [(0, 1), (0, -1), (1, 0), (-1, 0)]
+_DIAGONAL_STEPS = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+
+_tables = None
+
+def _requireNumpy():
+    if numpy is None:
+        raise ImportError("batch evaluation needs NumPy (pip install numpy)")
+
+def _rayIndices(step):
+    """
+    Returns an array of shape (7, 64) giving the square k + 1 steps away
+    from each square in one direction, or 64 once off the board.
+    """
+    rays = numpy.full((7, 64), 64, dtype=numpy.intp)
+    for sq in range(64):
+        col, row = bitboard.location(sq)
+        for k in range(7):
+            col += step[0]
+            row += step[1]
+            if not (0 <= col < 8 and 0 <= row < 8):
+                break
+            rays[k, sq] = bitboard.square(col, row)
+    return rays
+
+def _jumpIndices(attacks):
+    """
+    Returns 8 arrays of shape (1, 64) which together list the squares a
+    piece moving like attacks() reaches from each square, padded with 64.
+    """
+    jumps = numpy.full((8, 1, 64), 64, dtype=numpy.intp)
+    for sq in range(64):
+        for index, target in enumerate(bitboard.squares(attacks(1 << sq))):
+            jumps[index, 0, sq] = target
+    return list(jumps)
+
+def _getTables():
+    """
+    Builds the lookup arrays on first use.
+    """
+    global _tables
+    _requireNumpy()
+    if _tables is None:
+        values = numpy.array([evaluation.pieceValue(piece) for piece in PIECES],
+                             dtype=numpy.int32)
+        bonuses = numpy.array([[evaluation.squareBonus(piece, sq) for sq in range(64)]
+                               for piece in PIECES], dtype=numpy.int32)
+
+        #White pieces count for white, black pieces against
+        signs = numpy.array([1] * 6 + [-1] * 6, dtype=numpy.int32)
+        _tables = {
+            "values": values * signs,
+            "bonuses": bonuses * signs[:, None],
+            "endgame": numpy.array([evaluation.ENDGAME_SCORES[piece] for piece in PIECES],
+                                   dtype=numpy.int32),
+            "phases": numpy.array([evaluation.PHASES[piece] for piece in PIECES],
+                                  dtype=numpy.int32),
+            "orthogonal": [_rayIndices(step) for step in _ORTHOGONAL_STEPS],
+            "diagonal": [_rayIndices(step) for step in _DIAGONAL_STEPS],
+            "knight": _jumpIndices(bitboard.knightAttacks),
+            "shifts": numpy.arange(64, dtype=numpy.uint64),
+        }
+    return _tables
+
+def packBoards(boards):
+    """
+    Packs boards into piece planes.
+
+    @param boards:  Sequence of N Board instances.
+    @return:        uint8 array of shape (N, 12, 64). Entry [n, p, sq] is 1
+                    if board n has piece PIECES[p] on square sq.
+    """
+    tables = _getTables()
+    words = numpy.array([[board.getBitboard(piece) for piece in PIECES]
+                         for board in boards], dtype=numpy.uint64)
+    words = words.reshape((len(boards), 12, 1))
+    return ((words >> tables["shifts"]) & numpy.uint64(1)).astype(numpy.uint8)
+
+def materialScores(planes):
+    """
+    Returns the material balance of each position.
+
+    @param planes:  Piece planes of shape (N, 12, 64) (see packBoards()).
+    @return:        int32 array of shape (N,), positive when white is ahead.
+    """
+    counts = planes.sum(axis=2, dtype=numpy.int32)
+    return counts.dot(_getTables()["values"])
+
+def placementScores(planes):
+    """
+    Returns the piece-square balance of each position
+    (see evaluation.PIECE_SQUARE_TABLES).
+
+    @param planes:  Piece planes of shape (N, 12, 64) (see packBoards()).
+    @return:        int32 array of shape (N,), positive when white is ahead.
+    """
+    bonuses = _getTables()["bonuses"]
+    return numpy.einsum("npq,pq->n", planes.astype(numpy.int32), bonuses)
+
+def endgameScores(planes):
+    """
+    Returns the balance of material and piece placement of each position
+    with endgame values (see evaluation.ENDGAME_PIECE_VALUES and
+    evaluation.ENDGAME_SQUARE_TABLES).
+
+    @param planes:  Piece planes of shape (N, 12, 64) (see packBoards()).
+    @return:        int32 array of shape (N,), positive when white is ahead.
+    """
+    scores = _getTables()["endgame"]
+    return numpy.einsum("npq,pq->n", planes.astype(numpy.int32), scores)
+
+def phases(planes):
+    """
+    Returns the phase of each position (see evaluation.PHASE_WEIGHTS).
+
+    @param planes:  Piece planes of shape (N, 12, 64) (see packBoards()).
+    @return:        int32 array of shape (N,), at most evaluation.MAX_PHASE.
+    """
+    counts = planes.sum(axis=2, dtype=numpy.int32)
+    return numpy.minimum(counts.dot(_getTables()["phases"]), evaluation.MAX_PHASE)
+
+def _signedPlane(planes, pieceType):
+    """
+    Returns where one piece type stands: 1 for white's, -1 for black's.
+    """
+    index = _PLANE[pieceType]
+    return planes[:, index] - planes[:, index + 6]
+
+def mobilityScores(planes):
+    """
+    Returns the mobility balance of each position: the number of squares
+    white's knights, bishops, rooks and queens attack that are not
+    occupied by white pieces, less the same number for black.
+
+    @param planes:  Piece planes of shape (N, 12, 64) (see packBoards()).
+    @return:        int32 array of shape (N,), positive when white is ahead.
+    """
+    tables = _getTables()
+    planes = planes.astype(numpy.int8)
+    count = planes.shape[0]
+
+    #Owner of each square: 1 for white, -1 for black, 0 if empty.
+    #Square 64 stands for off the board.
+    owners = numpy.zeros((count, 65), dtype=numpy.int8)
+    owners[:, :64] = planes[:, :6].sum(axis=1) - planes[:, 6:].sum(axis=1)
+
+    queens = _signedPlane(planes, constants.QUEEN)
+    pieceGroups = [(tables["orthogonal"], _signedPlane(planes, constants.ROOK) + queens, 7),
+                   (tables["diagonal"], _signedPlane(planes, constants.BISHOP) + queens, 7),
+                   (tables["knight"], _signedPlane(planes, constants.KNIGHT), 1)]
+
+    scores = numpy.zeros(count, dtype=numpy.int32)
+    for rays, pieces, length in pieceGroups:
+        #Only visit the squares holding these pieces, as (board, square) pairs
+        boards, squares = numpy.nonzero(pieces)
+        colors = pieces[boards, squares]
+        moves = numpy.zeros(len(boards), dtype=numpy.int32)
+
+        #Walk out along each ray, stopping at the first piece
+        for ray in rays:
+            clear = numpy.ones(len(boards), dtype=bool)
+            for k in range(length):
+                targets = ray[k][squares]
+                owner = owners[boards, targets]
+                clear &= targets != 64
+                moves += clear & (owner != colors)
+                clear &= owner == 0
+
+        scores += numpy.bincount(boards, moves * colors, count).astype(numpy.int32)
+    return scores
+
+def evaluateBatch(boards, players=None, mobilityWeight=MOBILITY_WEIGHT):
+    """
+    Scores many positions at once.
+
+    @param boards:          Sequence of N Board instances, or piece planes
+                            already packed by packBoards().
+    @param players:         Player to move in each position (a sequence
+                            or a single player), or None to score every
+                            position from white's point of view.
+    @param mobilityWeight:  Centipawns per square of mobility. With 0, the
+                            scores equal evaluation.evaluate().
+    @return:                int32 array of N scores in centipawns, each
+                            from the point of view of the player to move.
+    """
+    _requireNumpy()
+    if isinstance(boards, numpy.ndarray):
+        planes = boards
+    else:
+        planes = packBoards(boards)
+
+    #Blend the middlegame and endgame scores as evaluation.taper() does
+    phase = phases(planes)
+    scores = ((materialScores(planes) + placementScores(planes)) * phase +
+              endgameScores(planes) * (evaluation.MAX_PHASE - phase)) // evaluation.MAX_PHASE
+    if mobilityWeight:
+        scores += mobilityWeight * mobilityScores(planes)
+
+    if players is not None:
+        players = numpy.asarray(players)
+        scores = numpy.where(players == constants.BLACK_PLAYER, -scores, scores)
+    return scores.astype(numpy.int32)
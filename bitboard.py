@@ -0,0 +1,271 @@
+#!/usr/bin/python
+
+"""
+Bitboard helpers.
+
+A bitboard is an integer with one bit per square of the board. Squares
+are numbered from a1 (0) to h8 (63), so a square's index is
+row * 8 + col, using the same column/row numbers as Board._board.
+
+The functions taking a bitboard of pieces work on any number of pieces
+at once. For a single piece, the tables at the end of this module give
+the same answers by lookup.
+"""
+import constants
+
+#All 64 squares
+FULL = 0xFFFFFFFFFFFFFFFF
+
+#File and rank masks
+FILE_A = 0x0101010101010101
+FILE_H = FILE_A << 7
+RANK_1 = 0xFF
+RANK_4 = RANK_1 << 24
+RANK_5 = RANK_1 << 32
+
+NOT_FILE_A  = FULL ^ FILE_A
+NOT_FILE_H  = FULL ^ FILE_H
+NOT_FILE_AB = NOT_FILE_A & (NOT_FILE_A << 1)
+NOT_FILE_GH = NOT_FILE_H & (NOT_FILE_H >> 1)
+
+FILES = [FILE_A << col for col in range(8)]
+RANKS = [RANK_1 << (8 * row) for row in range(8)]
+
+#Sliding directions as (shift, mask of squares a shifted bit may land on)
+NORTH      = (8, FULL)
+SOUTH      = (-8, FULL)
+EAST       = (1, NOT_FILE_A)
+WEST       = (-1, NOT_FILE_H)
+NORTH_EAST = (9, NOT_FILE_A)
+NORTH_WEST = (7, NOT_FILE_H)
+SOUTH_EAST = (-7, NOT_FILE_A)
+SOUTH_WEST = (-9, NOT_FILE_H)
+
+ORTHOGONAL = [NORTH, SOUTH, EAST, WEST]
+DIAGONAL   = [NORTH_EAST, NORTH_WEST, SOUTH_EAST, SOUTH_WEST]
+
+def square(col, row):
+    """
+    Converts board coordinates to a square index.
+
+    @param col:     Column of the square (0-7).
+    @param row:     Row of the square (0-7).
+    @return:        Square index (0-63).
+    """
+    return row * 8 + col
+
+def location(sq):
+    """
+    Converts a square index to board coordinates.
+
+    @param sq:      Square index (0-63).
+    @return:        Coordinates of the square (e.g. [4, 0]).
+    """
+    return [sq & 7, sq >> 3]
+
+def lsb(bb):
+    """
+    Returns the index of the lowest set square of a bitboard.
+
+    @param bb:      Non-empty bitboard.
+    @return:        Square index (0-63).
+    """
+    return (bb & -bb).bit_length() - 1
+
+def msb(bb):
+    """
+    Returns the index of the highest set square of a bitboard.
+
+    @param bb:      Non-empty bitboard.
+    @return:        Square index (0-63).
+    """
+    return bb.bit_length() - 1
+
+def popCount(bb):
+    """
+    Counts the squares set in a bitboard.
+
+    @param bb:      Bitboard.
+    @return:        Number of set squares.
+    """
+    return bin(bb).count('1')
+
+def squares(bb):
+    """
+    Yields the index of every square set in a bitboard, lowest first.
+
+    @param bb:      Bitboard.
+    """
+    while bb:
+        low = bb & -bb
+        yield low.bit_length() - 1
+        bb ^= low
+
+def slide(bb, empty, direction):
+    """
+    Computes the squares attacked along one direction by sliding pieces.
+
+    Uses a Kogge-Stone occluded fill, so the cost does not depend on the
+    length of the ray.
+
+    @param bb:          Bitboard of sliding pieces.
+    @param empty:       Bitboard of empty squares.
+    @param direction:   One of the direction constants (e.g. NORTH).
+    @return:            Bitboard of attacked squares, including blockers.
+    """
+    amount, mask = direction
+    empty &= mask
+    if amount > 0:
+        bb |= empty & (bb << amount)
+        empty &= empty << amount
+        bb |= empty & (bb << 2 * amount)
+        empty &= empty << 2 * amount
+        bb |= empty & (bb << 4 * amount)
+        return (bb << amount) & mask
+    amount = -amount
+    bb |= empty & (bb >> amount)
+    empty &= empty >> amount
+    bb |= empty & (bb >> 2 * amount)
+    empty &= empty >> 2 * amount
+    bb |= empty & (bb >> 4 * amount)
+    return (bb >> amount) & mask
+
+def rookAttacks(bb, occupied):
+    """
+    Squares attacked by rook-like movement.
+
+    @param bb:          Bitboard of attacking pieces.
+    @param occupied:    Bitboard of all occupied squares.
+    @return:            Bitboard of attacked squares.
+    """
+    empty = FULL ^ occupied
+    attacks = 0
+    for direction in ORTHOGONAL:
+        attacks |= slide(bb, empty, direction)
+    return attacks
+
+def bishopAttacks(bb, occupied):
+    """
+    Squares attacked by bishop-like movement.
+
+    @param bb:          Bitboard of attacking pieces.
+    @param occupied:    Bitboard of all occupied squares.
+    @return:            Bitboard of attacked squares.
+    """
+    empty = FULL ^ occupied
+    attacks = 0
+    for direction in DIAGONAL:
+        attacks |= slide(bb, empty, direction)
+    return attacks
+
+def knightAttacks(bb):
+    """
+    Squares attacked by knights.
+
+    @param bb:      Bitboard of knights.
+    @return:        Bitboard of attacked squares.
+    """
+    return ((bb << 17) & NOT_FILE_A  | (bb << 15) & NOT_FILE_H |
+            (bb << 10) & NOT_FILE_AB | (bb << 6)  & NOT_FILE_GH |
+            (bb >> 17) & NOT_FILE_H  | (bb >> 15) & NOT_FILE_A |
+            (bb >> 10) & NOT_FILE_GH | (bb >> 6)  & NOT_FILE_AB) & FULL
+
+def kingAttacks(bb):
+    """
+    Squares attacked by kings.
+
+    @param bb:      Bitboard of kings.
+    @return:        Bitboard of attacked squares.
+    """
+    sideways = ((bb << 1) & NOT_FILE_A) | ((bb >> 1) & NOT_FILE_H)
+    row = bb | sideways
+    return (sideways | (row << 8) | (row >> 8)) & FULL
+
+def pawnAttacks(bb, player):
+    """
+    Squares attacked by pawns.
+
+    @param bb:      Bitboard of pawns.
+    @param player:  Owner of the pawns (e.g. constants.WHITE_PLAYER).
+    @return:        Bitboard of attacked squares.
+    """
+    #White pawns attack towards row 7, black pawns towards row 0
+    if player == constants.WHITE_PLAYER:
+        return ((bb << 9) & NOT_FILE_A | (bb << 7) & NOT_FILE_H) & FULL
+    return (bb >> 7) & NOT_FILE_A | (bb >> 9) & NOT_FILE_H
+
+#Lookup tables, indexed by square, built once from the functions above
+KNIGHT_ATTACKS = [knightAttacks(1 << sq) for sq in range(64)]
+KING_ATTACKS   = [kingAttacks(1 << sq) for sq in range(64)]
+PAWN_ATTACKS   = {constants.WHITE_PLAYER: [pawnAttacks(1 << sq, constants.WHITE_PLAYER)
+                                           for sq in range(64)],
+                  constants.BLACK_PLAYER: [pawnAttacks(1 << sq, constants.BLACK_PLAYER)
+                                           for sq in range(64)]}
+
+#Squares on the ray leading from each square to the edge of the board,
+#indexed [direction][square]
+RAYS = {}
+for _direction in ORTHOGONAL + DIAGONAL:
+    RAYS[_direction] = [slide(1 << _sq, FULL, _direction) for _sq in range(64)]
+
+_OPPOSITE = {NORTH: SOUTH, SOUTH: NORTH, EAST: WEST, WEST: EAST,
+             NORTH_EAST: SOUTH_WEST, SOUTH_WEST: NORTH_EAST,
+             NORTH_WEST: SOUTH_EAST, SOUTH_EAST: NORTH_WEST}
+
+#Squares strictly between two squares on a shared row, column or
+#diagonal, and the whole line through them, indexed [square][square].
+#Both are empty for squares that are not aligned.
+BETWEEN = [[0] * 64 for _sq in range(64)]
+LINE    = [[0] * 64 for _sq in range(64)]
+for _direction in ORTHOGONAL + DIAGONAL:
+    for _sq in range(64):
+        _line = RAYS[_direction][_sq] | RAYS[_OPPOSITE[_direction]][_sq] | 1 << _sq
+        for _target in squares(RAYS[_direction][_sq]):
+            BETWEEN[_sq][_target] = RAYS[_direction][_sq] & ~RAYS[_direction][_target] & \
+                                    ~(1 << _target)
+            LINE[_sq][_target] = _line
+
+def rayAttacks(sq, occupied, direction):
+    """
+    Squares attacked along one direction by a sliding piece on a square.
+
+    The ray stops at the nearest occupied square, which is found with a
+    single bit scan: the lowest one for directions that increase the
+    square index, the highest one for the others.
+
+    @param sq:          Square index of the sliding piece.
+    @param occupied:    Bitboard of all occupied squares.
+    @param direction:   One of the direction constants (e.g. NORTH).
+    @return:            Bitboard of attacked squares, including the blocker.
+    """
+    rays = RAYS[direction]
+    attacks = rays[sq]
+    blockers = attacks & occupied
+    if blockers:
+        if direction[0] > 0:
+            attacks ^= rays[(blockers & -blockers).bit_length() - 1]
+        else:
+            attacks ^= rays[blockers.bit_length() - 1]
+    return attacks
+
+def rookAttacksFrom(sq, occupied):
+    """
+    Squares attacked by a rook on a square.
+
+    @param sq:          Square index of the rook.
+    @param occupied:    Bitboard of all occupied squares.
+    @return:            Bitboard of attacked squares.
+    """
+    return (rayAttacks(sq, occupied, NORTH) | rayAttacks(sq, occupied, SOUTH) |
+            rayAttacks(sq, occupied, EAST) | rayAttacks(sq, occupied, WEST))
+
+def bishopAttacksFrom(sq, occupied):
+    """
+    Squares attacked by a bishop on a square.
+
+    @param sq:          Square index of the bishop.
+    @param occupied:    Bitboard of all occupied squares.
+    @return:            Bitboard of attacked squares.
+    """
+    return (rayAttacks(sq, occupied, NORTH_EAST) | rayAttacks(sq, occupied, NORTH_WEST) |
+            rayAttacks(sq, occupied, SOUTH_EAST) | rayAttacks(sq, occupied, SOUTH_WEST))
@@ -1,9 +1,33 @@
 #!/usr/bin/python
 
-from operator import xor
+import sys
 
 import constants
 import board_analyzer
+import bitboard
+import evaluation
+import magic
+import moves
+import zobrist
+
+#Pieces whose attacks depend on which squares are occupied
+_SLIDERS = [piece for piece in constants.WHITE_PIECES + constants.BLACK_PIECES
+            if (piece & constants.PIECE_TYPE_MASK) in (constants.ROOK, constants.BISHOP,
+                                                       constants.QUEEN)]
+
+_OPPONENT = {constants.WHITE_PLAYER: constants.BLACK_PLAYER,
+             constants.BLACK_PLAYER: constants.WHITE_PLAYER}
+
+#Codes that may appear on a square
+_CODES = frozenset([constants.EMPTY] + constants.WHITE_PIECES + constants.BLACK_PIECES)
+
+#Colour bit of each player's piece codes
+_COLOUR = {constants.WHITE_PLAYER: 0,
+           constants.BLACK_PLAYER: constants.BLACK_PIECE}
+
+#Owner of each piece, indexed by piece code
+_OWNER = [constants.WHITE_PLAYER] * constants.BLACK_PIECE + \
+         [constants.BLACK_PLAYER] * constants.BLACK_PIECE
 
 class Board(object):
     def __init__(self):
@@ -16,6 +40,12 @@ class Board(object):
         #
         #See http://i.stack.imgur.com/7KSiN.png
         #for picture of board layout
+        #
+        #Internally the board is a bytearray of 64 piece codes indexed by
+        #square (see constants.py and bitboard.square()), alongside one
+        #bitboard per piece code and one occupancy bitboard per player
+        #(see bitboard.py). Reading self._board converts the codes to
+        #symbols, and assigning to it rebuilds everything.
 
         ################################################
 
@@ -28,6 +58,93 @@ class Board(object):
                         ['n','p','','','','','*p','*n'],
                         ['r','p','','','','','*p','*r'] ]
 
+    def _getSquares(self):
+        """
+        Returns the board state as list of lists of piece symbols.
+        """
+        symbols = constants.PIECE_SYMBOLS
+        squares = self._squares
+        return [[symbols[squares[row * 8 + col]] for row in range(8)]
+                for col in range(8)]
+
+    def _setSquares(self, squares):
+        """
+        Loads a board state (as list of lists) and rebuilds the bitboards.
+        Moves made before loading can no longer be unmade.
+
+        @param squares: List of lists of piece symbols, indexed [col][row].
+        """
+        pieces = bytearray(64)
+        for col in range(8):
+            for row in range(8):
+                pieces[row * 8 + col] = constants.SYMBOL_PIECES[squares[col][row]]
+        self.restore(pieces)
+
+    _board = property(_getSquares, _setSquares)
+
+    def snapshot(self):
+        """
+        Returns the pieces on the board as 64 bytes: the piece code on
+        each square, a1 first. This is far smaller and quicker to copy
+        or send to another process than the board itself.
+
+        @return:    Byte string (see restore() and position.py).
+        """
+        return bytes(self._squares)
+
+    def restore(self, snapshot):
+        """
+        Loads pieces saved by snapshot() and rebuilds the bitboards.
+        Moves made before loading can no longer be unmade.
+
+        @param snapshot:    64 piece codes indexed by square, as a byte
+                            string, bytearray or memoryview.
+        """
+        pieces = bytearray(snapshot)
+        if len(pieces) != 64:
+            raise ValueError("a snapshot holds 64 squares, not %d" % len(pieces))
+        for sq, piece in enumerate(pieces):
+            if piece not in _CODES:
+                raise ValueError("invalid piece code %d on square %d" % (piece, sq))
+
+        self._squares = bytearray(64)
+        self._bitboards = [0] * 16
+        self._occupancy = {constants.WHITE_PLAYER: 0, constants.BLACK_PLAYER: 0}
+        self._undoStack = []
+        self._key = 0
+
+        #Running totals of the pieces' middlegame and endgame scores and
+        #of their phase weights (see evaluation.py)
+        self._middlegame = 0
+        self._endgame = 0
+        self._phase = 0
+
+        #Attack maps: the squares attacked by the piece on each square,
+        #and for each player the squares attacked by any of their pieces
+        #(None while it needs rebuilding)
+        self._attackSets = [0] * 64
+        self._attackMaps = {constants.WHITE_PLAYER: 0, constants.BLACK_PLAYER: 0}
+        self._attackJournal = None
+
+        for sq, piece in enumerate(pieces):
+            if piece != constants.EMPTY:
+                self._putPiece(sq, piece)
+
+    def __deepcopy__(self, memo):
+        """
+        Copies the board. Only the board's own containers need copying,
+        since pieces, bitboards and attack sets are immutable.
+        """
+        boardCopy = Board.__new__(Board)
+        boardCopy.__dict__.update(self.__dict__)
+        boardCopy._squares = bytearray(self._squares)
+        boardCopy._bitboards = list(self._bitboards)
+        boardCopy._occupancy = dict(self._occupancy)
+        boardCopy._undoStack = list(self._undoStack)
+        boardCopy._attackSets = list(self._attackSets)
+        boardCopy._attackMaps = dict(self._attackMaps)
+        return boardCopy
+
     def getBoard(self):
         """
         Returns a copy of the current board's state.
@@ -35,45 +152,86 @@ class Board(object):
         @return:    Copy of board (as list of lists).
         """
         return self._board
-    
+
+    def getBitboard(self, piece):
+        """
+        Returns the bitboard of a given piece.
+
+        @param piece:   Piece code (e.g. constants.BLACK_PIECE | constants.QUEEN).
+        @return:        Bitboard of squares holding that piece.
+        """
+        return self._bitboards[piece]
+
+    def getPiece(self, sq):
+        """
+        Returns the piece on a square.
+
+        @param sq:  Square index (see bitboard.square()).
+        @return:    Piece code (see constants.py), or constants.EMPTY.
+        """
+        return self._squares[sq]
+
+    def getOccupancy(self, player=None):
+        """
+        Returns the squares occupied by a player, or by anyone.
+
+        @param player:  Player (e.g. constants.WHITE_PLAYER), or None for both.
+        @return:        Bitboard of occupied squares.
+        """
+        if player is None:
+            return self._occupancy[constants.WHITE_PLAYER] | \
+                   self._occupancy[constants.BLACK_PLAYER]
+        return self._occupancy[player]
+
+    def getKey(self, player):
+        """
+        Returns the Zobrist key of the position (see zobrist.py).
+
+        @param player:  Player to move (e.g. constants.WHITE_PLAYER).
+        @return:        64-bit key identifying the position.
+        """
+        return self._key ^ zobrist.sideKey(player)
+
+    def getPieceScores(self):
+        """
+        Returns the running totals used to evaluate the position, kept up
+        to date as pieces move (see evaluation.evaluate()).
+
+        @return:    Tuple (middlegame score, endgame score, phase), the
+                    scores in centipawns from white's point of view.
+        """
+        return self._middlegame, self._endgame, self._phase
+
     def pieceOwner(self, specific_move):
         """
         Returns the owner of a given piece.
-        
+
         @param specific_move    The space you are trying to check (e.g. [1, 2]).
-        @return:                Either constants.WHITE_PLAYER or 
+        @return:                Either constants.WHITE_PLAYER or
                                 constants.BLACK_PLAYER.
         """
-        if constants.BLACK_PLAYER_SYMBOL in self._board[specific_move[0]][specific_move[1]]:
+        squareBit = 1 << bitboard.square(specific_move[0], specific_move[1])
+        if self._occupancy[constants.BLACK_PLAYER] & squareBit:
             return constants.BLACK_PLAYER
-        elif constants.EMPTY_SYMBOL == self._board[specific_move[0]][specific_move[1]]:
-            return constants.EMPTY_SYMBOL
-        else:
+        elif self._occupancy[constants.WHITE_PLAYER] & squareBit:
             return constants.WHITE_PLAYER
-    
+        else:
+            return constants.EMPTY_SYMBOL
+
     def _moveConverter(self, move):
         """
-        Converts move from original string input to a list of integers: 
+        Converts move from original string input to a list of integers:
         e.g. "a2a3" => [0, 1, 0, 2].
 
         @param move:    Player's move (e.g. "a2a3").
         @return:        List containing indices for board (e.g. [0, 1, 0, 2]).
         """
-        converter = {"a":0, "b":1, "c":2, "d":3, "e":4, "f":5, "g":6, "h":7}
-        new_move = []
-        for string in move:
-            if string in converter:
-                new_move.append(converter[string])
-            else:
-                new_move.append(int(string)-1)
-        move = new_move
-        
-        return move
-        
+        return moves.toList(moves.fromText(move))
+
     def isLegalMove(self, currentPlayer, move):
         """
         Determines if a move is legal or not.
-        
+
         A move is not legal if any of the following is true:
          a) piece is not actually moved (e.g. 'a5a5')
          b) move refers to empty space
@@ -84,290 +242,327 @@ class Board(object):
 
         @precondition:    Method presumes that move is well-formed.
         (e.g. row and column values are correct).
-        
+
         @param currentPlayer:  "1" for white, "2" for black.
-        @param move:           Four character combination representing move 
+        @param move:           Four character combination representing move
                                (e.g. [1, 2, 1, 4]).
         @return:               True if move is legal, False otherwise.
         """
-        #Tests for whether a piece is not actually moved 
-        if move[0:2] == move[2:4]:
-            return False
-        else:
-            validity = True
-        
-        #Tests if there is a piece in the targeted space
-        if self._board[move[0]][move[1]] == constants.EMPTY_SYMBOL:
+        fromSq = bitboard.square(move[0], move[1])
+        fromBit = 1 << fromSq
+        toBit = 1 << bitboard.square(move[2], move[3])
+        own = self._occupancy[currentPlayer]
+
+        #Tests for whether a piece is not actually moved
+        if fromBit == toBit:
             return False
-        else:
-            validity = True
-            
-        #Tests if the game piece is not owned by the current player
-        if currentPlayer != self.pieceOwner([move[0], move[1]]):
+
+        #Tests if the current player has a piece in the targeted space
+        if not own & fromBit:
             return False
-        else:
-            validity = True
-       
+
         #Tests if game piece owned by the current player occupies end destination
-        if currentPlayer == self.pieceOwner([move[2], move[3]]):
+        if own & toBit:
             return False
-        else:
-            validity = True
-        
+
         #Tests whether the move is legal for a specific piece
-        if constants.PAWN_SYMBOL in self._board[move[0]][move[1]]:
-            if self._isLegalMoveForPawn(move, currentPlayer) == True:
-                validity = True
-            else:
-                return False
-        if constants.ROOK_SYMBOL in self._board[move[0]][move[1]]:
-            if self._isLegalMoveForRook(move) == True:
-                validity = True
-            else:
-                return False
-        if constants.KNIGHT_SYMBOL in self._board[move[0]][move[1]]:
-            if self._isLegalMoveForKnight(move) == True:
-                validity = True
-            else:
-                return False
-        if constants.BISHOP_SYMBOL in self._board[move[0]][move[1]]:
-            if self._isLegalMoveForBishop(move) == True:
-                validity = True
-            else:
-                return False
-        if constants.QUEEN_SYMBOL in self._board[move[0]][move[1]]:
-            if self._isLegalMoveForQueen(move) == True:
-                validity = True
-            else:
-                return False
-        if constants.KING_SYMBOL in self._board[move[0]][move[1]]:
-            if self._isLegalMoveForKing(move) == True:
-                validity = True
-            else:
+        pieceType = self._squares[fromSq] & constants.PIECE_TYPE_MASK
+        if pieceType == constants.PAWN:
+            if not self._isLegalMoveForPawn(move, currentPlayer):
                 return False
-        
+        elif not self._pieceAttacks(pieceType, fromSq) & toBit:
+            return False
+
         #Tests whether current player's move will move current player in check
-        if board_analyzer.isCheck(self._board, currentPlayer, move) == True:
+        if board_analyzer.isCheck(self, currentPlayer, move) == True:
             return False
-        else:
-            validity = True
 
-        return validity
+        return True
+
+    def _pieceAttacks(self, pieceType, fromSq):
+        """
+        Returns the squares a non-pawn piece attacks from a given square.
+
+        @param pieceType:   Piece type (e.g. constants.ROOK).
+        @param fromSq:      Square index of the piece.
+        @return:            Bitboard of attacked squares.
+        """
+        if pieceType == constants.KNIGHT:
+            return bitboard.KNIGHT_ATTACKS[fromSq]
+        if pieceType == constants.KING:
+            return bitboard.KING_ATTACKS[fromSq]
+
+        occupied = self.getOccupancy()
+        if pieceType == constants.ROOK:
+            return magic.rookAttacks(fromSq, occupied)
+        if pieceType == constants.BISHOP:
+            return magic.bishopAttacks(fromSq, occupied)
+        return magic.queenAttacks(fromSq, occupied)
+
+    def isSquareAttacked(self, sq, player):
+        """
+        Determines if any piece of a given player attacks a square.
+
+        @param sq:      Square index (see bitboard.square()).
+        @param player:  Attacking player (e.g. constants.BLACK_PLAYER).
+        @return:        True if the square is attacked, False otherwise.
+        """
+        return bool(self._attackMap(player) >> sq & 1)
+
+    def getAttackMap(self, player):
+        """
+        Returns the squares attacked by a player.
+
+        @param player:  Attacking player (e.g. constants.BLACK_PLAYER).
+        @return:        Bitboard of attacked squares.
+        """
+        return self._attackMap(player)
 
     def _isLegalMoveForRook(self, move):
         """
         Helper method for determining if move is legal for rook.
-        
+
         @param move:    Four-character combination representing player move.
         @return:        True if move is legal, False otherwise.
         """
-        horizontal = None
-        vertical = None
-        horizontal_blocking = None
-        vertical_blocking = None
-            
-        #Allows for horizontal movement
-        if move[1] == move[3]:
-            horizontal = True
-
-            #Tests whether piece in path of horizontal movement
-            if move[0] < move[2]:
-                blocked_spaces = 0
-                for space in range(move[0] + 1, move[2]):
-                    if constants.EMPTY_SYMBOL != self._board[space][move[1]]:
-                        blocked_spaces += 1
-                if blocked_spaces == 0:
-                    horizontal_blocking = False
-            else:
-                blocked_spaces = 0
-                for space in range(move[2] + 1, move[0]):
-                    if constants.EMPTY_SYMBOL != self._board[space][move[1]]:
-                        blocked_spaces += 1
-                if blocked_spaces == 0:
-                    horizontal_blocking = False  
-
-        #Allows for vertical movement
-        if move[0] == move[2]:
-            vertical = True
-            
-            #Tests whether piece in path of vertical movement
-            if move[0] < move[2]: 
-                blocked_spaces = 0
-                for space in range(move[1] + 1, move[3]):
-                    if constants.EMPTY_SYMBOL != self._board[move[0]][space]:
-                        blocked_spaces += 1
-                if blocked_spaces == 0:
-                    vertical_blocking = False
-            else:
-                blocked_spaces = 0
-                for space in range(move[3] + 1, move[1]):
-                    if constants.EMPTY_SYMBOL != self._board[move[0]][space]:
-                        blocked_spaces += 1
-                if blocked_spaces == 0:
-                    vertical_blocking = False
-
-        if xor((horizontal == True and horizontal_blocking == False), \
-            (vertical == True and vertical_blocking == False) == True):
-            return True
-        else:
-            return False
+        toBit = 1 << bitboard.square(move[2], move[3])
+        fromSq = bitboard.square(move[0], move[1])
+        return bool(self._pieceAttacks(constants.ROOK, fromSq) & toBit)
 
     def _isLegalMoveForKnight(self, move):
         """
         Helper method for determining if move is legal for knight.
-        
+
         @param move:    Four-character combination representing player move.
         @return:        True if move is legal, False otherwise.
         """
-        if (move[0] + 2 == move[2] and move[1] + 1 == move[3]) or \
-        (move[0] + 2 == move[2] and move[1] - 1 == move[3]) or \
-        (move[0] - 2 == move[2] and move[1] + 1 == move[3]) or \
-        (move[0] - 2 == move[2] and move[1] - 1 == move[3]) or \
-        (move[0] + 1 == move[2] and move[1] + 2 == move[3]) or \
-        (move[0] + 1 == move[2] and move[1] - 2 == move[3]) or \
-        (move[0] - 1 == move[2] and move[1] + 2 == move[3]) or \
-        (move[0] - 1  == move[2] and move[1] - 2 == move[3]):
-            return True
-        else:
-            return False
+        toBit = 1 << bitboard.square(move[2], move[3])
+        fromSq = bitboard.square(move[0], move[1])
+        return bool(self._pieceAttacks(constants.KNIGHT, fromSq) & toBit)
 
     def _isLegalMoveForBishop(self, move):
         """
         Helper method for determining if move is legal for bishop.
-        
+
         @param move:    Four-character combination representing player move.
         @return:        True if move is legal, False otherwise.
         """
-        #Allows for diagonal movement
-        if abs(move[2] - move[0]) != abs(move[3] - move[1]):
-            return False
-
-        #Test whether piece in path of upper-right diagonal movement
-        if move[2] - move[0] > 0 and move[3] - move[1] > 0:
-            for space in range(1, abs(move[2] - move[0])):
-                if constants.EMPTY_SYMBOL != self._board[move[0] + space][move[1] + space]:
-                    return False
-                
-        #Test whether piece in path of upper-left diagonal movement
-        if move[2] - move[0] < 0 and move[3] - move[1] > 0:
-            for space in range(1, abs(move[2] - move[0])):
-                if constants.EMPTY_SYMBOL != self._board[move[0] - space][move[1] + space]:
-                    return False
-                
-        #Test whether piece in path of lower-right diagonal movement
-        if move[2] - move[0] > 0 and move[3] - move[1] < 0:
-            for space in range(1, abs(move[2] - move[0])):
-                if constants.EMPTY_SYMBOL != self._board[move[0] + space][move[1] - space]:
-                    return False
-                
-        #Test whether piece in path of lower-left diagonal movement
-        if move[2] - move[0] < 0 and move[3] - move[1] < 0:
-            for space in range(1, abs(move[2] - move[0])):
-                if constants.EMPTY_SYMBOL != self._board[move[0] - space][move[1] - space]:
-                    return False
-
-        return True
+        toBit = 1 << bitboard.square(move[2], move[3])
+        fromSq = bitboard.square(move[0], move[1])
+        return bool(self._pieceAttacks(constants.BISHOP, fromSq) & toBit)
 
     def _isLegalMoveForQueen(self, move):
         """
         Helper method for determining if move is legal for queen.
-        
-        Calls isLegalMoveForRook and isLegalMoveForBishop since queen
-        movements are either rook-like or bishop-like.
-        
+
+        Queen movements are either rook-like or bishop-like.
+
         @param move:    Four-character combination representing player move.
         @return:        True if move is legal, False otherwise.
         """
-        if xor(self._isLegalMoveForRook(move), self._isLegalMoveForBishop(move)) == True:
-            return True
-        else:
-            return False
+        toBit = 1 << bitboard.square(move[2], move[3])
+        fromSq = bitboard.square(move[0], move[1])
+        return bool(self._pieceAttacks(constants.QUEEN, fromSq) & toBit)
 
     def _isLegalMoveForKing(self, move):
         """
         Helper method for determining if move is legal for king.
-        
+
         @param move:    Four-character combination representing player move.
         @return:        True if move is legal, False otherwise.
         """
-        #Allows for horizontal movement
-        if (move[0] + 1 == move[2] or move[0] - 1 == move[2]):
-            return True
-        else:
-            validity = False
-        
-        #Allows for vertical movement
-        if (move[1] + 1 == move[3] or move[1] - 1 == move[3]):
-            return True
-        else:
-            validity = False
-            
-        #Allows for diagonal movement
-        if (move[0] + 1 == move[2] and move[1] + 1 == move[3]) or \
-        (move[0] - 1 == move[2] and move[1] - 1 == move[3]) or \
-        (move[0] + 1 == move[2] and move[1] - 1 == move[3]) or \
-        (move[0] - 1 == move[2] and move[1] + 1 == move[3]):
-            return True
-        else:
-            validity = False
-        
-        return validity
+        toBit = 1 << bitboard.square(move[2], move[3])
+        fromSq = bitboard.square(move[0], move[1])
+        return bool(self._pieceAttacks(constants.KING, fromSq) & toBit)
 
     def _isLegalMoveForPawn(self, move, currentPlayer):
-        """        
+        """
         Helper method for determining if move is legal for pawn.
-        
+
         @param move:            Four-character combination representing player move.
         @param currentPlayer:   "1" for white, "2" for black.
         @return:                True if move is legal, False otherwise.
         """
-        acceptable = [0, 1, 2, 3, 4, 5, 6, 7]
-        
+        toBit = 1 << bitboard.square(move[2], move[3])
+        fromSq = bitboard.square(move[0], move[1])
+        return bool(self._pawnTargets(fromSq, currentPlayer) & toBit)
+
+    def _pawnTargets(self, fromSq, currentPlayer):
+        """
+        Returns the squares a pawn may move to.
+
+        @param fromSq:          Square index of the pawn.
+        @param currentPlayer:   "1" for white, "2" for black.
+        @return:                Bitboard of destination squares.
+        """
+        empty = bitboard.FULL ^ self.getOccupancy()
+        fromBit = 1 << fromSq
+
         if currentPlayer == constants.WHITE_PLAYER:
-            #Pawns can move up one space at a time
-            if self._board[move[0]][move[1] + 1] == constants.EMPTY_SYMBOL:
-                if move[1] + 1 == move[3] and move[0] == move[2]:
-                    return True
-            #Pawns can move up two spaces at the start
-            if move[1] == 1:
-                if move[1] + 2 == move[3] and move[0] == move[2]:
-                   if self._board[move[0]][move[1] + 1] == constants.EMPTY_SYMBOL and \
-                      self._board[move[0]][move[1] + 2] == constants.EMPTY_SYMBOL:
-                       return True
-            #Allows for NE attack
-            if move[0] + 1 in acceptable and move[1] + 1 in acceptable:
-                if move[0] + 1 == move[2] and move[1] + 1 == move[3]:
-                    if self.pieceOwner([move[0] + 1, move[1] + 1]) == constants.BLACK_PLAYER:
-                        return True
-            #Allows for NW attack
-            if move[0] - 1 in acceptable and move[1] + 1 in acceptable:
-                if move[0] - 1 == move[2] and move[1] + 1 == move[3]:
-                    if self.pieceOwner([move[0] - 1, move[1] + 1]) == constants.BLACK_PLAYER:
-                        return True
-            
-        elif currentPlayer == constants.BLACK_PLAYER:
-            #Pawns can move up one space at a time
-            if self._board[move[0]][move[1] - 1] == constants.EMPTY_SYMBOL:
-                if move[1] - 1 == move[3] and move[0] == move[2]:
-                    return True
-            #Pawns can move up two spaces at the start
-            if move[1] == 6:
-                if move[1] - 2 == move[3] and move[0] == move[2]:
-                    if self._board[move[0]][move[1] - 1] == constants.EMPTY_SYMBOL and \
-                       self._board[move[0]][move[1] - 2] == constants.EMPTY_SYMBOL:
-                        return True
-            #Allows for NE attack
-            if move[0] + 1 in acceptable and move[1] - 1 in acceptable:
-                if move[0] + 1 == move[2] and move[1] - 1 == move[3]:
-                    if self.pieceOwner([move[0] + 1, move[1] - 1]) == constants.BLACK_PLAYER:
-                        return True            
-            #Allows for NW attack
-            if move[0] - 1 in acceptable and move[1] - 1 in acceptable:
-                if move[0] - 1 == move[2] and move[1] - 1 == move[3]:
-                    if self.pieceOwner([move[0] - 1, move[1] - 1]) == constants.BLACK_PLAYER:
-                        return True
-
-        return False
+            #Pawns move up one space at a time, or two spaces at the start
+            single = (fromBit << 8) & empty
+            double = (single << 8) & empty & bitboard.RANK_4
+            enemy = self._occupancy[constants.BLACK_PLAYER]
+        else:
+            single = (fromBit >> 8) & empty
+            double = (single >> 8) & empty & bitboard.RANK_5
+            enemy = self._occupancy[constants.WHITE_PLAYER]
+
+        #Pawns attack diagonally forward
+        attacks = bitboard.PAWN_ATTACKS[currentPlayer][fromSq] & enemy
+
+        return single | double | attacks
+
+    def getLegalMoves(self, player):
+        """
+        Returns every legal move available to a player, packed (see
+        moves.py).
+
+        Checks and pins are worked out once, up front, so no move has to
+        be tried on the board to see if it leaves the king in check. When
+        the player is in check, only evasions are generated (see
+        generateEvasions()).
+
+        @param player:  Player (e.g. constants.WHITE_PLAYER).
+        @return:        array('H') of packed moves.
+        """
+        checkers = self.getCheckers(player)
+        if checkers:
+            return self._generateMoves(player, self._evasionTargets(player, checkers), checkers)
+        return self._generateMoves(player, bitboard.FULL, 0)
+
+    def generateLegalMoves(self, player):
+        """
+        Yields every legal move available to a player as a list (see
+        getLegalMoves()).
+
+        @param player:  Player (e.g. constants.WHITE_PLAYER).
+        @return:        Generator of moves (e.g. [1, 0, 2, 2]).
+        """
+        return (moves.toList(move) for move in self.getLegalMoves(player))
+
+    def generateEvasions(self, player, checkers=None):
+        """
+        Yields every legal move for a player who is in check: king moves,
+        captures of the checking piece, and moves onto the squares between
+        it and the king. In double check only the king may move.
+
+        @param player:      Player in check (e.g. constants.WHITE_PLAYER).
+        @param checkers:    Bitboard of the checking pieces, if already
+                            known (see getCheckers()).
+        @return:            Generator of moves (e.g. [1, 0, 2, 2]).
+        """
+        if checkers is None:
+            checkers = self.getCheckers(player)
+
+        evasions = self._generateMoves(player, self._evasionTargets(player, checkers), checkers)
+        return (moves.toList(move) for move in evasions)
+
+    def _evasionTargets(self, player, checkers):
+        """
+        Returns the squares that pieces other than the king may move to
+        when a player is in check: the checking piece and the squares
+        between it and the king, or none at all in double check.
+        """
+        if checkers & (checkers - 1):
+            return 0
+        kingSq = bitboard.lsb(self._bitboards[constants.KING | _COLOUR[player]])
+        return checkers | bitboard.BETWEEN[kingSq][bitboard.lsb(checkers)]
+
+    def getCheckers(self, player):
+        """
+        Returns the opponent's pieces giving check to a player's king.
+
+        @param player:  Player (e.g. constants.WHITE_PLAYER).
+        @return:        Bitboard of checking pieces.
+        """
+        colour = _COLOUR[_OPPONENT[player]]
+        bitboards = self._bitboards
+        kingSq = bitboard.lsb(bitboards[constants.KING | _COLOUR[player]])
+        occupied = self.getOccupancy()
+        queens = bitboards[colour | constants.QUEEN]
+
+        return (bitboard.KNIGHT_ATTACKS[kingSq] & bitboards[colour | constants.KNIGHT] |
+                bitboard.PAWN_ATTACKS[player][kingSq] & bitboards[colour | constants.PAWN] |
+                magic.rookAttacks(kingSq, occupied) &
+                    (bitboards[colour | constants.ROOK] | queens) |
+                magic.bishopAttacks(kingSq, occupied) &
+                    (bitboards[colour | constants.BISHOP] | queens))
+
+    def getPinned(self, player):
+        """
+        Returns a player's pieces that are pinned to their king: the only
+        piece between the king and an opponent's rook, bishop or queen.
+
+        @param player:  Player (e.g. constants.WHITE_PLAYER).
+        @return:        Bitboard of pinned pieces.
+        """
+        colour = _COLOUR[_OPPONENT[player]]
+        bitboards = self._bitboards
+        kingSq = bitboard.lsb(bitboards[constants.KING | _COLOUR[player]])
+        enemy = self._occupancy[_OPPONENT[player]]
+        occupied = self.getOccupancy()
+        queens = bitboards[colour | constants.QUEEN]
+
+        #Sliders that would attack the king if the player's pieces were gone
+        snipers = (magic.rookAttacks(kingSq, enemy) &
+                       (bitboards[colour | constants.ROOK] | queens) |
+                   magic.bishopAttacks(kingSq, enemy) &
+                       (bitboards[colour | constants.BISHOP] | queens))
+
+        pinned = 0
+        for sniperSq in bitboard.squares(snipers):
+            blockers = bitboard.BETWEEN[kingSq][sniperSq] & occupied
+            if blockers and not blockers & (blockers - 1):
+                pinned |= blockers
+        return pinned
+
+    def _generateMoves(self, player, targetMask, checkers):
+        """
+        Lists a player's legal moves, given the squares that pieces other
+        than the king are allowed to move to.
+
+        @param player:      Player (e.g. constants.WHITE_PLAYER).
+        @param targetMask:  Bitboard of allowed destinations for pieces
+                            other than the king.
+        @param checkers:    Bitboard of the pieces giving check.
+        @return:            array('H') of packed moves.
+        """
+        opponent = _OPPONENT[player]
+        notOwn = bitboard.FULL ^ self._occupancy[player]
+        kingSq = bitboard.lsb(self._bitboards[constants.KING | _COLOUR[player]])
+        pinned = self.getPinned(player)
+
+        #The king may not step onto an attacked square, nor back along the
+        #line of a checking slider (which the king itself hides from view)
+        kingTargets = bitboard.KING_ATTACKS[kingSq] & notOwn & ~self._attackMap(opponent)
+        sliders = checkers & ~(self._bitboards[_COLOUR[opponent] | constants.KNIGHT] |
+                               self._bitboards[_COLOUR[opponent] | constants.PAWN])
+        for checkerSq in bitboard.squares(sliders):
+            kingTargets &= ~bitboard.LINE[kingSq][checkerSq] | 1 << checkerSq
+
+        if player == constants.WHITE_PLAYER:
+            pieces = constants.WHITE_PIECES
+        else:
+            pieces = constants.BLACK_PIECES
+
+        moveList = moves.moveList()
+        for piece in pieces:
+            pieceType = piece & constants.PIECE_TYPE_MASK
+            for fromSq in bitboard.squares(self._bitboards[piece]):
+                if pieceType == constants.KING:
+                    targets = kingTargets
+                elif pieceType == constants.PAWN:
+                    targets = self._pawnTargets(fromSq, player) & targetMask
+                else:
+                    targets = self._pieceAttacks(pieceType, fromSq) & notOwn & targetMask
+
+                #A pinned piece may only move along the pin
+                if pinned >> fromSq & 1:
+                    targets &= bitboard.LINE[kingSq][fromSq]
+
+                moveList.extend([fromSq | toSq << 6 for toSq in bitboard.squares(targets)])
+        return moveList
 
     ################################################################
 
@@ -376,39 +571,194 @@ class Board(object):
         Moves chess piece.
 
         @precondition:         isLegalMove() must be True.
-        
+
         @param currentPlayer:  "1" for white, "2" for black.
-        @param move:           Four-character combination representing player move.
+        @param move:           Four-character combination representing player
+                               move, or a packed move (see moves.py).
+        """
+        if isinstance(move, list):
+            move = moves.fromList(move)
+        self._applyMove(move & 0x3F, move >> 6 & 0x3F)
+
+    def makeMove(self, move):
+        """
+        Makes a move that can later be taken back with unmakeMove().
+
+        @precondition:  isLegalMove() must be True.
+
+        @param move:    Four-character combination representing player move,
+                        or a packed move (see moves.py).
+        """
+        if isinstance(move, list):
+            move = moves.fromList(move)
+        fromSq = move & 0x3F
+        toSq = move >> 6 & 0x3F
+        attackMaps = (self._attackMaps[constants.WHITE_PLAYER],
+                      self._attackMaps[constants.BLACK_PLAYER])
+        scores = (self._middlegame, self._endgame, self._phase)
+
+        #Record every attack set the move replaces, so that unmakeMove
+        #can restore them instead of rescanning rays
+        self._attackJournal = []
+        capturedPiece = self._applyMove(fromSq, toSq)
+        self._undoStack.append((capturedPiece, fromSq, toSq,
+                                self._attackJournal, attackMaps, scores))
+        self._attackJournal = None
+
+    def unmakeMove(self):
+        """
+        Takes back the last move made with makeMove().
+        """
+        capturedPiece, fromSq, toSq, journal, attackMaps, scores = self._undoStack.pop()
+        piece = self._squares[toSq]
+
+        self._togglePiece(toSq, piece)
+        self._togglePiece(fromSq, piece)
+        self._squares[fromSq] = piece
+        self._squares[toSq] = capturedPiece
+        if capturedPiece != constants.EMPTY:
+            self._togglePiece(toSq, capturedPiece)
+
+        for sq, attacks in reversed(journal):
+            self._attackSets[sq] = attacks
+        self._attackMaps[constants.WHITE_PLAYER], \
+            self._attackMaps[constants.BLACK_PLAYER] = attackMaps
+        self._middlegame, self._endgame, self._phase = scores
+
+    def _applyMove(self, fromSq, toSq):
+        """
+        Moves the piece on one square to another.
+
+        Sliders are refreshed once, and only for the squares whose
+        occupancy actually changed. The evaluation totals change by the
+        moved piece's scores on the two squares and the captured piece's.
+
+        @return:    The captured piece, or constants.EMPTY.
+        """
+        piece = self._squares[fromSq]
+        capturedPiece = self._squares[toSq]
+        player = _OWNER[piece]
+        changed = 1 << fromSq
+
+        middlegame = evaluation.MIDDLEGAME_SCORES[piece]
+        endgame = evaluation.ENDGAME_SCORES[piece]
+        self._middlegame += middlegame[toSq] - middlegame[fromSq]
+        self._endgame += endgame[toSq] - endgame[fromSq]
+
+        self._setAttacks(fromSq, player, 0)
+        self._togglePiece(fromSq, piece)
+        if capturedPiece != constants.EMPTY:
+            self._setAttacks(toSq, _OPPONENT[player], 0)
+            self._togglePiece(toSq, capturedPiece)
+            self._middlegame -= evaluation.MIDDLEGAME_SCORES[capturedPiece][toSq]
+            self._endgame -= evaluation.ENDGAME_SCORES[capturedPiece][toSq]
+            self._phase -= evaluation.PHASES[capturedPiece]
+        else:
+            changed |= 1 << toSq
+        self._togglePiece(toSq, piece)
+        self._squares[toSq] = piece
+        self._squares[fromSq] = constants.EMPTY
+
+        self._refreshSliders(changed)
+        self._setAttacks(toSq, player, self._attacksFrom(toSq, piece))
+        return capturedPiece
+
+    def _putPiece(self, sq, piece):
+        """
+        Places a piece on an empty square.
+        """
+        self._togglePiece(sq, piece)
+        self._squares[sq] = piece
+        self._middlegame += evaluation.MIDDLEGAME_SCORES[piece][sq]
+        self._endgame += evaluation.ENDGAME_SCORES[piece][sq]
+        self._phase += evaluation.PHASES[piece]
+
+        self._refreshSliders(1 << sq)
+        self._setAttacks(sq, _OWNER[piece], self._attacksFrom(sq, piece))
+
+    def _togglePiece(self, sq, piece):
+        """
+        Adds a piece to, or removes it from, the bitboards and the
+        Zobrist key.
+        """
+        squareBit = 1 << sq
+        self._bitboards[piece] ^= squareBit
+        self._occupancy[_OWNER[piece]] ^= squareBit
+        self._key ^= zobrist.PIECE_KEYS[piece][sq]
+
+    def _attacksFrom(self, sq, piece):
+        """
+        Returns the squares attacked by a piece standing on a square.
+        """
+        pieceType = piece & constants.PIECE_TYPE_MASK
+        if pieceType == constants.PAWN:
+            return bitboard.PAWN_ATTACKS[_OWNER[piece]][sq]
+        return self._pieceAttacks(pieceType, sq)
+
+    def _refreshSliders(self, changed):
+        """
+        Updates the attack sets of the sliding pieces whose rays pass
+        through squares that have just been filled or cleared.
+
+        @param changed: Bitboard of the squares whose occupancy changed.
+        """
+        sliders = 0
+        for piece in _SLIDERS:
+            sliders |= self._bitboards[piece]
+
+        for sq in bitboard.squares(sliders):
+            if self._attackSets[sq] & changed:
+                piece = self._squares[sq]
+                self._setAttacks(sq, _OWNER[piece], self._attacksFrom(sq, piece))
+
+    def _setAttacks(self, sq, player, attacks):
         """
-        targetPiece = self._board[move[0]][move[1]]
-        self._board[move[2]][move[3]] = targetPiece
-        self._board[move[0]][move[1]] = constants.EMPTY_SYMBOL
-    
+        Replaces the attack set of the piece on a square. The owner's
+        attack map is rebuilt from the attack sets when next needed.
+        """
+        if self._attackSets[sq] != attacks:
+            if self._attackJournal is not None:
+                self._attackJournal.append((sq, self._attackSets[sq]))
+            self._attackSets[sq] = attacks
+            self._attackMaps[player] = None
+
+    def _attackMap(self, player):
+        """
+        Returns the squares attacked by a player, folding the attack sets
+        of the player's pieces into a cached map if it is out of date.
+        """
+        attackMap = self._attackMaps[player]
+        if attackMap is None:
+            attackMap = 0
+            attackSets = self._attackSets
+            for sq in bitboard.squares(self._occupancy[player]):
+                attackMap |= attackSets[sq]
+            self._attackMaps[player] = attackMap
+        return attackMap
+
     ################################################################
 
-    def printBoard(self):
+    def formatBoard(self):
         """
-        Prints the board.
+        Draws the board as text, white at the bottom.
+
+        @return:    String of lines, without a final newline.
         """
         divider = "  +----+----+----+----+----+----+----+----+"
+        symbols = constants.PIECE_SYMBOLS
+        squares = self._squares
+
+        lines = []
+        for row in range(7, -1, -1):
+            lines.append(divider)
+            cells = "".join(" %2s |" % symbols[squares[row * 8 + col]] for col in range(8))
+            lines.append("%d |%s" % (row + 1, cells))
+        lines.append(divider)
+        lines.append("\n     a    b    c    d    e    f    g    h")
+        return "\n".join(lines)
 
-        #Print each row
-        row = 7
-        while row >= 0:
-            print divider
-            
-            #Print each column
-            col = 0
-            text = "%s |" % str(row + 1)
-            while col < 8:
-                piece = self._board[col][row]
-                text += " %2s |" % piece
-                col = col + 1
-            print text
-
-            #Next row
-            row = row - 1
-
-        print divider
-
-        print "\n     a    b    c    d    e    f    g    h"
\ No newline at end of file
+    def printBoard(self):
+        """
+        Prints the board.
+        """
+        sys.stdout.write(self.formatBoard() + "\n")
@@ -1,537 +1,235 @@
 #!/usr/bin/python
 
 import constants
-from copy import deepcopy
+import bitboard
+import magic
+
+def _asBoard(board):
+    """
+    Returns board as a Board, wrapping a list of lists if necessary.
+
+    @param board:   A Board, or a list of lists representing the board state.
+    @return:        A Board holding the same position.
+    """
+    if not isinstance(board, list):
+        return board
+
+    from board import Board
+    wrapped = Board()
+    wrapped._board = board
+    return wrapped
+
+def _opponent(player):
+    """
+    Returns the other player.
+    """
+    if player == constants.WHITE_PLAYER:
+        return constants.BLACK_PLAYER
+    return constants.WHITE_PLAYER
+
+def _piece(player, pieceType):
+    """
+    Returns the code of a player's piece.
+
+    @param player:      Player (e.g. constants.WHITE_PLAYER).
+    @param pieceType:   Piece type (e.g. constants.QUEEN).
+    @return:            Code of that piece for the given player.
+    """
+    if player == constants.WHITE_PLAYER:
+        return pieceType
+    return constants.BLACK_PIECE | pieceType
 
 def kingLocator(board, player):
     """
     Determines the location of the king of a given player.
     
-    @param board:   A list of lists representing the board state.
+    @param board:   A Board, or a list of lists representing the board state.
     @param player:  Player (e.g. constants.WHITE_PLAYER).
     @return:        Returns the indicies of the current player's king (e.g. [0, 4]).
     """
-    if player == constants.WHITE_PLAYER:
-        piece = constants.KING_SYMBOL
-    else:
-        piece = constants.BLACK_KING_SYMBOL
-        
-    for line in board:
-        if piece in line:
-            location = [board.index(line), line.index(piece)]
-                
-    return location
-
-def isCheckMate(board, player):
+    board = _asBoard(board)
+    kings = board.getBitboard(_piece(player, constants.KING))
+    return bitboard.location(bitboard.lsb(kings))
+
+def isCheckMate(board, player, table=None):
     """
     Determines if game has ended.
 
-    @param board:   A list of lists representing the board state.
+    @param board:   The game board (a Board instance).
     @param player:  The current player (e.g. constants.WHITE_PLAYER)
+    @param table:   Optional TranspositionTable (see hasLegalMove()).
     @return:        True if game has ended, False otherwise.
     """
-    boardCopy = board.getBoard()
-    location = kingLocator(boardCopy, player)
-    acceptable = [0, 1, 2, 3, 4, 5, 6, 7]
-    
     #Tests if king is in check
-    if isCheckStatic(boardCopy, player) == False:
+    if isCheckStatic(board, player) == False:
         return False
 
-    #Tests if king can move/attack out of check
-    escapeRoutes = [[-1, -1], [-1, 0], [-1, 1], [0, -1], [0, 1], [1, -1], [1, 0], [1, 1]]
-    for route in escapeRoutes:
-        route[0] = route[0] + location[0]
-        route[1] = route[1] + location[1]
-        testMove = location + route
-        if testMove[2] not in acceptable or testMove[3] not in acceptable:
-            continue
-        if board.isLegalMove(player, testMove) == True:
-            if isCheck(boardCopy, player, testMove) == False:
-                return False
-
-    #Tests if king can get blocked out of check - for NE/SW diagonal
-    if isCheckByDiagonal(location, boardCopy, player) == True:
-        for space in range(-len(boardCopy), len(boardCopy)):
-            for horizontalSpace in range(len(boardCopy)):
-                for verticalSpace in range(len(boardCopy)):
-                    if location[0] + space not in acceptable or \
-                       location[1] + space not in acceptable:
-                        continue
-                    move = [horizontalSpace, verticalSpace, location[0] + space, location[1] + space]
-                    if board.isLegalMove(player, move) == True:
-                        if isCheck(boardCopy, player, move) == False:
-                            return False
-                   
-    #Tests if king can get blocked out of check - for NW/SE diagonal
-    if isCheckByDiagonal(location, boardCopy, player) == True:
-        for space in range(-len(boardCopy), len(boardCopy)):
-            for horizontalSpace in range(len(boardCopy)):
-                for verticalSpace in range(len(boardCopy)):
-                    if location[0] + space not in acceptable or \
-                       location[1] + space not in acceptable:
-                        continue
-                    move = [horizontalSpace, verticalSpace, location[0] - space, location[1] + space]
-                    if board.isLegalMove(player, move) == True:
-                        if isCheck(boardCopy, player, move) == False:
-                            return False
-    
-    #Tests if king can get blocked out of check - for horizontal check
-    if isCheckByHorizontal(location, boardCopy, player) == True:
-        for space in range(len(boardCopy)):
-            for horizontalSpace in range(len(boardCopy)):
-                for verticalSpace in range(len(boardCopy)):
-                    move = [horizontalSpace, verticalSpace, space, location[1]]
-                    if board.isLegalMove(player, move) == True:
-                        if isCheck(boardCopy, player, move) == False:
-                            return False
-                    
-    #Tests if king can get blocked out of check - for vertical check
-    if isCheckByVertical(location, boardCopy, player) == True:
-        for space in range(len(boardCopy)):
-            for horizontalSpace in range(len(boardCopy)):
-                for verticalSpace in range(len(boardCopy)):
-                    move = [horizontalSpace, verticalSpace, location[0], space]
-                    if board.isLegalMove(player, move) == True:
-                        if isCheck(boardCopy, player, move) == False:
-                            return False
-    
-    return True
+    #Tests if any move gets the king out of check
+    return not hasLegalMove(board, player, table)
+
+def isStaleMate(board, player, table=None):
+    """
+    Determines if the game is drawn because the player cannot move.
+
+    @param board:   The game board (a Board instance).
+    @param player:  The current player (e.g. constants.WHITE_PLAYER)
+    @param table:   Optional TranspositionTable (see hasLegalMove()).
+    @return:        True if player is not in check but has no legal move,
+                    False otherwise.
+    """
+    if isCheckStatic(board, player) == True:
+        return False
+
+    return not hasLegalMove(board, player, table)
+
+def hasLegalMove(board, player, table=None):
+    """
+    Determines if a player has at least one legal move.
+
+    @param board:   The game board (a Board instance).
+    @param player:  Player (e.g. constants.WHITE_PLAYER).
+    @param table:   Optional TranspositionTable used to remember the
+                    answer for positions seen before.
+    @return:        True if a legal move exists, False otherwise.
+    """
+    if table is not None:
+        key = board.getKey(player)
+        entry = table.probe(key)
+        if entry is not None:
+            return entry[0] == 1
+
+    result = len(board.getLegalMoves(player)) > 0
+
+    if table is not None:
+        table.store(key, int(result))
+    return result
 
 def isCheck(board, player, move):
     """
     Determines if king is in check after move.
 
-    @param board:   A list of lists representing the board state.
+    @param board:   A Board, or a list of lists representing the board state.
     @param player:  Player (e.g. constants.WHITE_PLAYER).
     @param move:    Four character combination representing move (e.g. [1, 2, 1, 4]).
     @return:        True if king is in check, False otherwise.
     """
-    testBoard = deepcopy(board)
-    testPiece = board[move[0]][move[1]]
-    testBoard[move[2]][move[3]] = testPiece
-    testBoard[move[0]][move[1]] = constants.EMPTY_SYMBOL
-
-    location = kingLocator(testBoard, player)
-    
-    if isCheckByDiagonal(location, testBoard, player) == True:
-        return True
-    if isCheckByHorizontal(location, testBoard, player) == True:
-        return True
-    if isCheckByVertical(location, testBoard, player) == True:
-        return True
-    if isCheckByKing(location, testBoard, player) == True:
-        return True
-    if isCheckByPawn(location, testBoard, player) == True:
-        return True
-    if isCheckByKnight(location, testBoard, player) == True:
-        return True
-
-    return False
+    board = _asBoard(board)
+    board.makeMove(move)
+    try:
+        return isCheckStatic(board, player)
+    finally:
+        board.unmakeMove()
 
 def isCheckStatic(board, player):
     """
     Determines if king is in check.
     
-    @param board:   A list of lists representing the board state.
+    @param board:   A Board, or a list of lists representing the board state.
     @param player:  Player (e.g. constants.WHITE_PLAYER).
     @return:        True if king is in check, False otherwise.
     """
+    board = _asBoard(board)
     location = kingLocator(board, player)
-    
-    if isCheckByDiagonal(location, board, player) == True:
-        return True
-    if isCheckByHorizontal(location, board, player) == True:
-        return True
-    if isCheckByVertical(location, board, player) == True:
-        return True
-    if isCheckByKing(location, board, player) == True:
-        return True
-    if isCheckByPawn(location, board, player) == True:
-        return True
-    if isCheckByKnight(location, board, player) == True:
-        return True
-
-    return False    
+
+    return board.isSquareAttacked(bitboard.square(location[0], location[1]),
+                                  _opponent(player))
+
+def _sliderChecks(location, board, player, pieceType):
+    """
+    Returns the opponent's pieces of one kind plus queens, along with the
+    king's square index.
+    """
+    opponent = _opponent(player)
+    attackers = board.getBitboard(_piece(opponent, pieceType)) | \
+                board.getBitboard(_piece(opponent, constants.QUEEN))
+    return attackers, bitboard.square(location[0], location[1])
 
 def isCheckByDiagonal(location, board, player):
     """
     Helper method to determine if king under attack by bishop or queen diagonally.
 
     @param location:   Location of current player's king.
-    @param board:      A list of lists representing the board state.
+    @param board:      A Board, or a list of lists representing the board state.
     @param player:     Player (e.g. constants.WHITE_PLAYER).
     @return:           True if king is in check, False otherwise.
     """
-    acceptable = [0, 1, 2, 3, 4, 5, 6, 7]
+    board = _asBoard(board)
+    attackers, kingSq = _sliderChecks(location, board, player, constants.BISHOP)
 
-    if player == constants.WHITE_PLAYER:
-        #Testing for check from NE diagonal
-        space = 1
-        while location[0] + space in acceptable and location[1] + space in acceptable:
-            if board[location[0] + space][location[1] + space] == constants.EMPTY_SYMBOL:
-                space += 1
-                continue
-            if board[location[0] + space][location[1] + space] == constants.BLACK_BISHOP_SYMBOL or \
-               board[location[0] + space][location[1] + space] == constants.BLACK_QUEEN_SYMBOL:
-               return True
-            else:
-               break
-                
-        #Testing for check from NW diagonal
-        space = 1
-        while location[0] - space in acceptable and location[1] + space in acceptable:
-            if board[location[0] - space][location[1] + space] == constants.EMPTY_SYMBOL:
-                space += 1
-                continue
-            if board[location[0] - space][location[1] + space] == constants.BLACK_BISHOP_SYMBOL or \
-               board[location[0] - space][location[1] + space] == constants.BLACK_QUEEN_SYMBOL:
-               return True
-            else:
-               break
-        
-        #Testing for check from SE diagonal        
-        space = 1
-        while location[0] + space in acceptable and location[1] - space in acceptable:
-            if board[location[0] + space][location[1] - space] == constants.EMPTY_SYMBOL:
-                space += 1
-                continue
-            if board[location[0] + space][location[1] - space] == constants.BLACK_BISHOP_SYMBOL or \
-               board[location[0] + space][location[1] - space] == constants.BLACK_QUEEN_SYMBOL:
-               return True
-            else:
-               break
-         
-        #Testing for check from SW diagonal        
-        space = 1
-        while location[0] - space in acceptable and location[1] - space in acceptable:
-            if board[location[0] - space][location[1] - space] == constants.EMPTY_SYMBOL:
-                space += 1
-                continue
-            if board[location[0] - space][location[1] - space] == constants.BLACK_BISHOP_SYMBOL or \
-               board[location[0] - space][location[1] - space] == constants.BLACK_QUEEN_SYMBOL:
-               return True
-            else:
-               break
-         
-        return False
-         
-    else:
-        #Testing for check from NE diagonal
-        space = 1
-        while location[0] + space in acceptable and location[1] + space in acceptable:
-            if board[location[0] + space][location[1] + space] == constants.EMPTY_SYMBOL:
-                space += 1
-                continue
-            if board[location[0] + space][location[1] + space] == constants.BISHOP_SYMBOL or \
-               board[location[0] + space][location[1] + space] == constants.QUEEN_SYMBOL:
-               return True
-            else:
-               break
-                
-        #Testing for check from NW diagonal
-        space = 1
-        while location[0] - space in acceptable and location[1] + space in acceptable:
-            if board[location[0] - space][location[1] + space] == constants.EMPTY_SYMBOL:
-                space += 1
-                continue
-            if board[location[0] - space][location[1] + space] == constants.BISHOP_SYMBOL or \
-               board[location[0] - space][location[1] + space] == constants.QUEEN_SYMBOL:
-               return True
-            else:
-               break
-        
-        #Testing for check from SE diagonal        
-        space = 1
-        while location[0] + space in acceptable and location[1] - space in acceptable:
-            if board[location[0] + space][location[1] - space] == constants.EMPTY_SYMBOL:
-                space += 1
-                continue
-            if board[location[0] + space][location[1] - space] == constants.BISHOP_SYMBOL or \
-               board[location[0] + space][location[1] - space] == constants.QUEEN_SYMBOL:
-               return True
-            else:
-               break
-         
-        #Testing for check from SW diagonal        
-        space = 1
-        while location[0] - space in acceptable and location[1] - space in acceptable:
-            if board[location[0] - space][location[1] - space] == constants.EMPTY_SYMBOL:
-                space += 1
-                continue
-            if board[location[0] - space][location[1] - space] == constants.BISHOP_SYMBOL or \
-               board[location[0] - space][location[1] - space] == constants.QUEEN_SYMBOL:
-               return True
-            else:
-               break
-         
-        return False
+    return bool(magic.bishopAttacks(kingSq, board.getOccupancy()) & attackers)
 
 def isCheckByHorizontal(location, board, player):
     """
     Helper method to determine if king under attack by rook or queen horizontally.
 
     @param location:   Location of current player's king.
-    @param board:      A list of lists representing the board state.
+    @param board:      A Board, or a list of lists representing the board state.
     @param player:     Player (e.g. constants.WHITE_PLAYER).
     @return:           True if king is in check, False otherwise.
     """
-    if player == constants.WHITE_PLAYER:
-        #Checks for rooks and queens in the same row as king
-        for space in range(len(board)):
-            if board[space][location[1]] == constants.BLACK_ROOK_SYMBOL or \
-            board[space][location[1]] == constants.BLACK_QUEEN_SYMBOL:
-                #Checks for blocking pieces if piece comes before the king horizontally
-                if space < location[0]:
-                    blocking = 0
-                    for new_space in range(space + 1, location[0]):
-                        if board[new_space][location[1]] != constants.EMPTY_SYMBOL:
-                            blocking += 1
-                    if blocking == 0:
-                        return True
-                #Checks for blocking pieces if piece comes after the king horizontally
-                else:
-                    blocking = 0
-                    for new_space in range(location[0] + 1, space):
-                        if board[new_space][location[1]] != constants.EMPTY_SYMBOL:
-                            blocking += 1
-                    if blocking == 0:
-                        return True
-
-        return False
-                    
-    else:
-        #Checks for rooks and queens in the same row as king
-        for space in range(len(board)):
-            if board[space][location[1]] == constants.ROOK_SYMBOL or \
-            board[space][location[1]] == constants.QUEEN_SYMBOL:
-                #Checks for blocking pieces if piece comes before the king horizontally
-                if space < location[0]:
-                    blocking = 0
-                    for new_space in range(space + 1, location[0]):
-                        if board[new_space][location[1]] != constants.EMPTY_SYMBOL:
-                            blocking += 1
-                    if blocking == 0:
-                        return True
-                #Checks for blocking pieces if piece comes after the king horizontally
-                else:
-                    blocking = 0
-                    for new_space in range(location[0] + 1, space):
-                        if board[new_space][location[1]] != constants.EMPTY_SYMBOL:
-                            blocking += 1
-                    if blocking == 0:
-                        return True
+    board = _asBoard(board)
+    attackers, kingSq = _sliderChecks(location, board, player, constants.ROOK)
+    attackers &= bitboard.RANKS[location[1]]
 
-        return False
+    return bool(magic.rookAttacks(kingSq, board.getOccupancy()) & attackers)
                     
 def isCheckByVertical(location, board, player):
     """
     Helper method to determine if king under attack by rook or queen vertically.
 
     @param location:   Location of current player's king.
-    @param board:      A list of lists representing the board state.
+    @param board:      A Board, or a list of lists representing the board state.
     @param player:     Player (e.g. constants.WHITE_PLAYER).
     @return:           True if king is in check, False otherwise.
     """
-    if player == constants.WHITE_PLAYER:
-        #Checks for rooks and queens in same column as king
-        for space in range(len(board)):
-            if board[location[0]][space] == constants.BLACK_ROOK_SYMBOL or \
-            board[location[0]][space] == constants.BLACK_QUEEN_SYMBOL:
-                #Checks for blocking pieces if piece comes before the king vertically
-                if space < location[1]:
-                    blocking = 0
-                    for new_space in range(space + 1, location[1]):
-                        if board[location[0]][new_space] != constants.EMPTY_SYMBOL:
-                            blocking += 1
-                    if blocking == 0:
-                        return True
-                #Checks for blocking pieces if piece comes after the king horizontally
-                else:
-                    blocking = 0
-                    for new_space in range(location[1] + 1, space):
-                        if board[location[0]][new_space] != constants.EMPTY_SYMBOL:
-                            blocking += 1
-                    if blocking == 0:
-                        return True
-                    
-        return False
-                    
-    else:
-        #Checks for rooks and queens in same column as king
-        for space in range(len(board)):
-            if board[location[0]][space] == constants.ROOK_SYMBOL or \
-            board[location[0]][space] == constants.QUEEN_SYMBOL:
-                #Checks for blocking pieces if piece comes before the king vertically
-                if space < location[1]:
-                    blocking = 0
-                    for new_space in range(space + 1, location[1]):
-                        if board[location[0]][new_space] != constants.EMPTY_SYMBOL:
-                            blocking += 1
-                    if blocking == 0:
-                        return True
-                #Checks for blocking pieces if piece comes after the king vertically
-                else:
-                    blocking = 0
-                    for new_space in range(location[1] + 1, space):
-                        if board[location[0]][new_space] != constants.EMPTY_SYMBOL:
-                            blocking += 1
-                    if blocking == 0:
-                        return True
+    board = _asBoard(board)
+    attackers, kingSq = _sliderChecks(location, board, player, constants.ROOK)
+    attackers &= bitboard.FILES[location[0]]
 
-        return False
+    return bool(magic.rookAttacks(kingSq, board.getOccupancy()) & attackers)
                     
 def isCheckByKing(location, board, player):
     """
-    Helper method to determine if king under attack by knight.
+    Helper method to determine if king under attack by the other king.
 
     @param location:   Location of current player's king.
-    @param board:      A list of lists representing the board state.
+    @param board:      A Board, or a list of lists representing the board state.
     @param player:     Player (e.g. constants.WHITE_PLAYER).
     @return:           True if king is in check, False otherwise.
     """
-    if player == constants.WHITE_PLAYER:
-        #Checks if white king is in check by black king
-        if 1 <= location[0]:
-            if board[location[0] - 1][location[1]] == constants.BLACK_KING_SYMBOL:
-                return True
-        if location[0] <= 6:
-            if board[location[0] + 1][location[1]] == constants.BLACK_KING_SYMBOL:
-                return True
-        if 1 <= location[1]:
-            if board[location[0]][location[1] - 1] == constants.BLACK_KING_SYMBOL:
-                return True
-        if location[1] <= 6:
-            if board[location[0]][location[1] + 1] == constants.BLACK_KING_SYMBOL:
-                return True
-        if 1 <= location[0] and 1 <= location[1]:
-            if board[location[0] - 1][location[1] - 1] == constants.BLACK_KING_SYMBOL:
-                return True
-        if location[0] <= 6 and 1 <= location[1]:
-            if board[location[0] + 1][location[1] - 1] == constants.BLACK_KING_SYMBOL:
-                return True
-        if location[0] <= 1 and location[1] <= 6:
-            if board[location[0] - 1][location[1] + 1] == constants.BLACK_KING_SYMBOL:
-                return True
-        if location[0] <= 6 and location[1] <= 6:
-            if board[location[0] + 1][location[1] + 1] == constants.BLACK_KING_SYMBOL:
-                return True
-            
-        return False
+    board = _asBoard(board)
+    kingSq = bitboard.square(location[0], location[1])
+    attackers = board.getBitboard(_piece(_opponent(player), constants.KING))
 
-    else:
-        #Checks if black king is in check by white king
-        if 1 <= location[0]:
-            if board[location[0] - 1][location[1]] == constants.KING_SYMBOL:
-                return True
-        if location[0] <= 6:
-            if board[location[0] + 1][location[1]] == constants.KING_SYMBOL:
-                return True
-        if 1 <= location[1]:
-            if board[location[0]][location[1] - 1] == constants.KING_SYMBOL:
-                return True
-        if location[1] <= 6:
-            if board[location[0]][location[1] + 1] == constants.KING_SYMBOL:
-                return True
-        if 1 <= location[0] and 1 <= location[1]:
-            if board[location[0] - 1][location[1] - 1] == constants.KING_SYMBOL:
-                return True
-        if location[0] <= 6 and 1 <= location[1]:
-            if board[location[0] + 1][location[1] - 1] == constants.KING_SYMBOL:
-                return True
-        if location[0] <= 1 and location[1] <= 6:
-            if board[location[0] - 1][location[1] + 1] == constants.KING_SYMBOL:
-                return True
-        if location[0] <= 6 and location[1] <= 6:
-            if board[location[0] + 1][location[1] + 1] == constants.KING_SYMBOL:
-                return True
-            
-        return False
+    return bool(bitboard.KING_ATTACKS[kingSq] & attackers)
 
 def isCheckByPawn(location, board, player):
     """
     Helper method to determine if king under attack by pawn.
 
     @param location:   Location of current player's king.
-    @param board:      A list of lists representing the board state.
+    @param board:      A Board, or a list of lists representing the board state.
     @param player:     Player (e.g. constants.WHITE_PLAYER).
     @return:           True if king is in check, False otherwise.
     """
-    if player == constants.WHITE_PLAYER:
-        #Checks if white king is under attack by black pawn
-        if 1 <= location[0] and location[1] <= 6:
-            if board[location[0] - 1][location[1] + 1] == constants.BLACK_PAWN_SYMBOL:
-                return True
-        if location[0] <= 6 and location[1] <= 6:
-            if board[location[0] + 1][location[1] + 1] == constants.BLACK_PAWN_SYMBOL:
-                return True
+    board = _asBoard(board)
+    kingSq = bitboard.square(location[0], location[1])
+    attackers = board.getBitboard(_piece(_opponent(player), constants.PAWN))
 
-        return False
-
-    else:
-        #Checks if black king under attack by white pawn
-        if 1 <= location[0] and 1 <= location[1]:
-            if board[location[0] - 1][location[1] - 1] == constants.PAWN_SYMBOL:
-                return True
-        if location[0] <= 6 and 1 <= location[1]:
-            if board[location[0] + 1][location[1] - 1] == constants.PAWN_SYMBOL:
-                return True
-
-        return False
+    #A pawn checks the king from the squares the king's own pawn would attack
+    return bool(bitboard.PAWN_ATTACKS[player][kingSq] & attackers)
 
 def isCheckByKnight(location, board, player):
     """
     Helper method to determine if king under attack by knight.
 
     @param location:   Location of current player's king.
-    @param board:      A list of lists representing the board state.
+    @param board:      A Board, or a list of lists representing the board state.
     @param player:     Player (e.g. constants.WHITE_PLAYER).
     @return:           True if king is in check, False otherwise.
     """
-    if player == constants.WHITE_PLAYER:
-        #Checks locations where black knight would put white king in check
-        if 2 <= location[0] and 2 <= location[1]:
-            if board[location[0] - 2][location[1] - 1] == constants.BLACK_KNIGHT_SYMBOL or \
-               board[location[0] - 1][location[1] - 2] == constants.BLACK_KNIGHT_SYMBOL:
-                return True
-            
-        if location[0] <= 5 and location[1] <= 5:
-            if board[location[0] + 1][location[1] + 2] == constants.BLACK_KNIGHT_SYMBOL or \
-               board[location[0] + 2][location[1] + 1] == constants.BLACK_KNIGHT_SYMBOL:
-                return True
-        
-        if 2 <= location[0] and location[1] <= 5:
-            if board[location[0] - 2][location[1] + 1] == constants.BLACK_KNIGHT_SYMBOL or \
-            board[location[0] - 1][location[1] + 2] == constants.BLACK_KNIGHT_SYMBOL:
-                return True
-
-        if location[0] <= 5 and 2 <= location[1]:
-            if board[location[0] + 2][location[1] - 1] == constants.BLACK_KNIGHT_SYMBOL or \
-            board[location[0] + 1][location[1] - 2] == constants.BLACK_KNIGHT_SYMBOL:
-                return True
-
-        return False
-        
-    else:
-        #Checks locations where white knight would put black king in check
-        if 2 <= location[0] and 2 <= location[1]:
-            if board[location[0] - 2][location[1] - 1] == constants.KNIGHT_SYMBOL or \
-               board[location[0] - 1][location[1] - 2] == constants.KNIGHT_SYMBOL:
-                return True
-            
-        if location[0] <= 5 and location[1] <= 5:
-            if board[location[0] + 1][location[1] + 2] == constants.KNIGHT_SYMBOL or \
-               board[location[0] + 2][location[1] + 1] == constants.KNIGHT_SYMBOL:
-                return True
-        
-        if 2 <= location[0] and location[1] <= 5:
-            if board[location[0] - 2][location[1] + 1] == constants.KNIGHT_SYMBOL or \
-            board[location[0] - 1][location[1] + 2] == constants.KNIGHT_SYMBOL:
-                return True
-
-        if location[0] <= 5 and 2 <= location[1]:
-            if board[location[0] + 2][location[1] - 1] == constants.KNIGHT_SYMBOL or \
-            board[location[0] + 1][location[1] - 2] == constants.KNIGHT_SYMBOL:
-                return True
+    board = _asBoard(board)
+    kingSq = bitboard.square(location[0], location[1])
+    attackers = board.getBitboard(_piece(_opponent(player), constants.KNIGHT))
 
-        return False
+    return bool(bitboard.KNIGHT_ATTACKS[kingSq] & attackers)
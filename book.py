@@ -0,0 +1,258 @@
+#!/usr/bin/python
+
+"""
+Opening book.
+
+A book is a file of fixed-size entries, each giving a position's
+Zobrist key (see zobrist.py), a move played from it (see moves.py) and
+the number of games it was played in. Entries are sorted by key, so a
+position's moves are found by a binary search over the memory-mapped
+file without reading it all in. Opening moves then take microseconds
+instead of a search.
+
+Books are built from the first moves of games in PGN archives (see
+pgn.py) and move logs (see movelog.py), both read as streams:
+
+ $ ./book.py build openings.book games.pgn --log games.log
+ $ ./book.py probe openings.book "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w - - 0 1"
+
+To have the computer play from the book:
+
+ $ ./main.py --black computer --book openings.book
+"""
+import argparse
+import mmap
+import os
+import random
+import struct
+import sys
+import tempfile
+
+import constants
+import fen
+import movelog
+import moves
+import pgn
+
+#Start of every book; the last byte is the format version
+_HEADER = b"CHESSBK\x01"
+
+#Position key, packed move, number of games
+_ENTRY = struct.Struct("<QHH")
+ENTRY_SIZE = _ENTRY.size
+
+#Largest number of games stored for a move
+_MAX_WEIGHT = 0xFFFF
+
+_OPPONENT = {constants.WHITE_PLAYER: constants.BLACK_PLAYER,
+             constants.BLACK_PLAYER: constants.WHITE_PLAYER}
+
+class OpeningBook(object):
+    def __init__(self, path, seed=None):
+        """
+        Opens a book written by buildBook().
+
+        @param path:    Book file name.
+        @param seed:    Optional seed for choosing between book moves.
+        @raise ValueError:  If the file is not a book.
+        """
+        self._file = open(path, "rb")
+        try:
+            self._mapped = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            #Empty files cannot be mapped
+            self._file.close()
+            raise ValueError("%s is not an opening book" % path)
+        if self._mapped[:len(_HEADER)] != _HEADER or \
+           (len(self._mapped) - len(_HEADER)) % ENTRY_SIZE:
+            self.close()
+            raise ValueError("%s is not an opening book" % path)
+
+        self._count = (len(self._mapped) - len(_HEADER)) // ENTRY_SIZE
+        self._random = random.Random(seed)
+
+    def __len__(self):
+        """
+        Returns the number of entries in the book.
+        """
+        return self._count
+
+    def _entry(self, index):
+        return _ENTRY.unpack_from(self._mapped, len(_HEADER) + index * ENTRY_SIZE)
+
+    def lookup(self, key):
+        """
+        Finds the moves stored for a position.
+
+        @param key:     Zobrist key of the position (see Board.getKey()).
+        @return:        List of (packed move, number of games), most
+                        played first.
+        """
+        #Find the first entry with the key
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._entry(middle)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        found = []
+        while low < self._count:
+            entryKey, move, weight = self._entry(low)
+            if entryKey != key:
+                break
+            found.append((move, weight))
+            low += 1
+        return found
+
+    def getMoves(self, board, player):
+        """
+        Returns the book moves that are legal in a position. Moves stored
+        under a different position with the same key are left out.
+
+        @param board:   The game board (a Board instance).
+        @param player:  Player to move (e.g. constants.WHITE_PLAYER).
+        @return:        List of (packed move, number of games), most
+                        played first.
+        """
+        return [(move, weight) for move, weight in self.lookup(board.getKey(player))
+                if board.isLegalMove(player, moves.toList(move))]
+
+    def chooseMove(self, board, player):
+        """
+        Picks a book move, choosing moves in proportion to how often
+        they were played.
+
+        @param board:   The game board (a Board instance).
+        @param player:  Player to move (e.g. constants.WHITE_PLAYER).
+        @return:        Packed move, or None if the position is not in
+                        the book.
+        """
+        move = self._pick(self.lookup(board.getKey(player)))
+        if move is not None and not board.isLegalMove(player, moves.toList(move)):
+            #Another position has the same key, so pick from the legal moves
+            move = self._pick(self.getMoves(board, player))
+        return move
+
+    def _pick(self, found):
+        if not found:
+            return None
+        pick = self._random.randrange(sum(weight for move, weight in found))
+        for move, weight in found:
+            pick -= weight
+            if pick < 0:
+                return move
+
+    def close(self):
+        """
+        Unmaps and closes the book file.
+        """
+        if self._mapped is not None:
+            self._mapped.close()
+            self._file.close()
+            self._mapped = None
+
+def _addGame(counts, startFen, gameMoves, plies):
+    """
+    Counts the moves played in the first plies of one game.
+    """
+    board, player = fen.boardFromFen(startFen)
+    for move in gameMoves[:plies]:
+        key = (board.getKey(player), move)
+        counts[key] = counts.get(key, 0) + 1
+        board.movePiece(player, move)
+        player = _OPPONENT[player]
+
+def _logGames(path, plies):
+    """
+    Collects the first plies of each game in a move log. Games in a log
+    always start from the starting position.
+
+    @return:    Dictionary from game number to array('H') of packed moves.
+    """
+    games = {}
+    for gameId, ply, move, timestamp in movelog.readLog(path):
+        gameMoves = games.setdefault(gameId, moves.moveList())
+        #Moves after a gap in the game's record are of no use
+        if ply == len(gameMoves) and ply < plies:
+            gameMoves.append(move)
+    return games
+
+def buildBook(path, archives=(), logs=(), plies=16, minGames=1, workers=1):
+    """
+    Builds a book from the opening moves of recorded games.
+
+    @param path:        Book file name. Any existing book is replaced in
+                        one step, so books open elsewhere stay valid.
+    @param archives:    PGN file names (see pgn.py).
+    @param logs:        Move log file names (see movelog.py).
+    @param plies:       Number of moves from the start of each game used.
+    @param minGames:    Fewest games a move must be played in to be kept.
+    @param workers:     Number of processes to replay PGN games with.
+    @return:            Number of entries written.
+    """
+    counts = {}
+    for archive in archives:
+        for game in pgn.importGames(archive, workers):
+            _addGame(counts, game.fen, game.moves, plies)
+    for log in logs:
+        for gameMoves in _logGames(log, plies).values():
+            _addGame(counts, fen.STARTING_FEN, gameMoves, plies)
+
+    entries = sorted((key, -count, move) for (key, move), count in counts.items()
+                     if count >= minGames)
+    data = bytearray(_HEADER)
+    for key, count, move in entries:
+        data += _ENTRY.pack(key, move, min(-count, _MAX_WEIGHT))
+
+    #Write a temporary file beside the book, then move it into place
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temporary = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as output:
+            output.write(data)
+        os.rename(temporary, path)
+    except:
+        os.remove(temporary)
+        raise
+    return len(entries)
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Build or look up an opening book.")
+    commands = parser.add_subparsers(dest="command")
+
+    build = commands.add_parser("build", help="build a book from recorded games")
+    build.add_argument("book", help="book file name")
+    build.add_argument("archives", nargs="*", help="PGN files")
+    build.add_argument("--log", action="append", default=[],
+                       help="move log to read games from (may be repeated)")
+    build.add_argument("--plies", type=int, default=16,
+                       help="moves from the start of each game to use (default 16)")
+    build.add_argument("--min-games", type=int, default=1,
+                       help="fewest games a move must be played in (default 1)")
+    build.add_argument("--workers", type=int, default=1,
+                       help="processes to replay PGN games with (default 1)")
+
+    probe = commands.add_parser("probe", help="list the book moves for a position")
+    probe.add_argument("book", help="book file name")
+    probe.add_argument("fen", nargs="?", default=fen.STARTING_FEN,
+                       help="position (default the starting position)")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        count = buildBook(args.book, args.archives, args.log, args.plies,
+                          args.min_games, args.workers)
+        print("%d entries" % count)
+    else:
+        book = OpeningBook(args.book)
+        try:
+            board, player = fen.boardFromFen(args.fen)
+            for move, weight in book.getMoves(board, player):
+                print("%s %d" % (moves.toText(move), weight))
+        finally:
+            book.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,268 @@
+#!/usr/bin/python
+
+"""
+Chess clocks.
+
+Each player has a store of time that runs down while it is their turn.
+A time control says how much each player starts with and how it is
+topped up:
+
+ 5+3        5 minutes each, plus 3 seconds after every move.
+ 40/90      90 minutes for every 40 moves (moves-in-N).
+ 40/90+30   90 minutes for every 40 moves, plus 30 seconds a move.
+
+A player whose time runs out before they move loses on time. Clocks are
+read from a monotonic timer, so changes to the system time while a game
+is being played do not add or take away anyone's time. Computer players
+plan how long to think from the time left (see Clock.budget()):
+
+ $ ./main.py --black computer --time 5+3
+"""
+import ctypes
+import re
+import sys
+import time
+
+import constants
+
+#Seconds kept back from every move for playing it and showing the board
+_OVERHEAD = 0.05
+
+#Moves the time left is assumed to have to last when the time control
+#does not say
+_MOVES_TO_GO = 30
+
+#A search may run over its planned time by up to this factor
+_HARD_FACTOR = 4
+
+_TIME_CONTROL = re.compile(r"^(?:(\d+)/)?(\d+(?:\.\d*)?)(?:\+(\d+(?:\.\d*)?))?$")
+
+#Clock id of the monotonic clock on Linux (see clock_gettime(2))
+_CLOCK_MONOTONIC = 1
+
+class _Timespec(ctypes.Structure):
+    _fields_ = [("seconds", ctypes.c_long), ("nanoseconds", ctypes.c_long)]
+
+def _findMonotonic():
+    """
+    Returns a function giving the seconds elapsed on a monotonic timer,
+    or time.time() if the system does not have one.
+    """
+    if hasattr(time, "monotonic"):
+        return time.monotonic
+    if not sys.platform.startswith("linux"):
+        return time.time
+
+    #Older C libraries keep clock_gettime() in librt
+    for name in (None, "librt.so.1"):
+        try:
+            clockGetTime = ctypes.CDLL(name, use_errno=True).clock_gettime
+        except (OSError, AttributeError):
+            continue
+        clockGetTime.argtypes = [ctypes.c_int, ctypes.POINTER(_Timespec)]
+        clockGetTime.restype = ctypes.c_int
+        timespec = _Timespec()
+        if clockGetTime(_CLOCK_MONOTONIC, ctypes.byref(timespec)) != 0:
+            continue
+
+        def monotonic():
+            clockGetTime(_CLOCK_MONOTONIC, ctypes.byref(timespec))
+            return timespec.seconds + timespec.nanoseconds * 1e-9
+        return monotonic
+    return time.time
+
+#Seconds elapsed on a monotonic timer, counted from an arbitrary point
+monotonic = _findMonotonic()
+
+class TimeControl(object):
+    """
+    How much time each player has.
+
+    base:       Seconds each player starts with.
+    increment:  Seconds added after each of a player's moves.
+    moves:      If given, base is added again after every this many of a
+                player's moves. Otherwise the base time is all there is.
+    """
+    __slots__ = ("base", "increment", "moves")
+
+    def __init__(self, base, increment=0.0, moves=None):
+        self.base = base
+        self.increment = increment
+        self.moves = moves
+
+def parseTimeControl(text):
+    """
+    Reads a time control such as "5+3" or "40/90" (see above).
+
+    @param text:    Time control, with the base time in minutes and the
+                    increment in seconds.
+    @return:        A TimeControl.
+    @raise ValueError:  If text is not a time control.
+    """
+    match = _TIME_CONTROL.match(text.strip())
+    if match is None:
+        raise ValueError("invalid time control %r" % (text,))
+    moves, minutes, increment = match.groups()
+    base = float(minutes) * 60
+    if base <= 0 or (moves is not None and int(moves) == 0):
+        raise ValueError("invalid time control %r" % (text,))
+    if moves is not None:
+        moves = int(moves)
+    return TimeControl(base, float(increment or 0), moves)
+
+def formatTime(seconds):
+    """
+    Formats a time left for display (e.g. "4:07", or "0:09.3" under ten
+    seconds).
+    """
+    if seconds < 10:
+        return "0:%04.1f" % max(seconds, 0.0)
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return "%d:%02d:%02d" % (seconds // 3600, seconds // 60 % 60, seconds % 60)
+    return "%d:%02d" % (seconds // 60, seconds % 60)
+
+class Clock(object):
+    def __init__(self, control, timer=None):
+        """
+        Sets both players' time. Neither clock runs until start().
+
+        @param control: The TimeControl played under.
+        @param timer:   Function returning the time in seconds, or None
+                        to use monotonic().
+        """
+        if timer is None:
+            timer = monotonic
+
+        self._control = control
+        self._timer = timer
+        self._remaining = {constants.WHITE_PLAYER: control.base,
+                           constants.BLACK_PLAYER: control.base}
+        self._moves = {constants.WHITE_PLAYER: 0, constants.BLACK_PLAYER: 0}
+
+        #Player whose time is running down, and when it started
+        self._running = None
+        self._started = 0.0
+        self._flagged = None
+
+    def getControl(self):
+        """
+        Returns the TimeControl played under.
+        """
+        return self._control
+
+    def getRunning(self):
+        """
+        Returns the player whose time is running down, or None.
+        """
+        return self._running
+
+    def getFlagged(self):
+        """
+        Returns the player who ran out of time, or None.
+        """
+        return self._flagged
+
+    def getMoves(self, player):
+        """
+        Returns the number of moves a player has made on the clock.
+        """
+        return self._moves[player]
+
+    def setTime(self, player, remaining, moves=0):
+        """
+        Sets a player's time left, e.g. when carrying on a saved game.
+
+        @param player:      Player (e.g. constants.WHITE_PLAYER).
+        @param remaining:   Seconds left.
+        @param moves:       Moves the player has made on the clock (only
+                            the count within the current period matters).
+        @raise ValueError:  If the player's clock is running.
+        """
+        if player == self._running:
+            raise ValueError("the player's clock is running")
+        self._remaining[player] = remaining
+        self._moves[player] = moves
+
+    def start(self, player):
+        """
+        Starts a player's time running down.
+
+        @param player:  Player to move (e.g. constants.WHITE_PLAYER).
+        @raise ValueError:  If a clock is already running.
+        """
+        if self._running is not None:
+            raise ValueError("a clock is already running")
+        self._running = player
+        self._started = self._timer()
+
+    def stop(self):
+        """
+        Stops the running clock once its player has moved, adding any
+        time the control gives for the move.
+
+        @return:    True, or False if the player had run out of time
+                    (see getFlagged()).
+        @raise ValueError:  If no clock is running.
+        """
+        player = self._running
+        if player is None:
+            raise ValueError("no clock is running")
+        self._running = None
+
+        left = self._remaining[player] - (self._timer() - self._started)
+        if left <= 0:
+            self._remaining[player] = 0.0
+            self._flagged = player
+            return False
+
+        control = self._control
+        self._moves[player] += 1
+        left += control.increment
+        if control.moves is not None and self._moves[player] % control.moves == 0:
+            left += control.base
+        self._remaining[player] = left
+        return True
+
+    def remaining(self, player):
+        """
+        Returns a player's time left, in seconds.
+        """
+        left = self._remaining[player]
+        if player == self._running:
+            left = max(left - (self._timer() - self._started), 0.0)
+        return left
+
+    def movesToGo(self, player):
+        """
+        Returns the number of moves a player has to make before more
+        base time is added, or None if no more will be.
+        """
+        if self._control.moves is None:
+            return None
+        return self._control.moves - self._moves[player] % self._control.moves
+
+    def budget(self, player):
+        """
+        Plans how long a player should think about their next move.
+
+        The time left is shared out over the moves it has to last, and
+        the increment is spent as it comes. A search should not start a
+        new iteration past the soft limit, and must stop at the hard one.
+
+        @param player:  Player to move (e.g. constants.WHITE_PLAYER).
+        @return:        Tuple (soft limit, hard limit), in seconds from now.
+        """
+        usable = max(self.remaining(player) - _OVERHEAD, 0.0)
+        movesToGo = self.movesToGo(player)
+        if movesToGo is None:
+            movesToGo = _MOVES_TO_GO
+
+        soft = usable / movesToGo + self._control.increment
+        #Keep time for the moves after this one unless this is the last
+        #before the time is topped up
+        if movesToGo > 1:
+            hard = min(soft * _HARD_FACTOR, usable / 2)
+        else:
+            hard = usable
+        return min(soft, hard), hard
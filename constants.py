@@ -23,8 +23,41 @@ BLACK_BISHOP_SYMBOL = '*b'
 BLACK_QUEEN_SYMBOL  = '*q'
 BLACK_KING_SYMBOL   = '*k'
 
+#Symbols of each player's pieces
+WHITE_SYMBOLS = [PAWN_SYMBOL, ROOK_SYMBOL, KNIGHT_SYMBOL,
+                 BISHOP_SYMBOL, QUEEN_SYMBOL, KING_SYMBOL]
+BLACK_SYMBOLS = [BLACK_PAWN_SYMBOL, BLACK_ROOK_SYMBOL, BLACK_KNIGHT_SYMBOL,
+                 BLACK_BISHOP_SYMBOL, BLACK_QUEEN_SYMBOL, BLACK_KING_SYMBOL]
+
 #Label for Black Player
 BLACK_PLAYER_SYMBOL = '*'
 
 #Empty space
-EMPTY_SYMBOL  = ''
\ No newline at end of file
+EMPTY_SYMBOL  = ''
+
+#Piece codes. The low three bits give the piece type and bit 3 is set
+#for black's pieces, so the type is (piece & PIECE_TYPE_MASK) and the
+#owner is (piece & BLACK_PIECE).
+EMPTY  = 0
+PAWN   = 1
+ROOK   = 2
+KNIGHT = 3
+BISHOP = 4
+QUEEN  = 5
+KING   = 6
+
+PIECE_TYPE_MASK = 7
+BLACK_PIECE     = 8
+
+#Codes of each player's pieces, in the same order as the symbols
+WHITE_PIECES = [PAWN, ROOK, KNIGHT, BISHOP, QUEEN, KING]
+BLACK_PIECES = [BLACK_PIECE | piece for piece in WHITE_PIECES]
+
+#Conversion between piece codes and symbols. PIECE_SYMBOLS is indexed by
+#code; codes that are not pieces map to the empty symbol.
+PIECE_SYMBOLS = [EMPTY_SYMBOL] * 16
+SYMBOL_PIECES = {EMPTY_SYMBOL: EMPTY}
+for _piece, _symbol in zip(WHITE_PIECES + BLACK_PIECES, WHITE_SYMBOLS + BLACK_SYMBOLS):
+    PIECE_SYMBOLS[_piece] = _symbol
+    SYMBOL_PIECES[_symbol] = _piece
+del _piece, _symbol
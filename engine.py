@@ -0,0 +1,390 @@
+#!/usr/bin/python
+
+"""
+Computer opponent.
+
+The engine searches with negamax and alpha-beta pruning, deepening one ply
+at a time until its depth or time budget runs out. Results are kept in a
+transposition table, so each iteration starts by trying the best moves
+found by the one before it. Leaves are extended with a capture-only
+search so that positions are not scored in the middle of an exchange.
+
+When playing on a clock (see clock.py), the engine plans each move's time
+from the time left. It starts no new iteration once the planned time has
+passed, and stops sooner when the best move has not changed for several
+iterations.
+
+A game against the computer can be started with:
+
+ $ ./main.py --black computer --movetime 5
+ $ ./main.py --black computer --time 5+3
+"""
+import random
+
+import constants
+import board_analyzer
+from clock import monotonic
+import evaluation
+import moves
+import transposition
+
+#Score of a checkmate at the root. Mates further away score closer to zero.
+MATE_SCORE = 100000
+
+#Larger than any score
+INFINITY = 1000000
+
+#Scores beyond this are mates
+_MATE_BOUND = MATE_SCORE - 1000
+
+#Number of nodes searched between checks of the clock
+_CLOCK_INTERVAL = 128
+
+#Iterations the best move must survive unchanged to stop early, and the
+#share of the planned time used when it does
+_STABLE_ITERATIONS = 3
+_STABLE_FRACTION = 0.4
+
+_OPPONENT = {constants.WHITE_PLAYER: constants.BLACK_PLAYER,
+             constants.BLACK_PLAYER: constants.WHITE_PLAYER}
+
+class _OutOfTime(Exception):
+    """
+    Raised inside the search when the time budget has run out.
+    """
+    pass
+
+def _toTable(score, ply):
+    """
+    Converts a mate score to be relative to the stored position.
+    """
+    if score > _MATE_BOUND:
+        return score + ply
+    if score < -_MATE_BOUND:
+        return score - ply
+    return score
+
+def _fromTable(score, ply):
+    """
+    Converts a stored mate score back to be relative to the root.
+    """
+    if score > _MATE_BOUND:
+        return score - ply
+    if score < -_MATE_BOUND:
+        return score + ply
+    return score
+
+class Engine(object):
+    def __init__(self, maxDepth=64, timeLimit=None, table=None,
+                 startDepth=1, seed=None, stop=None, book=None, tablebases=None):
+        """
+        Creates an engine.
+
+        @param maxDepth:    Deepest search, in plies.
+        @param timeLimit:   Seconds to spend on each move, or None to
+                            always search to maxDepth.
+        @param table:       TranspositionTable to use. A new one is
+                            created if none is given.
+        @param startDepth:  Depth of the first iteration.
+        @param seed:        If given, root moves that are ordered equally
+                            are tried in a random order drawn from this
+                            seed (see parallel_engine.py).
+        @param stop:        Optional shared flag (anything with a .value,
+                            e.g. a multiprocessing.Value). The search is
+                            abandoned as soon as it becomes true.
+        @param book:        Optional OpeningBook (see book.py). Book
+                            moves are played without searching.
+        @param tablebases:  Optional Tablebases (see tablebase.py). Positions
+                            they hold are played from them without searching.
+        """
+        if table is None:
+            table = transposition.TranspositionTable()
+
+        self._maxDepth = maxDepth
+        self._timeLimit = timeLimit
+        self._table = table
+        self._startDepth = startDepth
+        self._random = None
+        if seed is not None:
+            self._random = random.Random(seed)
+        self._stop = stop
+        self._book = book
+        self._tablebases = tablebases
+        self._deadline = None
+        self._nodes = 0
+        self._completedDepth = 0
+
+    def getNodes(self):
+        """
+        Returns the number of positions visited by the last search.
+        """
+        return self._nodes
+
+    def getDepth(self):
+        """
+        Returns the depth reached by the last search.
+        """
+        return self._completedDepth
+
+    def chooseMove(self, board, player, clock=None):
+        """
+        Picks a move for a player.
+
+        @param board:   The game board (a Board instance). It is left unchanged.
+        @param player:  Player to move (e.g. constants.WHITE_PLAYER).
+        @param clock:   Optional Clock (see clock.py) with the player's
+                        time running. The search is fitted to their
+                        time left.
+        @return:        Best move found (e.g. [1, 0, 2, 2]), or None if
+                        the player has no legal move.
+        """
+        if self._book is not None:
+            move = self._book.chooseMove(board, player)
+            if move is not None:
+                return moves.toList(move)
+        if self._tablebases is not None:
+            move = self._tablebases.bestMove(board, player)
+            if move is not None:
+                return moves.toList(move)
+        budget = None
+        if clock is not None:
+            budget = clock.budget(player)
+        return self.search(board, player, budget)[0]
+
+    def search(self, board, player, budget=None):
+        """
+        Searches a position with iterative deepening.
+
+        Every iteration but the first may be cut short by the time limit,
+        in which case the result of the last completed iteration is used.
+        The stop flag cuts short any iteration, so the move may be None
+        if it is set before the first one completes.
+
+        @param board:   The game board (a Board instance). It is left unchanged.
+        @param player:  Player to move (e.g. constants.WHITE_PLAYER).
+        @param budget:  Optional tuple (soft limit, hard limit) of seconds
+                        to search for (see Clock.budget()). No iteration
+                        starts after the soft limit, and the hard limit
+                        cuts iterations short like the time limit.
+        @return:        Tuple (best move, score in centipawns from player's
+                        point of view).
+        """
+        self._nodes = 0
+        self._completedDepth = 0
+        started = monotonic()
+        self._deadline = None
+        if self._timeLimit is not None:
+            self._deadline = started + self._timeLimit
+        softDeadline = None
+        if budget is not None:
+            soft, hard = budget
+            softDeadline = started + soft
+            if self._deadline is None or started + hard < self._deadline:
+                self._deadline = started + hard
+
+        bestMove = None
+        bestScore = 0
+        stable = 0
+        for depth in range(min(self._startDepth, self._maxDepth), self._maxDepth + 1):
+            if self._stop is not None and self._stop.value:
+                break
+            try:
+                move, score = self._searchRoot(board, player, depth)
+            except _OutOfTime:
+                break
+
+            if move == bestMove:
+                stable += 1
+            else:
+                stable = 0
+            bestMove, bestScore = move, score
+            self._completedDepth = depth
+            if bestMove is None or abs(bestScore) > _MATE_BOUND:
+                break
+
+            #The next iteration would take longer than all before it, so
+            #only start one while there is time planned for it
+            if softDeadline is not None:
+                limit = softDeadline
+                if stable >= _STABLE_ITERATIONS:
+                    limit = started + (softDeadline - started) * _STABLE_FRACTION
+                if monotonic() >= limit:
+                    break
+
+        if bestMove is not None:
+            bestMove = moves.toList(bestMove)
+        return bestMove, bestScore
+
+    def _searchRoot(self, board, player, depth):
+        """
+        Searches every root move to a fixed depth.
+
+        @return:    Tuple (best packed move, score).
+        """
+        candidates = self._orderMoves(board, player, self._tableMove(board, player),
+                                      shuffle=self._random is not None)
+        if not candidates:
+            if board_analyzer.isCheckStatic(board, player):
+                return None, -MATE_SCORE
+            return None, 0
+
+        alpha = -INFINITY
+        bestMove = candidates[0]
+        opponent = _OPPONENT[player]
+        for move in candidates:
+            board.makeMove(move)
+            try:
+                score = -self._negamax(board, opponent, depth - 1, -INFINITY, -alpha, 1)
+            finally:
+                board.unmakeMove()
+            if score > alpha:
+                alpha = score
+                bestMove = move
+
+        self._table.store(board.getKey(player), alpha, depth,
+                          transposition.EXACT, bestMove)
+        return bestMove, alpha
+
+    def _negamax(self, board, player, depth, alpha, beta, ply):
+        """
+        Scores a position by alpha-beta search.
+
+        @param depth:   Plies left to search.
+        @param alpha:   Score player is already guaranteed.
+        @param beta:    Score the opponent is already guaranteed.
+        @param ply:     Distance from the root.
+        @return:        Score from player's point of view.
+        """
+        self._tick()
+        if depth <= 0:
+            return self._quiesce(board, player, alpha, beta)
+
+        key = board.getKey(player)
+        originalAlpha = alpha
+        tableMove = moves.NO_MOVE
+        entry = self._table.probe(key)
+        if entry is not None:
+            value, entryDepth, flag, tableMove = entry
+            if entryDepth >= depth:
+                value = _fromTable(value, ply)
+                if flag == transposition.EXACT:
+                    return value
+                if flag == transposition.LOWER_BOUND and value >= beta:
+                    return value
+                if flag == transposition.UPPER_BOUND and value <= alpha:
+                    return value
+
+        candidates = self._orderMoves(board, player, tableMove)
+        if not candidates:
+            if board_analyzer.isCheckStatic(board, player):
+                return -MATE_SCORE + ply
+            return 0
+
+        bestScore = -INFINITY
+        bestMove = candidates[0]
+        opponent = _OPPONENT[player]
+        for move in candidates:
+            board.makeMove(move)
+            try:
+                score = -self._negamax(board, opponent, depth - 1, -beta, -alpha, ply + 1)
+            finally:
+                board.unmakeMove()
+            if score > bestScore:
+                bestScore = score
+                bestMove = move
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                break
+
+        if bestScore <= originalAlpha:
+            flag = transposition.UPPER_BOUND
+        elif bestScore >= beta:
+            flag = transposition.LOWER_BOUND
+        else:
+            flag = transposition.EXACT
+        self._table.store(key, _toTable(bestScore, ply), depth, flag, bestMove)
+        return bestScore
+
+    def _quiesce(self, board, player, alpha, beta):
+        """
+        Scores a position by searching captures only, so that the
+        static evaluation is applied to quiet positions.
+
+        @return:    Score from player's point of view.
+        """
+        standPat = evaluation.evaluate(board, player)
+        if standPat >= beta:
+            return standPat
+        if standPat > alpha:
+            alpha = standPat
+
+        opponent = _OPPONENT[player]
+        for move in self._orderMoves(board, player, moves.NO_MOVE, True):
+            self._tick()
+            board.makeMove(move)
+            try:
+                score = -self._quiesce(board, opponent, -beta, -alpha)
+            finally:
+                board.unmakeMove()
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+        return alpha
+
+    def _tableMove(self, board, player):
+        """
+        Returns the best move stored for a position, or moves.NO_MOVE.
+        """
+        entry = self._table.probe(board.getKey(player))
+        if entry is None:
+            return moves.NO_MOVE
+        return entry[3]
+
+    def _orderMoves(self, board, player, firstMove, capturesOnly=False, shuffle=False):
+        """
+        Lists a player's legal moves, most promising first: the
+        transposition table's move, then captures of the most valuable
+        pieces by the least valuable ones, then the rest.
+
+        @param firstMove:       Packed move to try first, or moves.NO_MOVE.
+        @param capturesOnly:    If True, only captures are listed.
+        @param shuffle:         If True, moves ordered equally are listed
+                                in random order.
+        @return:                List of packed moves.
+        """
+        enemy = board.getOccupancy(_OPPONENT[player])
+        scored = []
+        for move in board.getLegalMoves(player):
+            toSq = move >> 6 & 0x3F
+            if enemy >> toSq & 1:
+                order = 10 * evaluation.pieceValue(board.getPiece(toSq)) - \
+                        evaluation.pieceValue(board.getPiece(move & 0x3F))
+            elif capturesOnly:
+                continue
+            else:
+                order = -INFINITY
+            if move == firstMove:
+                order = INFINITY
+            scored.append((order, move))
+
+        #The sort is stable, so shuffling first only reorders ties
+        if shuffle:
+            self._random.shuffle(scored)
+        scored.sort(key=lambda entry: entry[0], reverse=True)
+        return [move for order, move in scored]
+
+    def _tick(self):
+        """
+        Counts a node, and gives up the search once the time budget has
+        run out (never during the first iteration) or the stop flag is set.
+        """
+        self._nodes += 1
+        if self._nodes % _CLOCK_INTERVAL:
+            return
+        if self._stop is not None and self._stop.value:
+            raise _OutOfTime()
+        if self._deadline is not None and self._completedDepth and \
+           monotonic() > self._deadline:
+            raise _OutOfTime()
@@ -0,0 +1,214 @@
+#!/usr/bin/python
+
+"""
+Static evaluation of positions for the engine (see engine.py).
+
+Scores are in centipawns (a pawn is worth 100) and are given from the
+point of view of the player to move: positive is good for that player.
+
+Pieces are scored twice, with middlegame and with endgame values, and
+the two totals are blended by how much material is left (the phase).
+The board keeps both totals and the phase up to date as moves are made
+(see Board.getPieceScores()), so a position is scored in constant time
+rather than by visiting every piece.
+"""
+import constants
+
+#Value of each piece type. The king is never captured, so it is not counted.
+PIECE_VALUES = {constants.PAWN:   100,
+                constants.KNIGHT: 320,
+                constants.BISHOP: 330,
+                constants.ROOK:   500,
+                constants.QUEEN:  900,
+                constants.KING:   0}
+
+#Values once most pieces are off the board: pawns are closer to
+#promoting, and rooks have open lines
+ENDGAME_PIECE_VALUES = {constants.PAWN:   120,
+                        constants.KNIGHT: 300,
+                        constants.BISHOP: 320,
+                        constants.ROOK:   520,
+                        constants.QUEEN:  920,
+                        constants.KING:   0}
+
+#How much each piece type counts towards the phase, which is MAX_PHASE
+#with every piece on the board and falls to 0 as they are exchanged
+PHASE_WEIGHTS = {constants.PAWN:   0,
+                 constants.KNIGHT: 1,
+                 constants.BISHOP: 1,
+                 constants.ROOK:   2,
+                 constants.QUEEN:  4,
+                 constants.KING:   0}
+MAX_PHASE = 24
+
+def _fromDiagram(diagram):
+    """
+    Converts a table written as a board diagram (rank 8 first, file a
+    on the left) to a list indexed by square (a1 = 0).
+    """
+    table = []
+    for rank in reversed(diagram):
+        table.extend(rank)
+    return table
+
+#Bonus for each piece type on each square, for white. Black's tables are
+#the same with the ranks reversed.
+PIECE_SQUARE_TABLES = {
+    constants.PAWN: _fromDiagram([
+        [  0,   0,   0,   0,   0,   0,   0,   0],
+        [ 50,  50,  50,  50,  50,  50,  50,  50],
+        [ 10,  10,  20,  30,  30,  20,  10,  10],
+        [  5,   5,  10,  25,  25,  10,   5,   5],
+        [  0,   0,   0,  20,  20,   0,   0,   0],
+        [  5,  -5, -10,   0,   0, -10,  -5,   5],
+        [  5,  10,  10, -20, -20,  10,  10,   5],
+        [  0,   0,   0,   0,   0,   0,   0,   0]]),
+    constants.KNIGHT: _fromDiagram([
+        [-50, -40, -30, -30, -30, -30, -40, -50],
+        [-40, -20,   0,   0,   0,   0, -20, -40],
+        [-30,   0,  10,  15,  15,  10,   0, -30],
+        [-30,   5,  15,  20,  20,  15,   5, -30],
+        [-30,   0,  15,  20,  20,  15,   0, -30],
+        [-30,   5,  10,  15,  15,  10,   5, -30],
+        [-40, -20,   0,   5,   5,   0, -20, -40],
+        [-50, -40, -30, -30, -30, -30, -40, -50]]),
+    constants.BISHOP: _fromDiagram([
+        [-20, -10, -10, -10, -10, -10, -10, -20],
+        [-10,   0,   0,   0,   0,   0,   0, -10],
+        [-10,   0,   5,  10,  10,   5,   0, -10],
+        [-10,   5,   5,  10,  10,   5,   5, -10],
+        [-10,   0,  10,  10,  10,  10,   0, -10],
+        [-10,  10,  10,  10,  10,  10,  10, -10],
+        [-10,   5,   0,   0,   0,   0,   5, -10],
+        [-20, -10, -10, -10, -10, -10, -10, -20]]),
+    constants.ROOK: _fromDiagram([
+        [  0,   0,   0,   0,   0,   0,   0,   0],
+        [  5,  10,  10,  10,  10,  10,  10,   5],
+        [ -5,   0,   0,   0,   0,   0,   0,  -5],
+        [ -5,   0,   0,   0,   0,   0,   0,  -5],
+        [ -5,   0,   0,   0,   0,   0,   0,  -5],
+        [ -5,   0,   0,   0,   0,   0,   0,  -5],
+        [ -5,   0,   0,   0,   0,   0,   0,  -5],
+        [  0,   0,   0,   5,   5,   0,   0,   0]]),
+    constants.QUEEN: _fromDiagram([
+        [-20, -10, -10,  -5,  -5, -10, -10, -20],
+        [-10,   0,   0,   0,   0,   0,   0, -10],
+        [-10,   0,   5,   5,   5,   5,   0, -10],
+        [ -5,   0,   5,   5,   5,   5,   0,  -5],
+        [  0,   0,   5,   5,   5,   5,   0,  -5],
+        [-10,   5,   5,   5,   5,   5,   0, -10],
+        [-10,   0,   5,   0,   0,   0,   0, -10],
+        [-20, -10, -10,  -5,  -5, -10, -10, -20]]),
+    constants.KING: _fromDiagram([
+        [-30, -40, -40, -50, -50, -40, -40, -30],
+        [-30, -40, -40, -50, -50, -40, -40, -30],
+        [-30, -40, -40, -50, -50, -40, -40, -30],
+        [-30, -40, -40, -50, -50, -40, -40, -30],
+        [-20, -30, -30, -40, -40, -30, -30, -20],
+        [-10, -20, -20, -20, -20, -20, -20, -10],
+        [ 20,  20,   0,   0,   0,   0,  20,  20],
+        [ 20,  30,  10,   0,   0,  10,  30,  20]]),
+}
+
+#Bonuses once most pieces are off the board. The king comes out to the
+#centre and pawns are worth more the further they have advanced; other
+#pieces keep their middlegame bonuses.
+ENDGAME_SQUARE_TABLES = dict(PIECE_SQUARE_TABLES)
+ENDGAME_SQUARE_TABLES[constants.PAWN] = _fromDiagram([
+        [  0,   0,   0,   0,   0,   0,   0,   0],
+        [ 80,  80,  80,  80,  80,  80,  80,  80],
+        [ 50,  50,  50,  50,  50,  50,  50,  50],
+        [ 30,  30,  30,  30,  30,  30,  30,  30],
+        [ 15,  15,  15,  15,  15,  15,  15,  15],
+        [  5,   5,   5,   5,   5,   5,   5,   5],
+        [  0,   0,   0,   0,   0,   0,   0,   0],
+        [  0,   0,   0,   0,   0,   0,   0,   0]])
+ENDGAME_SQUARE_TABLES[constants.KING] = _fromDiagram([
+        [-50, -40, -30, -20, -20, -30, -40, -50],
+        [-30, -20, -10,   0,   0, -10, -20, -30],
+        [-30, -10,  20,  30,  30,  20, -10, -30],
+        [-30, -10,  30,  40,  40,  30, -10, -30],
+        [-30, -10,  30,  40,  40,  30, -10, -30],
+        [-30, -10,  20,  30,  30,  20, -10, -30],
+        [-30, -30,   0,   0,   0,   0, -30, -30],
+        [-50, -30, -30, -30, -30, -30, -30, -50]])
+
+def _pieceScores(values, tables):
+    """
+    Returns, for each piece code, the value plus bonus of the piece on
+    each square: positive for white's pieces, negative for black's, and
+    0 for an empty square.
+    """
+    scores = [[0] * 64 for piece in range(2 * constants.BLACK_PIECE)]
+    for piece in constants.WHITE_PIECES + constants.BLACK_PIECES:
+        pieceType = piece & constants.PIECE_TYPE_MASK
+        sign = 1
+        flip = 0
+        if piece & constants.BLACK_PIECE:
+            sign = -1
+            flip = 56
+        scores[piece] = [sign * (values[pieceType] + tables[pieceType][sq ^ flip])
+                         for sq in range(64)]
+    return scores
+
+#Score of each piece code on each square from white's point of view,
+#indexed [piece][square], for keeping running totals (see Board)
+MIDDLEGAME_SCORES = _pieceScores(PIECE_VALUES, PIECE_SQUARE_TABLES)
+ENDGAME_SCORES = _pieceScores(ENDGAME_PIECE_VALUES, ENDGAME_SQUARE_TABLES)
+
+#Phase weight of each piece code (0 for an empty square)
+PHASES = [0] * (2 * constants.BLACK_PIECE)
+for _piece in constants.WHITE_PIECES + constants.BLACK_PIECES:
+    PHASES[_piece] = PHASE_WEIGHTS[_piece & constants.PIECE_TYPE_MASK]
+del _piece
+
+def squareBonus(piece, sq):
+    """
+    Returns the piece-square bonus of a piece of either color.
+
+    @param piece:   Non-empty piece code (e.g. constants.BLACK_PIECE | constants.QUEEN).
+    @param sq:      Square index (a1 = 0).
+    @return:        Bonus in centipawns, for the piece's owner.
+    """
+    if piece & constants.BLACK_PIECE:
+        sq ^= 56
+    return PIECE_SQUARE_TABLES[piece & constants.PIECE_TYPE_MASK][sq]
+
+def pieceValue(piece):
+    """
+    Returns the value of a piece of either color.
+
+    @param piece:   Piece code (e.g. constants.BLACK_PIECE | constants.QUEEN).
+    @return:        Value in centipawns (0 for an empty square).
+    """
+    if piece == constants.EMPTY:
+        return 0
+    return PIECE_VALUES[piece & constants.PIECE_TYPE_MASK]
+
+def taper(middlegame, endgame, phase):
+    """
+    Blends middlegame and endgame scores by the phase.
+
+    @param middlegame:  Score with middlegame values.
+    @param endgame:     Score with endgame values.
+    @param phase:       Phase weight of the pieces on the board (see
+                        PHASE_WEIGHTS); MAX_PHASE or more is all middlegame.
+    @return:            Score in centipawns, rounded down.
+    """
+    phase = min(phase, MAX_PHASE)
+    return (middlegame * phase + endgame * (MAX_PHASE - phase)) // MAX_PHASE
+
+def evaluate(board, player):
+    """
+    Scores a position by material balance and piece placement, tapered
+    between middlegame and endgame values by the phase.
+
+    @param board:   The game board (a Board instance).
+    @param player:  Player to move (e.g. constants.WHITE_PLAYER).
+    @return:        Score in centipawns from player's point of view.
+    """
+    middlegame, endgame, phase = board.getPieceScores()
+    score = taper(middlegame, endgame, phase)
+    if player == constants.WHITE_PLAYER:
+        return score
+    return -score
@@ -0,0 +1,93 @@
+#!/usr/bin/python
+
+"""
+Conversion between boards and Forsyth-Edwards Notation (FEN).
+
+Only the piece placement and side to move are used. The game does not
+implement castling or en passant, so those fields are ignored when
+reading and written as '-' when writing.
+"""
+import constants
+
+STARTING_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w - - 0 1"
+
+def boardFromFen(fen):
+    """
+    Builds a board from a FEN string.
+
+    @param fen:     FEN string (e.g. fen.STARTING_FEN).
+    @return:        Tuple (board, player to move).
+    """
+    from board import Board
+
+    fields = fen.split()
+    if len(fields) < 2:
+        raise ValueError("FEN needs piece placement and side to move: %r" % fen)
+
+    ranks = fields[0].split('/')
+    if len(ranks) != 8:
+        raise ValueError("FEN needs 8 ranks: %r" % fen)
+
+    squares = [[constants.EMPTY_SYMBOL] * 8 for col in range(8)]
+    for index, rank in enumerate(ranks):
+        row = 7 - index
+        col = 0
+        for char in rank:
+            if char.isdigit():
+                col += int(char)
+                continue
+            if col > 7 or char.lower() not in constants.WHITE_SYMBOLS:
+                raise ValueError("Bad FEN rank %r: %r" % (rank, fen))
+            if char.isupper():
+                squares[col][row] = char.lower()
+            else:
+                squares[col][row] = constants.BLACK_PLAYER_SYMBOL + char
+            col += 1
+        if col != 8:
+            raise ValueError("Bad FEN rank %r: %r" % (rank, fen))
+
+    if fields[1] == 'w':
+        player = constants.WHITE_PLAYER
+    elif fields[1] == 'b':
+        player = constants.BLACK_PLAYER
+    else:
+        raise ValueError("Bad FEN side to move: %r" % fen)
+
+    board = Board()
+    board._board = squares
+    return board, player
+
+def boardToFen(board, player):
+    """
+    Describes a board as a FEN string.
+
+    @param board:   The game board (a Board instance).
+    @param player:  Player to move (e.g. constants.WHITE_PLAYER).
+    @return:        FEN string.
+    """
+    squares = board.getBoard()
+    ranks = []
+    for row in range(7, -1, -1):
+        rank = ""
+        empty = 0
+        for col in range(8):
+            piece = squares[col][row]
+            if piece == constants.EMPTY_SYMBOL:
+                empty += 1
+                continue
+            if empty:
+                rank += str(empty)
+                empty = 0
+            if piece[0] == constants.BLACK_PLAYER_SYMBOL:
+                rank += piece[-1]
+            else:
+                rank += piece.upper()
+        if empty:
+            rank += str(empty)
+        ranks.append(rank)
+
+    if player == constants.WHITE_PLAYER:
+        side = 'w'
+    else:
+        side = 'b'
+    return "%s %s - - 0 1" % ('/'.join(ranks), side)
@@ -1,25 +1,294 @@
 #!/usr/bin/python
 
-import os
 import sys
 
+import bitboard
+import clock
 import constants
 from board import Board
 import board_analyzer
+import moves
+import renderer
+import savegame
+
+#State of a game
+IN_PROGRESS = 0
+CHECKMATE   = 1
+STALEMATE   = 2
+FLAGGED     = 3
+DRAW        = 4
+
+#Draws claimed for the players as soon as they can be (see getDrawReason())
+REPETITION  = "repetition"
+FIFTY_MOVES = "fifty moves"
+MATERIAL    = "insufficient material"
+
+#Moves by each player without a capture or pawn move that draw the game
+_FIFTY_MOVE_PLIES = 100
+
+#Pieces that can still give checkmate when a player has them
+_MATING_PIECES = [constants.PAWN, constants.ROOK, constants.QUEEN,
+                  constants.PAWN | constants.BLACK_PIECE,
+                  constants.ROOK | constants.BLACK_PIECE,
+                  constants.QUEEN | constants.BLACK_PIECE]
+_MINOR_PIECES = [constants.KNIGHT, constants.BISHOP,
+                 constants.KNIGHT | constants.BLACK_PIECE,
+                 constants.BISHOP | constants.BLACK_PIECE]
+
+def parseMove(text):
+    """
+    Reads a move given as starting and ending coordinates.
+
+    @param text:    Move typed by a player (e.g. "b1c3").
+    @return:        Move as a list (e.g. [1, 0, 2, 2]), or None if text
+                    is not a move.
+    """
+    if len(text) != 4:
+        return None
+    try:
+        return moves.toList(moves.fromText(text))
+    except ValueError:
+        return None
 
 class Game(object):
-    def __init__(self):
+    def __init__(self, engines=None, log=None, gameId=0, savePath=None, display=None,
+                 clock=None):
         """
         Initializes new game.
+
+        @param engines: Optional dictionary from player (e.g.
+                        constants.BLACK_PLAYER) to the Engine choosing
+                        that player's moves. Other players are human.
+        @param log:     Optional MoveLog (see movelog.py) to record the
+                        moves in.
+        @param gameId:  Number identifying the game in the log.
+        @param savePath: Optional file to save the game in after every
+                         move (see savegame.py).
+        @param display: Renderer showing the board each turn (see
+                        renderer.py), or None to choose one for the
+                        terminal.
+        @param clock:   Optional Clock (see clock.py) to play on. A player
+                        who runs out of time loses.
         """
         #Create new game board
         self._board = Board() 
 
+        #Computer players
+        if engines is None:
+            engines = {}
+        self._engines = engines
+
         #Record whose turn it is
         self._currentPlayer = constants.WHITE_PLAYER 
+        self._status = IN_PROGRESS
+        self._drawReason = None
+
+        #Plies since the last capture or pawn move, and how many times each
+        #position since then has come up (by Zobrist key)
+        self._halfmoves = 0
+        self._positions = {self._board.getKey(self._currentPlayer): 1}
+
+        #Move recording
+        self._log = log
+        self._gameId = gameId
+        self._ply = 0
+        self._history = moves.moveList()
+        self._savePath = savePath
 
-        #Print welcome text
-        os.system('clear')
+        #How the board is shown
+        if display is None:
+            display = renderer.defaultRenderer()
+        self._display = display
+
+        #Time control
+        self._clock = clock
+
+    @classmethod
+    def resume(cls, path, engines=None, log=None, display=None, clock=None):
+        """
+        Carries on a game saved by save().
+
+        @param path:    Saved game file name.
+        @param engines: As for Game().
+        @param log:     As for Game().
+        @param display: As for Game().
+        @param clock:   As for Game(), for games saved without a clock.
+                        Games saved on a clock carry on with the time
+                        each player had left.
+        @return:        A Game that saves itself to path after every move.
+        @raise ValueError:  If the file is not a saved game.
+        """
+        saved = savegame.load(path)
+        if saved.clock is not None:
+            clock = saved.clock
+        game = cls(engines, log, saved.gameId, path, display, clock)
+
+        #Replays the moves to count repeated positions again
+        for packed in saved.history:
+            game._advance(packed)
+        game._board = saved.toBoard()
+        game._currentPlayer = saved.player
+        game._history = saved.history
+        game._ply = len(saved.history)
+
+        #Losing on time leaves nothing on the board to show it
+        if saved.status == FLAGGED:
+            game._status = FLAGGED
+        else:
+            game._status = game._findStatus()
+        return game
+
+    def save(self, path):
+        """
+        Saves the game so that it can be carried on with resume().
+
+        @param path:    File name.
+        """
+        savegame.save(path, self._board, self._currentPlayer, self._history, self._gameId,
+                      self._clock, self._status)
+
+    def getBoard(self):
+        """
+        Returns the game board (a Board instance).
+        """
+        return self._board
+
+    def getCurrentPlayer(self):
+        """
+        Returns the player whose turn it is (e.g. constants.WHITE_PLAYER).
+        """
+        return self._currentPlayer
+
+    def getStatus(self):
+        """
+        Returns IN_PROGRESS, or how the game ended: CHECKMATE (the player
+        to move has lost), STALEMATE, FLAGGED (the player to move ran
+        out of time, and has lost) or DRAW (see getDrawReason()).
+        """
+        return self._status
+
+    def getDrawReason(self):
+        """
+        Returns why the game was drawn: REPETITION (the same position
+        came up three times), FIFTY_MOVES (fifty moves each without a
+        capture or pawn move) or MATERIAL (neither player can checkmate),
+        or None if the status is not DRAW.
+        """
+        return self._drawReason
+
+    def playMove(self, move):
+        """
+        Plays a move for the player whose turn it is, then gives the turn
+        to the other player. On a clock, the player's time stops and the
+        other player's starts.
+
+        @param move:    Move as a list (e.g. [1, 0, 2, 2]).
+        @return:        The game's status afterwards (see getStatus()).
+        @raise ValueError:  If the game is over or the move is illegal.
+        """
+        if self._status != IN_PROGRESS:
+            raise ValueError("the game is over")
+        if self._board.isLegalMove(self._currentPlayer, move) != True:
+            raise ValueError("illegal move")
+
+        #A move made after the player's time has run out loses
+        gameClock = self._clock
+        if gameClock is not None and gameClock.getRunning() == self._currentPlayer:
+            if not gameClock.stop():
+                return self._flag()
+
+        #Executes move and switches players
+        packed = moves.fromList(move)
+        self._advance(packed)
+        self._history.append(packed)
+        if self._log is not None:
+            self._log.record(self._gameId, self._ply, packed)
+        self._ply += 1
+
+        #End game conditions: checkmate, stalemate or a draw
+        self._status = self._findStatus()
+        if gameClock is not None and self._status == IN_PROGRESS:
+            gameClock.start(self._currentPlayer)
+
+        #Saves the game, finished or not
+        if self._savePath is not None:
+            self.save(self._savePath)
+        return self._status
+
+    def _flag(self):
+        """
+        Ends the game once the player to move has run out of time (and
+        their clock has stopped), saving it so that it stays lost.
+
+        @return:    FLAGGED.
+        """
+        self._status = FLAGGED
+        if self._savePath is not None:
+            self.save(self._savePath)
+        return self._status
+
+    def _advance(self, move):
+        """
+        Plays a packed move on the board and switches players, counting
+        the plies and positions since the last capture or pawn move.
+        """
+        board = self._board
+        piece = board.getPiece(moves.fromSquare(move))
+        captured = board.getPiece(moves.toSquare(move))
+        board.movePiece(self._currentPlayer, move)
+
+        if self._currentPlayer == constants.WHITE_PLAYER:
+            self._currentPlayer = constants.BLACK_PLAYER
+        else: 
+            self._currentPlayer = constants.WHITE_PLAYER
+
+        #Positions before a capture or pawn move cannot come up again
+        if captured != constants.EMPTY or piece & constants.PIECE_TYPE_MASK == constants.PAWN:
+            self._halfmoves = 0
+            self._positions = {}
+        else:
+            self._halfmoves += 1
+        key = board.getKey(self._currentPlayer)
+        self._positions[key] = self._positions.get(key, 0) + 1
+
+    def _findStatus(self):
+        self._drawReason = None
+        if not board_analyzer.hasLegalMove(self._board, self._currentPlayer):
+            if board_analyzer.isCheckStatic(self._board, self._currentPlayer):
+                return CHECKMATE
+            return STALEMATE
+
+        #Keys do not include castling or en passant rights, so positions
+        #differing only in those count as the same
+        if self._positions.get(self._board.getKey(self._currentPlayer), 0) >= 3:
+            self._drawReason = REPETITION
+        elif self._halfmoves >= _FIFTY_MOVE_PLIES:
+            self._drawReason = FIFTY_MOVES
+        elif not self._canCheckmate():
+            self._drawReason = MATERIAL
+        else:
+            return IN_PROGRESS
+        return DRAW
+
+    def _canCheckmate(self):
+        """
+        Returns False if only kings are left, or kings and a single
+        knight or bishop, so that neither player can checkmate.
+        """
+        board = self._board
+        for piece in _MATING_PIECES:
+            if board.getBitboard(piece):
+                return True
+        minors = 0
+        for piece in _MINOR_PIECES:
+            minors += bitboard.popCount(board.getBitboard(piece))
+        return minors > 1
+
+    def play(self):
+        """
+        Main game loop.
+        """
+        #Show welcome text above the initial board
         welcome = "Welcome to Solidarity Bros. Chess!\n" \
           "by Chris Wang, Dmitriy Chukhin, and Jim Ladd\n" \
           "\n" \
@@ -28,15 +297,11 @@ class Game(object):
           "To quit, type 'quit'.\n\n" \
           "Enjoy!\n\n"
  
-        print welcome
-
-    def play(self):
-        """
-        Main game loop.
-        """
-        #Print initial board
-        self._board.printBoard()
+        self._display.showBoard(self._board, header=welcome, footer=self._clockText())
 
+        #A resumed game may already be over
+        if self._status != IN_PROGRESS:
+            self._showResult()
         while True:
             self._nextTurn()
 
@@ -45,41 +310,91 @@ class Game(object):
         Contains logic for executing a player's turn.
         Exits when game is finished.
         """
-        #Get next move from player
-        move = self._getPlayersNextMove()
-        move = self._board._moveConverter(move)
-        while self._board.isLegalMove(self._currentPlayer, move) != True:
-            move = self._getPlayersNextMove()
-            move = self._board._moveConverter(move)
+        #Get next move from player or engine, with their clock running
+        player = self._currentPlayer
+        gameClock = self._clock
+        if gameClock is not None and gameClock.getRunning() is None:
+            gameClock.start(player)
+        if gameClock is not None and gameClock.remaining(player) <= 0:
+            #Time ran out before the turn began, so no move can be made
+            gameClock.stop()
+            status = self._flag()
+        else:
+            status = self.playMove(self._chooseMove(player))
+
+        #Shows board, and the result once the game is over
+        if status != IN_PROGRESS:
+            self._showResult()
+        elif gameClock is not None:
+            self._display.showBoard(self._board, footer=self._clockText())
+        else:
+            self._display.showBoard(self._board)
+
+    def _chooseMove(self, player):
+        """
+        Gets a legal move from the player's engine, or asks the player for
+        one until they give one.
 
-        #Executes move
-        self._board.movePiece(self._currentPlayer, move)
+        @return:    Move as a list (e.g. [1, 0, 2, 2]).
+        """
+        if player in self._engines:
+            engine = self._engines[player]
+            if self._clock is None:
+                return engine.chooseMove(self._board, player)
+            return engine.chooseMove(self._board, player, self._clock)
 
-        #Prints board
-        os.system('clear')
-        self._board.printBoard()
+        move = parseMove(self._getPlayersNextMove())
+        while self._board.isLegalMove(player, move) != True:
+            move = parseMove(self._getPlayersNextMove())
+        return move
 
-        #Creates variable other_player
-        if self._currentPlayer == constants.WHITE_PLAYER:
-            self._otherPlayer = constants.BLACK_PLAYER
+    def _showResult(self):
+        """
+        Shows the board and how the game ended, then waits for the
+        players to quit.
+        """
+        player = self._currentPlayer
+        opponent = constants.WHITE_PLAYER
+        if player == constants.WHITE_PLAYER:
+            opponent = constants.BLACK_PLAYER
+
+        if self._status == CHECKMATE:
+            footer = "Player %d has won the game!" % opponent
+        elif self._status == STALEMATE:
+            footer = "Stalemate! The game is a draw."
+        elif self._status == DRAW:
+            footer = "The game is a draw by %s." % self._drawReason
         else:
-            self._otherPlayer = constants.WHITE_PLAYER
-        
-        #End game conditions
-        if board_analyzer.isCheckMate(self._board, self._otherPlayer) == True:
-            print "Player",self._currentPlayer,"has won the game!"
-            choice = None
-            while choice != 'quit':
-                choice = raw_input("Type 'quit' to exit. ")
-            else:
-                sys.exit(0)
-                                      
-        #Switches players
-        if self._currentPlayer == constants.WHITE_PLAYER:
-            self._currentPlayer = constants.BLACK_PLAYER
-        else: 
-            self._currentPlayer = constants.WHITE_PLAYER
-            
+            footer = "Player %d has run out of time. " \
+                     "Player %d has won the game!" % (player, opponent)
+        self._display.showBoard(self._board, footer=footer)
+        self._waitForQuit()
+
+    def _clockText(self):
+        """
+        Returns each player's time left (e.g. "White 4:07  Black 3:59"),
+        or None if the game is not played on a clock.
+        """
+        if self._clock is None:
+            return None
+        return "White %s  Black %s" % (
+            clock.formatTime(self._clock.remaining(constants.WHITE_PLAYER)),
+            clock.formatTime(self._clock.remaining(constants.BLACK_PLAYER)))
+
+    def _waitForQuit(self):
+        """
+        Waits for the players to quit after the game has ended.
+        Games between engines exit straight away.
+        """
+        if len(self._engines) == 2:
+            sys.exit(0)
+
+        choice = None
+        while choice != 'quit':
+            choice = raw_input("Type 'quit' to exit. ")
+        else:
+            sys.exit(0)
+
     def _getPlayersNextMove(self):
         """
         Retrieves player's next move. (e.g. "b1d4").
@@ -106,18 +421,7 @@ class Game(object):
                 sys.exit(0)
 
             #Check row/column values 
-            validColumns = "abcdefgh"
-            validRows    = "12345678"
-
-            col1 = response[0]
-            row1 = response[1]
-            col2 = response[2]
-            row2 = response[3]
-
-            if (col1 not in validColumns) or   \
-               (row1 not in validRows) or      \
-               (col2 not in validColumns) or   \
-               (row2 not in validRows):
+            if parseMove(response) is None:
                 self._printHelp()
                 continue
 
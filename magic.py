@@ -0,0 +1,223 @@
+#!/usr/bin/python
+
+"""
+Magic bitboard attack tables for sliding pieces.
+
+A rook or bishop's attacks depend only on which squares along its lines
+are occupied. For each square, those occupied squares (masked from the
+occupancy bitboard) are multiplied by a "magic" number, and the top bits
+of the product index a table holding the attacks for that arrangement:
+
+    attacks = ROOK_TABLES[sq][((occupied & mask) * magic & FULL) >> shift]
+
+The magic numbers are found by a seeded search the first time the tables
+are needed, and the results are saved to a cache file so that later runs
+only have to load them. The cache directory defaults to ~/.cache/chess
+and can be changed with the CHESS_CACHE_DIR environment variable.
+"""
+import os
+import pickle
+
+import bitboard
+
+#Bump when the cache layout or contents change
+_CACHE_VERSION = 1
+_CACHE_NAME = "magic-v%d.pickle" % _CACHE_VERSION
+
+_FULL = bitboard.FULL
+
+def _relevantMask(sq, directions):
+    """
+    Returns the squares whose occupancy can block a slider on a square:
+    its rays, minus the last square of each (which is never a blocker
+    of anything further along).
+    """
+    mask = 0
+    for direction in directions:
+        ray = bitboard.RAYS[direction][sq]
+        if ray:
+            if direction[0] > 0:
+                ray ^= 1 << bitboard.msb(ray)
+            else:
+                ray ^= 1 << bitboard.lsb(ray)
+        mask |= ray
+    return mask
+
+def _subsets(mask):
+    """
+    Yields every subset of the squares in a bitboard (Carry-Rippler).
+    """
+    subset = 0
+    while True:
+        yield subset
+        subset = (subset - mask) & mask
+        if not subset:
+            return
+
+class _Random(object):
+    """
+    Xorshift64* pseudo-random numbers. Seeded per rank with the values
+    Stockfish uses, which lead to magics after few attempts.
+    """
+    SEEDS = [728, 10316, 55013, 32803, 12281, 15100, 16645, 255]
+
+    def __init__(self, seed):
+        self._state = seed
+
+    def next(self):
+        state = self._state
+        state ^= state >> 12
+        state ^= (state << 25) & _FULL
+        state ^= state >> 27
+        self._state = state
+        return (state * 2685821657736338717) & _FULL
+
+    def sparse(self):
+        """
+        Returns a number with about an eighth of its bits set. Sparse
+        candidates succeed far more often.
+        """
+        return self.next() & self.next() & self.next()
+
+def _findMagic(sq, mask, attacksFrom):
+    """
+    Searches for a magic number for one square.
+
+    @return:    Tuple (magic, shift, table).
+    """
+    bits = bitboard.popCount(mask)
+    shift = 64 - bits
+    occupancies = list(_subsets(mask))
+    attacks = [attacksFrom(sq, occupied) for occupied in occupancies]
+    rng = _Random(_Random.SEEDS[sq >> 3])
+
+    #Each entry is valid only if stamped with the current attempt, so the
+    #table does not have to be cleared between attempts
+    table = [0] * (1 << bits)
+    stamps = [0] * (1 << bits)
+    attempt = 0
+    while True:
+        magic = 0
+        while bitboard.popCount((mask * magic & _FULL) >> 56) < 6:
+            magic = rng.sparse()
+
+        attempt += 1
+        for occupied, attack in zip(occupancies, attacks):
+            index = (occupied * magic & _FULL) >> shift
+            if stamps[index] != attempt:
+                stamps[index] = attempt
+                table[index] = attack
+            elif table[index] != attack:
+                break
+        else:
+            #Entries never stamped are never looked up
+            return magic, shift, table
+
+def _generate():
+    """
+    Finds magic numbers and builds the attack tables for every square.
+
+    @return:    Dictionary of masks, magics, shifts and tables for rooks
+                and bishops.
+    """
+    tables = {}
+    for name, directions, attacksFrom in [
+            ("rook", bitboard.ORTHOGONAL, bitboard.rookAttacksFrom),
+            ("bishop", bitboard.DIAGONAL, bitboard.bishopAttacksFrom)]:
+        masks, magics, shifts, attacks = [], [], [], []
+        for sq in range(64):
+            mask = _relevantMask(sq, directions)
+            magic, shift, table = _findMagic(sq, mask, attacksFrom)
+            masks.append(mask)
+            magics.append(magic)
+            shifts.append(shift)
+            attacks.append(table)
+        tables[name] = (masks, magics, shifts, attacks)
+    return tables
+
+def _cachePath():
+    directory = os.environ.get("CHESS_CACHE_DIR")
+    if not directory:
+        directory = os.path.join(os.path.expanduser("~"), ".cache", "chess")
+    return os.path.join(directory, _CACHE_NAME)
+
+def _loadCache(path):
+    """
+    Reads tables saved by _saveCache().
+
+    @return:    The tables, or None if the cache is missing or unusable.
+    """
+    try:
+        with open(path, "rb") as cache:
+            tables = pickle.load(cache)
+        for name in ("rook", "bishop"):
+            masks, magics, shifts, attacks = tables[name]
+            if len(masks) != 64 or len(attacks) != 64:
+                return None
+        return tables
+    except Exception:
+        return None
+
+def _saveCache(path, tables):
+    """
+    Saves the tables, ignoring any failure (the cache is only an
+    optimisation). The file is written under a temporary name and then
+    renamed, so a reader never sees it half-written.
+    """
+    try:
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        temporary = "%s.%d" % (path, os.getpid())
+        with open(temporary, "wb") as cache:
+            pickle.dump(tables, cache, 2)
+        os.rename(temporary, path)
+    except (IOError, OSError):
+        pass
+
+def loadTables():
+    """
+    Returns the magic tables, from the cache if possible, generating and
+    caching them otherwise.
+    """
+    path = _cachePath()
+    tables = _loadCache(path)
+    if tables is None:
+        tables = _generate()
+        _saveCache(path, tables)
+    return tables
+
+_tables = loadTables()
+ROOK_MASKS, ROOK_MAGICS, ROOK_SHIFTS, ROOK_TABLES = _tables["rook"]
+BISHOP_MASKS, BISHOP_MAGICS, BISHOP_SHIFTS, BISHOP_TABLES = _tables["bishop"]
+del _tables
+
+def rookAttacks(sq, occupied):
+    """
+    Squares attacked by a rook on a square.
+
+    @param sq:          Square index of the rook.
+    @param occupied:    Bitboard of all occupied squares.
+    @return:            Bitboard of attacked squares.
+    """
+    return ROOK_TABLES[sq][((occupied & ROOK_MASKS[sq]) * ROOK_MAGICS[sq] & _FULL) >> ROOK_SHIFTS[sq]]
+
+def bishopAttacks(sq, occupied):
+    """
+    Squares attacked by a bishop on a square.
+
+    @param sq:          Square index of the bishop.
+    @param occupied:    Bitboard of all occupied squares.
+    @return:            Bitboard of attacked squares.
+    """
+    return BISHOP_TABLES[sq][((occupied & BISHOP_MASKS[sq]) * BISHOP_MAGICS[sq] & _FULL) >> BISHOP_SHIFTS[sq]]
+
+def queenAttacks(sq, occupied):
+    """
+    Squares attacked by a queen on a square.
+
+    @param sq:          Square index of the queen.
+    @param occupied:    Bitboard of all occupied squares.
+    @return:            Bitboard of attacked squares.
+    """
+    return rookAttacks(sq, occupied) | bishopAttacks(sq, occupied)
@@ -1,6 +1,99 @@
 #!/usr/bin/python
 
+import argparse
+import os
+
+import constants
+from book import OpeningBook
+from clock import Clock, parseTimeControl
+from engine import Engine
 from game import Game
+from movelog import MoveLog, newGameId
+from parallel_engine import ParallelEngine
+import renderer
+from tablebase import Tablebases
+
+def timeControl(text):
+    try:
+        return parseTimeControl(text)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
+
+parser = argparse.ArgumentParser(description="Play a game of chess.")
+parser.add_argument("--white", choices=["human", "computer"], default="human",
+                    help="who plays white (default human)")
+parser.add_argument("--black", choices=["human", "computer"], default="human",
+                    help="who plays black (default human)")
+parser.add_argument("--depth", type=int, default=64,
+                    help="deepest computer search, in plies (default 64)")
+parser.add_argument("--movetime", type=float,
+                    help="seconds the computer spends per move (default 5, or "
+                         "as its clock allows with --time)")
+parser.add_argument("--time", metavar="CONTROL", type=timeControl,
+                    help="play on a clock: minutes each plus seconds per move "
+                         "(e.g. 5+3), or moves in minutes (e.g. 40/90 or 40/90+30)")
+parser.add_argument("--workers", type=int, default=1,
+                    help="processes each computer player searches with (default 1)")
+parser.add_argument("--book", metavar="FILE",
+                    help="opening book for the computer to play from (see book.py)")
+parser.add_argument("--tablebases", metavar="DIR",
+                    help="endgame tables for the computer to play from (see tablebase.py)")
+parser.add_argument("--log", metavar="FILE",
+                    help="append the game's moves to a move log (see movelog.py)")
+parser.add_argument("--display", choices=["ansi", "text", "none"],
+                    help="how to show the board: redrawn in place, one board after "
+                         "another, or not at all (default: ansi on a terminal, "
+                         "text otherwise)")
+parser.add_argument("--save", metavar="FILE",
+                    help="save the game in FILE after every move, carrying on "
+                         "the game saved there if there is one")
+args = parser.parse_args()
+
+book = None
+if args.book:
+    book = OpeningBook(args.book)
+
+DISPLAYS = {"ansi": renderer.AnsiRenderer, "text": renderer.TextRenderer,
+            "none": renderer.NullRenderer}
+display = None
+if args.display:
+    display = DISPLAYS[args.display]()
+
+tablebases = None
+if args.tablebases:
+    tablebases = Tablebases(args.tablebases)
+
+#On a clock, the computer plans its own time
+clock = None
+movetime = args.movetime
+if args.time:
+    clock = Clock(args.time)
+elif movetime is None:
+    movetime = 5.0
+
+def makeEngine():
+    if args.workers > 1:
+        return ParallelEngine(args.workers, args.depth, movetime, book=book,
+                              tablebases=tablebases)
+    return Engine(args.depth, movetime, book=book, tablebases=tablebases)
+
+engines = {}
+if args.white == "computer":
+    engines[constants.WHITE_PLAYER] = makeEngine()
+if args.black == "computer":
+    engines[constants.BLACK_PLAYER] = makeEngine()
+
+log = None
+if args.log:
+    log = MoveLog(args.log)
 
-game = Game()
-game.play()
\ No newline at end of file
+#The game exits the program when it ends, so the log is closed on the way out
+try:
+    if args.save and os.path.exists(args.save):
+        game = Game.resume(args.save, engines, log, display, clock)
+    else:
+        game = Game(engines, log, newGameId(), args.save, display, clock)
+    game.play()
+finally:
+    if log is not None:
+        log.close()
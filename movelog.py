@@ -0,0 +1,211 @@
+#!/usr/bin/python
+
+"""
+Buffered, append-only log of the moves played in any number of games.
+
+Each move is a fixed-size binary record: the game's number, the ply
+(0 for white's first move), the packed move (see moves.py) and the time
+it was played. Records are collected in memory and appended to the file
+in one write when enough have built up or enough time has passed, so
+that many games can share a log without a disk write per move. Since
+every write is a whole number of records on a file opened for
+appending, several processes can share a log too. A new log appears
+with its header already written, and a record left half written by a
+crash is cut off when the log is next opened, so later records are not
+put out of step.
+
+The time limit is only checked when a move is recorded, so call
+flush() or close() when play stops.
+
+A log can be read back as a stream with readLog(), or printed with:
+
+ $ ./movelog.py games.log
+"""
+import argparse
+import errno
+import fcntl
+import os
+import struct
+import sys
+import tempfile
+import time
+
+import moves
+
+#Start of every log file; the last byte is the format version
+_HEADER = b"CHESSLOG\x01"
+
+#Game number, ply, packed move, time (seconds since the epoch)
+_RECORD = struct.Struct("<IHHd")
+RECORD_SIZE = _RECORD.size
+
+#Game number, for drawing random ones
+_GAME_ID = struct.Struct("<I")
+
+def newGameId():
+    """
+    Returns a random game number. Processes sharing a log number their
+    games from one of these each, so their games are told apart even
+    when they start at the same moment.
+
+    @return:    Number from 0 to 2**32 - 1.
+    """
+    return _GAME_ID.unpack(os.urandom(_GAME_ID.size))[0]
+
+def _create(path):
+    """
+    Creates an empty log. The header is written to a temporary file
+    which is then linked into place, so other processes never see the
+    log without it. If another process creates the log first, theirs
+    is kept.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temporary = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        try:
+            os.write(fd, _HEADER)
+        finally:
+            os.close(fd)
+        os.chmod(temporary, 0o644)
+        try:
+            os.link(temporary, path)
+        except OSError as error:
+            if error.errno != errno.EEXIST:
+                raise
+    finally:
+        os.remove(temporary)
+
+class MoveLog(object):
+    def __init__(self, path, batchSize=256, flushInterval=1.0):
+        """
+        Opens a log, creating it if necessary. Moves already in the file
+        are kept, apart from a partly written record at the end.
+
+        @param path:            Log file name.
+        @param batchSize:       Number of moves to collect before writing.
+        @param flushInterval:   Seconds after which collected moves are
+                                written, even if there are fewer than
+                                batchSize.
+        @raise ValueError:      If the file is not a move log.
+        """
+        self._path = path
+        self._batchSize = batchSize
+        self._flushInterval = flushInterval
+
+        if not os.path.exists(path):
+            _create(path)
+
+        self._fd = os.open(path, os.O_RDWR | os.O_APPEND)
+        try:
+            self._trim()
+        except:
+            os.close(self._fd)
+            raise
+        self._buffer = bytearray()
+        self._pending = 0
+        self._lastFlush = time.time()
+
+    def _trim(self):
+        """
+        Checks the header and cuts off a partly written record at the
+        end. Writers hold a shared lock while appending, so no other
+        process's record is caught half written.
+        """
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            if os.read(self._fd, len(_HEADER)) != _HEADER:
+                raise ValueError("%s is not a move log" % self._path)
+            size = os.fstat(self._fd).st_size
+            torn = (size - len(_HEADER)) % RECORD_SIZE
+            if torn:
+                os.ftruncate(self._fd, size - torn)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def record(self, gameId, ply, move, timestamp=None):
+        """
+        Adds a move to the log.
+
+        @param gameId:      Number identifying the game (0 to 2**32 - 1).
+        @param ply:         Number of moves played before this one.
+        @param move:        Packed move (see moves.py).
+        @param timestamp:   Time the move was played, or None for now.
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        self._buffer += _RECORD.pack(gameId, ply, move, timestamp)
+        self._pending += 1
+
+        if self._pending >= self._batchSize or \
+           timestamp - self._lastFlush >= self._flushInterval:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the collected moves to the file.
+        """
+        if self._buffer:
+            fcntl.flock(self._fd, fcntl.LOCK_SH)
+            try:
+                written = 0
+                while written < len(self._buffer):
+                    written += os.write(self._fd, bytes(self._buffer[written:]))
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            self._buffer = bytearray()
+            self._pending = 0
+        self._lastFlush = time.time()
+
+    def close(self):
+        """
+        Writes any collected moves and closes the file.
+        """
+        if self._fd is not None:
+            self.flush()
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def readLog(path, chunkRecords=4096):
+    """
+    Reads a log written by MoveLog, a chunk at a time.
+
+    A partly written record at the end of the file (e.g. after a crash)
+    is ignored.
+
+    @param path:            Log file name.
+    @param chunkRecords:    Number of records read at once.
+    @return:                Generator of (game number, ply, packed move,
+                            time) tuples, in the order they were written.
+    @raise ValueError:      If the file is not a move log.
+    """
+    with open(path, "rb") as log:
+        if log.read(len(_HEADER)) != _HEADER:
+            raise ValueError("%s is not a move log" % path)
+
+        while True:
+            chunk = log.read(chunkRecords * RECORD_SIZE)
+            count = len(chunk) // RECORD_SIZE
+            for index in range(count):
+                yield _RECORD.unpack_from(chunk, index * RECORD_SIZE)
+            if len(chunk) < chunkRecords * RECORD_SIZE:
+                return
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Print the moves in a move log.")
+    parser.add_argument("log", help="log file name")
+    args = parser.parse_args(argv)
+
+    for gameId, ply, move, timestamp in readLog(args.log):
+        print("%d %d %s %s" % (gameId, ply, moves.toText(move),
+                               time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp))))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,132 @@
+#!/usr/bin/python
+
+"""
+Moves packed into 16-bit integers.
+
+Bits 0-5 hold the square the piece moves from and bits 6-11 the square
+it moves to (see bitboard.square()). Bits 14-15 mark special moves, and
+for promotions bits 12-13 give the new piece. The game does not yet
+have promotion, castling or en passant (see the README), so every move
+it generates is NORMAL, but the format already has room for them.
+
+Being plain integers, packed moves are cheap to compare, store in the
+transposition table and keep in array('H') move lists, and converting
+them to and from text (e.g. "b1c3") takes a table lookup per square.
+
+Board.isLegalMove() and the Game still take moves as lists of four
+indices (e.g. [1, 0, 2, 2]); fromList() and toList() convert.
+"""
+from array import array
+
+import constants
+
+#Kinds of move, in bits 14-15
+NORMAL     = 0
+PROMOTION  = 1 << 14
+EN_PASSANT = 2 << 14
+CASTLING   = 3 << 14
+SPECIAL_MASK = 3 << 14
+
+#Piece a pawn is promoted to, indexed by bits 12-13
+PROMOTION_PIECES = [constants.KNIGHT, constants.BISHOP, constants.ROOK, constants.QUEEN]
+_PROMOTION_LETTERS = "nbrq"
+
+#Stands for "no move" (no move goes from a1 to a1)
+NO_MOVE = 0
+
+#Name of each square (e.g. "b1"), indexed by square
+SQUARE_NAMES = [col + row for row in "12345678" for col in "abcdefgh"]
+_SQUARES = dict((name, sq) for sq, name in enumerate(SQUARE_NAMES))
+
+def squareIndex(name):
+    """
+    Returns the index of a square given by name (e.g. "b1" => 1).
+
+    @raise ValueError:  If name is not a square.
+    """
+    try:
+        return _SQUARES[name]
+    except (KeyError, TypeError):
+        raise ValueError("invalid square %r" % (name,))
+
+def pack(fromSq, toSq, flags=NORMAL):
+    """
+    Packs a move.
+
+    @param fromSq:  Square index the piece moves from.
+    @param toSq:    Square index the piece moves to.
+    @param flags:   Kind of move (e.g. moves.NORMAL).
+    @return:        Packed move.
+    """
+    return fromSq | toSq << 6 | flags
+
+def fromSquare(move):
+    """
+    Returns the square index a packed move starts from.
+    """
+    return move & 0x3F
+
+def toSquare(move):
+    """
+    Returns the square index a packed move ends on.
+    """
+    return move >> 6 & 0x3F
+
+def fromList(move):
+    """
+    Packs a move given as a list (e.g. [1, 0, 2, 2]).
+
+    @param move:    Four-character combination representing player move.
+    @return:        Packed move.
+    """
+    return move[0] | move[1] << 3 | move[2] << 6 | move[3] << 9
+
+def toList(move):
+    """
+    Unpacks a move to a list (e.g. [1, 0, 2, 2]).
+
+    @param move:    Packed move.
+    @return:        List containing indices for board.
+    """
+    return [move & 7, move >> 3 & 7, move >> 6 & 7, move >> 9 & 7]
+
+def fromText(text):
+    """
+    Converts a move from coordinates (e.g. "b1c3", or "e7e8q" for a
+    promotion) to a packed move.
+
+    @param text:    Move in coordinate notation.
+    @return:        Packed move.
+    @raise ValueError:  If text is not a move.
+    """
+    try:
+        move = _SQUARES[text[:2]] | _SQUARES[text[2:4]] << 6
+    except (KeyError, TypeError):
+        raise ValueError("invalid move %r" % (text,))
+
+    if len(text) == 5 and text[4] in _PROMOTION_LETTERS:
+        return move | PROMOTION | _PROMOTION_LETTERS.index(text[4]) << 12
+    if len(text) != 4:
+        raise ValueError("invalid move %r" % (text,))
+    return move
+
+def toText(move):
+    """
+    Converts a packed move to coordinates (e.g. "b1c3").
+
+    @param move:    Packed move.
+    @return:        Move in coordinate notation.
+    """
+    text = SQUARE_NAMES[move & 0x3F] + SQUARE_NAMES[move >> 6 & 0x3F]
+    if move & SPECIAL_MASK == PROMOTION:
+        text += _PROMOTION_LETTERS[move >> 12 & 3]
+    return text
+
+def moveList(moves=()):
+    """
+    Returns a compact list of packed moves.
+
+    @param moves:   Packed moves to start with.
+    @return:        array('H').
+    """
+    return array('H', moves)
@@ -0,0 +1,176 @@
+#!/usr/bin/python
+
+"""
+Computer opponent that searches on several processor cores.
+
+Python runs one thread at a time, so the search is spread over worker
+processes instead (Lazy SMP). Every worker searches the same position
+with its own Engine, but they share a single transposition table placed
+in shared memory, so each one benefits from what the others have found.
+Helpers begin their iterations at staggered depths and try equally
+promising root moves in different orders, so that they fill the table
+with different parts of the tree.
+
+The first worker is the main one: when it finishes, the helpers are
+told to stop, and the result from the deepest completed search is used.
+"""
+import ctypes
+import multiprocessing
+import multiprocessing.sharedctypes
+
+import engine
+import moves
+import position
+import transposition
+
+#Table and stop flag shared by the worker processes (set in each worker)
+_sharedStorage = None
+_sharedStop = None
+
+def _initWorker(storage, stop):
+    """
+    Runs in each worker process when it starts.
+    """
+    global _sharedStorage, _sharedStop
+    _sharedStorage = storage
+    _sharedStop = stop
+
+def _searchWorker(snapshot, player, worker, maxDepth, timeLimit, budget):
+    """
+    Searches a position in a worker process.
+
+    @param snapshot:    Pieces on the board (see Board.snapshot()).
+    @param player:      Player to move.
+    @param worker:      Worker number. Worker 0 is the main search.
+    @param budget:      Search time, as for Engine.search().
+    @return:            Tuple (move, score, depth completed, nodes searched).
+    """
+    board = position.Position(snapshot, player).toBoard()
+
+    table = transposition.TranspositionTable(storage=_sharedStorage)
+    if worker == 0:
+        searcher = engine.Engine(maxDepth, timeLimit, table)
+    else:
+        searcher = engine.Engine(maxDepth, timeLimit, table,
+                                 startDepth=1 + worker % 2, seed=worker,
+                                 stop=_sharedStop)
+
+    move, score = searcher.search(board, player, budget)
+    return move, score, searcher.getDepth(), searcher.getNodes()
+
+class ParallelEngine(object):
+    def __init__(self, workers=None, maxDepth=64, timeLimit=None, sizeMB=64, book=None,
+                 tablebases=None):
+        """
+        Creates an engine. Worker processes are started on first use.
+
+        @param workers:     Number of worker processes, or None for one
+                            per processor core.
+        @param maxDepth:    Deepest search, in plies.
+        @param timeLimit:   Seconds to spend on each move, or None to
+                            always search to maxDepth.
+        @param sizeMB:      Memory limit for the shared transposition table,
+                            in megabytes.
+        @param book:        Optional OpeningBook (see book.py). Book
+                            moves are played without searching.
+        @param tablebases:  Optional Tablebases (see tablebase.py). Positions
+                            they hold are played from them without searching.
+        """
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+
+        self._workers = workers
+        self._maxDepth = maxDepth
+        self._timeLimit = timeLimit
+        self._book = book
+        self._tablebases = tablebases
+
+        words = transposition.storageWords(sizeMB)
+        self._storage = multiprocessing.sharedctypes.RawArray(ctypes.c_uint64, words)
+        self._stop = multiprocessing.sharedctypes.RawValue(ctypes.c_int, 0)
+        self._pool = None
+        self._nodes = 0
+        self._completedDepth = 0
+
+    def getNodes(self):
+        """
+        Returns the number of positions visited by all workers in the
+        last search.
+        """
+        return self._nodes
+
+    def getDepth(self):
+        """
+        Returns the depth reached by the last search.
+        """
+        return self._completedDepth
+
+    def chooseMove(self, board, player, clock=None):
+        """
+        Picks a move for a player.
+
+        @param board:   The game board (a Board instance). It is left unchanged.
+        @param player:  Player to move (e.g. constants.WHITE_PLAYER).
+        @param clock:   Optional Clock (see clock.py) with the player's
+                        time running. The search is fitted to their
+                        time left.
+        @return:        Best move found (e.g. [1, 0, 2, 2]), or None if
+                        the player has no legal move.
+        """
+        if self._book is not None:
+            move = self._book.chooseMove(board, player)
+            if move is not None:
+                return moves.toList(move)
+        if self._tablebases is not None:
+            move = self._tablebases.bestMove(board, player)
+            if move is not None:
+                return moves.toList(move)
+        budget = None
+        if clock is not None:
+            budget = clock.budget(player)
+        return self.search(board, player, budget)[0]
+
+    def search(self, board, player, budget=None):
+        """
+        Searches a position on every worker.
+
+        @param board:   The game board (a Board instance). It is left unchanged.
+        @param player:  Player to move (e.g. constants.WHITE_PLAYER).
+        @param budget:  Optional search time, as for Engine.search().
+        @return:        Tuple (best move, score in centipawns from player's
+                        point of view).
+        """
+        if self._pool is None:
+            self._pool = multiprocessing.Pool(self._workers, _initWorker,
+                                              (self._storage, self._stop))
+
+        snapshot = board.snapshot()
+        self._stop.value = 0
+        pending = [self._pool.apply_async(_searchWorker,
+                                          (snapshot, player, worker,
+                                           self._maxDepth, self._timeLimit, budget))
+                   for worker in range(self._workers)]
+
+        #Helpers stop as soon as the main search is done
+        results = [pending[0].get()]
+        self._stop.value = 1
+        results += [result.get() for result in pending[1:]]
+
+        #Prefer the deepest search, and the main one among equals
+        best = results[0]
+        for result in results[1:]:
+            if result[0] is not None and result[2] > best[2]:
+                best = result
+
+        self._nodes = sum(result[3] for result in results)
+        self._completedDepth = best[2]
+        return best[0], best[1]
+
+    def close(self):
+        """
+        Stops the worker processes.
+        """
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
@@ -0,0 +1,140 @@
+#!/usr/bin/python
+
+"""
+Perft: counts the leaf nodes of the legal move tree to a fixed depth.
+
+Perft checks move generation against known node counts and measures its
+speed. For example:
+
+ $ ./perft.py --depth 4
+ $ ./perft.py --depth 3 --divide --fen "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - -"
+ $ ./perft.py --suite
+
+The reference counts below follow this game's rules, which have no
+castling, en passant or promotion. Positions and depths were chosen
+where those moves cannot occur, or the counts were adjusted for them.
+"""
+import argparse
+import sys
+import time
+
+import constants
+import fen
+import moves
+
+#(name, FEN, node counts for depth 1, 2, ...)
+REFERENCE_POSITIONS = [
+    ("start", fen.STARTING_FEN,
+     [20, 400, 8902, 197281]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w - - 0 1",
+     [46, 1865, 86585]),
+    ("endgame", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     [14, 191, 2810, 43087, 671300]),
+]
+
+def _otherPlayer(player):
+    if player == constants.WHITE_PLAYER:
+        return constants.BLACK_PLAYER
+    return constants.WHITE_PLAYER
+
+def perft(board, player, depth):
+    """
+    Counts the leaf nodes of the legal move tree.
+
+    @param board:   The game board (a Board instance). It is left unchanged.
+    @param player:  Player to move (e.g. constants.WHITE_PLAYER).
+    @param depth:   Number of plies to search.
+    @return:        Number of move sequences of the given length.
+    """
+    if depth == 0:
+        return 1
+
+    moveList = board.getLegalMoves(player)
+    if depth == 1:
+        return len(moveList)
+
+    nodes = 0
+    opponent = _otherPlayer(player)
+    for move in moveList:
+        board.makeMove(move)
+        nodes += perft(board, opponent, depth - 1)
+        board.unmakeMove()
+    return nodes
+
+def divide(board, player, depth):
+    """
+    Counts the leaf nodes below each legal move.
+
+    @param board:   The game board (a Board instance). It is left unchanged.
+    @param player:  Player to move (e.g. constants.WHITE_PLAYER).
+    @param depth:   Number of plies to search, including the first move.
+    @return:        List of (packed move, node count) tuples.
+    """
+    results = []
+    opponent = _otherPlayer(player)
+    for move in board.getLegalMoves(player):
+        board.makeMove(move)
+        results.append((move, perft(board, opponent, depth - 1)))
+        board.unmakeMove()
+    return results
+
+def _timedPerft(fenString, depth, showDivide):
+    """
+    Runs perft on a position, printing the result and speed.
+
+    @return:    Number of leaf nodes.
+    """
+    board, player = fen.boardFromFen(fenString)
+    start = time.time()
+    if showDivide:
+        nodes = 0
+        for move, count in divide(board, player, depth):
+            print("%s: %d" % (moves.toText(move), count))
+            nodes += count
+    else:
+        nodes = perft(board, player, depth)
+    elapsed = max(time.time() - start, 1e-9)
+
+    print("depth %d: %d nodes in %.3fs (%d nodes/s)" % (depth, nodes, elapsed, nodes / elapsed))
+    return nodes
+
+def runSuite(maxDepth):
+    """
+    Runs perft on every reference position up to a depth, comparing
+    against the known counts.
+
+    @param maxDepth:    Deepest depth to check.
+    @return:            True if every count matched, False otherwise.
+    """
+    passed = True
+    for name, fenString, counts in REFERENCE_POSITIONS:
+        for depth, expected in enumerate(counts[:maxDepth], 1):
+            print("%s (%s)" % (name, fenString))
+            nodes = _timedPerft(fenString, depth, False)
+            if nodes != expected:
+                print("MISMATCH: expected %d" % expected)
+                passed = False
+    return passed
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Count move tree leaf nodes.")
+    parser.add_argument("--depth", type=int, default=3,
+                        help="number of plies to search (default 3)")
+    parser.add_argument("--fen", default=fen.STARTING_FEN,
+                        help="position to search (default: starting position)")
+    parser.add_argument("--divide", action="store_true",
+                        help="show the node count below each first move")
+    parser.add_argument("--suite", action="store_true",
+                        help="check the reference positions up to --depth")
+    args = parser.parse_args(argv)
+
+    if args.suite:
+        if runSuite(args.depth):
+            return 0
+        return 1
+
+    _timedPerft(args.fen, args.depth, args.divide)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,363 @@
+#!/usr/bin/python
+
+"""
+Streaming import of games in Portable Game Notation (PGN).
+
+The archive is memory-mapped and read one game at a time, so files of
+any size can be imported without loading them into memory. Every move
+is checked against the board's rules as the game is replayed. Games
+may start from a position given by a FEN tag.
+
+This game has no castling, en passant or promotion, so games that use
+them are reported as errors at that move. For example:
+
+ $ ./pgn.py games.pgn
+ $ ./pgn.py games.pgn --workers 8 --positions > positions.fen
+
+With several workers, the file is split into chunks at game boundaries
+and the chunks are replayed by a pool of processes.
+"""
+import argparse
+import collections
+import mmap
+import multiprocessing
+import re
+import sys
+import time
+
+import constants
+import bitboard
+import fen
+import moves
+
+#Bytes of the archive handed to a worker at a time
+CHUNK_SIZE = 4 << 20
+
+_PIECE_LETTERS = {'K': constants.KING, 'Q': constants.QUEEN, 'R': constants.ROOK,
+                  'B': constants.BISHOP, 'N': constants.KNIGHT}
+
+_PIECE_NAMES = dict((pieceType, letter) for letter, pieceType in _PIECE_LETTERS.items())
+
+_SAN = re.compile(r"^([KQRBN])?([a-h])?([1-8])?x?([a-h][1-8])(=?[QRBN])?[+#]?[!?]*$")
+_TAG = re.compile(r'^\[(\w+)\s+"((?:[^"\\]|\\.)*)"\]')
+_RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+
+class ImportedGame(object):
+    """
+    A game read from a PGN archive.
+
+    tags:   Dictionary of the game's tags (e.g. {"White": "Carlsen"}).
+    fen:    FEN of the starting position.
+    moves:  array('H') of the packed moves replayed (see moves.py).
+    result: Result given in the movetext (e.g. "1-0"), or None.
+    error:  Why replaying stopped early, or None if every move was legal.
+    """
+    __slots__ = ("tags", "fen", "moves", "result", "error")
+
+    def __init__(self, tags, startFen):
+        self.tags = tags
+        self.fen = startFen
+        self.moves = moves.moveList()
+        self.result = None
+        self.error = None
+
+def _otherPlayer(player):
+    if player == constants.WHITE_PLAYER:
+        return constants.BLACK_PLAYER
+    return constants.WHITE_PLAYER
+
+def sanToMove(board, player, san):
+    """
+    Finds the legal move described in Standard Algebraic Notation.
+
+    @param board:   The game board (a Board instance).
+    @param player:  Player to move (e.g. constants.WHITE_PLAYER).
+    @param san:     Move in SAN (e.g. "Nbd7" or "exd5+").
+    @return:        Packed move (see moves.py).
+    @raise ValueError:  If the move is not legal, is ambiguous, or
+                        needs rules the game does not have.
+    """
+    if san.rstrip("+#!?") in ("O-O", "O-O-O", "0-0", "0-0-0"):
+        raise ValueError("castling is not supported: %s" % san)
+    match = _SAN.match(san)
+    if match is None:
+        raise ValueError("not a move: %s" % san)
+    letter, fromCol, fromRow, target, promotion = match.groups()
+    if promotion:
+        raise ValueError("promotion is not supported: %s" % san)
+
+    pieceType = _PIECE_LETTERS.get(letter, constants.PAWN)
+    if player == constants.BLACK_PLAYER:
+        pieceType |= constants.BLACK_PIECE
+    toCol, toRow = bitboard.location(moves.squareIndex(target))
+
+    #A pawn that does not capture stays on its file
+    if pieceType & constants.PIECE_TYPE_MASK == constants.PAWN and fromCol is None:
+        fromCol = target[0]
+
+    candidates = board.getBitboard(pieceType)
+    if fromCol is not None:
+        candidates &= bitboard.FILES["abcdefgh".index(fromCol)]
+    if fromRow is not None:
+        candidates &= bitboard.RANKS[int(fromRow) - 1]
+
+    found = None
+    for fromSq in bitboard.squares(candidates):
+        col, row = bitboard.location(fromSq)
+        if board.isLegalMove(player, [col, row, toCol, toRow]):
+            if found is not None:
+                raise ValueError("ambiguous move: %s" % san)
+            found = moves.pack(fromSq, bitboard.square(toCol, toRow))
+
+    if found is None:
+        raise ValueError("illegal move: %s" % san)
+    return found
+
+def moveToSan(board, player, move):
+    """
+    Describes a legal move in Standard Algebraic Notation.
+
+    @param board:   The game board (a Board instance). It is left unchanged.
+    @param player:  Player to move (e.g. constants.WHITE_PLAYER).
+    @param move:    Packed move (see moves.py).
+    @return:        Move in SAN (e.g. "Nbd7" or "exd5+").
+    """
+    fromSq = moves.fromSquare(move)
+    toSq = moves.toSquare(move)
+    pieceType = board.getPiece(fromSq) & constants.PIECE_TYPE_MASK
+    capture = board.getPiece(toSq) != constants.EMPTY
+    fromName = moves.SQUARE_NAMES[fromSq]
+
+    if pieceType == constants.PAWN:
+        san = fromName[0] + "x" if capture else ""
+    else:
+        san = _PIECE_NAMES[pieceType]
+
+        #Name the file, rank or square if another such piece could move there
+        rivals = [moves.fromSquare(other) for other in board.getLegalMoves(player)
+                  if moves.toSquare(other) == toSq and other != move and
+                  board.getPiece(moves.fromSquare(other)) & constants.PIECE_TYPE_MASK == pieceType]
+        if rivals:
+            names = [moves.SQUARE_NAMES[sq] for sq in rivals]
+            if all(name[0] != fromName[0] for name in names):
+                san += fromName[0]
+            elif all(name[1] != fromName[1] for name in names):
+                san += fromName[1]
+            else:
+                san += fromName
+        if capture:
+            san += "x"
+    san += moves.SQUARE_NAMES[toSq]
+
+    board.makeMove(move)
+    try:
+        opponent = _otherPlayer(player)
+        if board.getCheckers(opponent):
+            if len(board.getLegalMoves(opponent)):
+                san += "+"
+            else:
+                san += "#"
+    finally:
+        board.unmakeMove()
+    return san
+
+def _movetextTokens(movetext):
+    """
+    Yields the moves and result in a game's movetext, skipping move
+    numbers, comments, annotations and variations.
+    """
+    depth = 0
+    for token in re.findall(r"\{[^}]*\}?|;[^\n]*|\(|\)|[^\s(){};]+", movetext):
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth -= 1
+        elif depth or token[0] in "{;$":
+            continue
+        elif token in _RESULTS:
+            yield token
+        else:
+            #Strip move numbers (e.g. "12." or "12...e5")
+            token = token.lstrip("0123456789").lstrip(".")
+            if token:
+                yield token
+
+def replayGame(tags, movetext):
+    """
+    Replays one game, checking every move.
+
+    @param tags:        Dictionary of the game's tags.
+    @param movetext:    The game's moves as PGN movetext.
+    @return:            An ImportedGame.
+    """
+    startFen = tags.get("FEN", fen.STARTING_FEN)
+    game = ImportedGame(tags, startFen)
+    try:
+        board, player = fen.boardFromFen(startFen)
+    except ValueError as error:
+        game.error = str(error)
+        return game
+    for king in (constants.KING, constants.BLACK_PIECE | constants.KING):
+        if bitboard.popCount(board.getBitboard(king)) != 1:
+            game.error = "each side needs one king: %s" % startFen
+            return game
+
+    for token in _movetextTokens(movetext):
+        if token in _RESULTS:
+            game.result = token
+            break
+        try:
+            move = sanToMove(board, player, token)
+        except ValueError as error:
+            game.error = "ply %d: %s" % (len(game.moves) + 1, error)
+            break
+        board.movePiece(player, move)
+        game.moves.append(move)
+        player = _otherPlayer(player)
+    return game
+
+def _readGames(archive, start, end):
+    """
+    Yields (tags, movetext) for each game starting between two offsets
+    of a memory-mapped archive.
+    """
+    archive.seek(start)
+    tags = {}
+    movetext = []
+    while archive.tell() < end:
+        line = archive.readline()
+        stripped = line.strip()
+        if stripped.startswith(b"["):
+            #A tag after movetext starts the next game
+            if movetext:
+                yield tags, b"\n".join(movetext)
+                tags, movetext = {}, []
+            match = _TAG.match(stripped)
+            if match:
+                tags[match.group(1)] = re.sub(r"\\(.)", r"\1", match.group(2))
+        elif stripped and not stripped.startswith(b"%"):
+            movetext.append(stripped)
+
+    if movetext or tags:
+        yield tags, b"\n".join(movetext)
+
+def _chunks(archive, chunkSize):
+    """
+    Splits an archive into (start, end) ranges that begin at games.
+    """
+    size = len(archive)
+    start = 0
+    while start < size:
+        end = archive.find(b"\n[Event ", start + chunkSize)
+        if end < 0:
+            end = size
+        else:
+            end += 1
+        yield start, end
+        start = end
+
+def _open(path):
+    archive = open(path, "rb")
+    try:
+        return archive, mmap.mmap(archive.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+        #Empty files cannot be mapped
+        archive.close()
+        return None, None
+
+def _importChunk(path, start, end):
+    """
+    Replays the games in one chunk of an archive (in a worker process).
+
+    @return:    List of ImportedGame.
+    """
+    archive, mapped = _open(path)
+    try:
+        return [replayGame(tags, movetext) for tags, movetext in _readGames(mapped, start, end)]
+    finally:
+        mapped.close()
+        archive.close()
+
+def importGames(path, workers=1, chunkSize=CHUNK_SIZE):
+    """
+    Reads and replays every game in a PGN archive, a game at a time.
+
+    @param path:        Archive file name.
+    @param workers:     Number of processes to replay games with.
+    @param chunkSize:   Bytes of the archive given to a worker at a time.
+    @return:            Generator of ImportedGame, in archive order.
+    """
+    archive, mapped = _open(path)
+    if mapped is None:
+        return
+    try:
+        if workers <= 1:
+            for tags, movetext in _readGames(mapped, 0, len(mapped)):
+                yield replayGame(tags, movetext)
+            return
+
+        #Keep a few chunks per worker in flight, so memory use stays
+        #bounded however far the reader falls behind
+        pool = multiprocessing.Pool(workers)
+        try:
+            pending = collections.deque()
+            for start, end in _chunks(mapped, chunkSize):
+                pending.append(pool.apply_async(_importChunk, (path, start, end)))
+                if len(pending) >= 2 * workers:
+                    for game in pending.popleft().get():
+                        yield game
+            while pending:
+                for game in pending.popleft().get():
+                    yield game
+        finally:
+            pool.terminate()
+            pool.join()
+    finally:
+        mapped.close()
+        archive.close()
+
+def gamePositions(game):
+    """
+    Yields the FEN of every position in an imported game, starting with
+    the starting position.
+    """
+    board, player = fen.boardFromFen(game.fen)
+    yield fen.boardToFen(board, player)
+    for move in game.moves:
+        board.movePiece(player, move)
+        player = _otherPlayer(player)
+        yield fen.boardToFen(board, player)
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Replay and check the games in a PGN file.")
+    parser.add_argument("path", help="PGN file")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="processes to replay games with (default 1)")
+    parser.add_argument("--positions", action="store_true",
+                        help="print the FEN of every position reached")
+    parser.add_argument("--errors", action="store_true",
+                        help="report each game that could not be replayed")
+    args = parser.parse_args(argv)
+
+    count = 0
+    failed = 0
+    plies = 0
+    start = time.time()
+    for game in importGames(args.path, args.workers):
+        count += 1
+        plies += len(game.moves)
+        if game.error is not None:
+            failed += 1
+            if args.errors:
+                sys.stderr.write("game %d: %s\n" % (count, game.error))
+        if args.positions:
+            for position in gamePositions(game):
+                sys.stdout.write(position + "\n")
+
+    elapsed = max(time.time() - start, 1e-9)
+    sys.stderr.write("%d games (%d with errors), %d moves in %.3fs (%.0f games/s)\n" %
+                     (count, failed, plies, elapsed, count / elapsed))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,140 @@
+#!/usr/bin/python
+
+"""
+Compact positions for holding many boards in memory at once.
+
+A Board keeps bitboards, attack sets and an undo stack so that moves can
+be generated and made quickly, which costs a few kilobytes per board. A
+Position keeps only what is needed to set up a Board again: the piece
+code on each square (see constants.py) in a 64-byte bytearray, and the
+player to move. It has no instance dictionary, and copying it copies a
+single 64-byte buffer.
+
+Positions can also be written to, and read from, a shared buffer of
+fixed-size records (e.g. a multiprocessing RawArray or an mmap), so
+that other processes can read them through a memoryview without
+pickling.
+"""
+import constants
+from board import Board
+
+#Bytes per position record in a buffer: 64 squares, then the player
+RECORD_SIZE = 65
+
+class Position(object):
+    __slots__ = ("_squares", "_player")
+
+    def __init__(self, squares, player=constants.WHITE_PLAYER):
+        """
+        Creates a position.
+
+        @param squares: 64 piece codes indexed by square (a1 first), as
+                        returned by Board.snapshot(). Any buffer will do;
+                        it is copied.
+        @param player:  Player to move (e.g. constants.WHITE_PLAYER).
+        """
+        self._squares = bytearray(squares)
+        if len(self._squares) != 64:
+            raise ValueError("a position holds 64 squares, not %d" % len(self._squares))
+        if player not in (constants.WHITE_PLAYER, constants.BLACK_PLAYER):
+            raise ValueError("invalid player %r" % (player,))
+        self._player = player
+
+    @classmethod
+    def fromBoard(cls, board, player):
+        """
+        Creates a position from a board.
+
+        @param board:   The game board (a Board instance).
+        @param player:  Player to move (e.g. constants.WHITE_PLAYER).
+        @return:        A Position.
+        """
+        return cls(board.snapshot(), player)
+
+    @classmethod
+    def fromBuffer(cls, buffer, index=0):
+        """
+        Reads a position written by writeTo().
+
+        @param buffer:  Object supporting the buffer interface.
+        @param index:   Record number within the buffer.
+        @return:        A Position.
+        """
+        view = memoryview(buffer)
+        start = index * RECORD_SIZE
+        record = bytearray(view[start:start + RECORD_SIZE])
+        return cls(record[:64], record[64])
+
+    def writeTo(self, buffer, index=0):
+        """
+        Writes the position into a writable buffer as one record.
+
+        @param buffer:  Writable object supporting the buffer interface,
+                        at least (index + 1) * RECORD_SIZE bytes long.
+        @param index:   Record number within the buffer.
+        """
+        view = memoryview(buffer)
+        start = index * RECORD_SIZE
+        view[start:start + RECORD_SIZE] = bytes(self._squares + bytearray([self._player]))
+
+    def getPlayer(self):
+        """
+        Returns the player to move.
+        """
+        return self._player
+
+    def getPiece(self, sq):
+        """
+        Returns the piece on a square.
+
+        @param sq:  Square index (see bitboard.square()).
+        @return:    Piece code (see constants.py), or constants.EMPTY.
+        """
+        return self._squares[sq]
+
+    def getBoard(self):
+        """
+        Returns the position's pieces as list of lists of piece symbols
+        (see Board.getBoard()).
+        """
+        symbols = constants.PIECE_SYMBOLS
+        return [[symbols[self._squares[row * 8 + col]] for row in range(8)]
+                for col in range(8)]
+
+    def snapshot(self):
+        """
+        Returns the pieces as 64 bytes (see Board.snapshot()).
+        """
+        return bytes(self._squares)
+
+    def toBoard(self):
+        """
+        Sets up a Board holding this position.
+
+        @return:    A new Board instance.
+        """
+        board = Board.__new__(Board)
+        board.restore(self._squares)
+        return board
+
+    def __eq__(self, other):
+        if not isinstance(other, Position):
+            return NotImplemented
+        return self._player == other._player and self._squares == other._squares
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        if equal is NotImplemented:
+            return equal
+        return not equal
+
+    def __hash__(self):
+        return hash((bytes(self._squares), self._player))
+
+    def __getstate__(self):
+        return bytes(self._squares), self._player
+
+    def __setstate__(self, state):
+        squares, player = state
+        self._squares = bytearray(squares)
+        self._player = player
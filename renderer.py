@@ -0,0 +1,71 @@
+#!/usr/bin/python
+
+"""
+Ways of showing a game.
+
+The game shows the board once per turn, optionally with text above it
+(e.g. the welcome text) or below it (e.g. the result). Each renderer
+builds the whole screen as one string and writes it at once:
+
+ NullRenderer   Shows nothing, for games between computers and other
+                runs where no one is watching.
+ TextRenderer   Writes each screen after the last, for logs and pipes.
+ AnsiRenderer   Clears the terminal before each screen with an escape
+                code, in the same write.
+"""
+import sys
+
+#Moves the cursor to the top left and clears the terminal
+_CLEAR_SCREEN = "\x1b[H\x1b[2J"
+
+class NullRenderer(object):
+    def showBoard(self, board, header=None, footer=None):
+        """
+        Shows nothing.
+        """
+        pass
+
+class TextRenderer(object):
+    def __init__(self, stream=None):
+        """
+        Creates a renderer.
+
+        @param stream:  File to write to, or None for standard output.
+        """
+        self._stream = stream
+
+    def _frame(self, board, header, footer):
+        parts = []
+        if header is not None:
+            parts.append(header)
+        parts.append(board.formatBoard())
+        if footer is not None:
+            parts.append(footer)
+        return "\n".join(parts) + "\n"
+
+    def showBoard(self, board, header=None, footer=None):
+        """
+        Shows the board in a single write.
+
+        @param board:   The game board (a Board instance).
+        @param header:  Optional text to show above the board.
+        @param footer:  Optional text to show below the board.
+        """
+        stream = self._stream
+        if stream is None:
+            stream = sys.stdout
+        stream.write(self._frame(board, header, footer))
+        stream.flush()
+
+class AnsiRenderer(TextRenderer):
+    def _frame(self, board, header, footer):
+        return _CLEAR_SCREEN + TextRenderer._frame(self, board, header, footer)
+
+def defaultRenderer():
+    """
+    Returns an AnsiRenderer if standard output is a terminal, or a
+    TextRenderer otherwise.
+    """
+    if sys.stdout.isatty():
+        return AnsiRenderer()
+    return TextRenderer()
@@ -0,0 +1,226 @@
+#!/usr/bin/python
+
+"""
+Saved games in a compact binary format.
+
+A saved game holds everything needed to carry on playing: the piece
+code on each square (see constants.py), the player to move, the game's
+number in the move log, whether the game is over, the clocks (see
+clock.py) and every move played so far (see moves.py):
+
+ header      9 bytes     b"CHESSSAV" and the format version
+ state       7 bytes     game number, player to move, number of moves
+ status      1 byte      the game's status (see Game.getStatus())
+ clock       23 bytes    1 if the game is played on a clock (else 0 and
+                         the rest is unused), the time control's base
+                         time and increment in milliseconds and moves
+                         per period (0 for none), then for white and
+                         black the milliseconds left and the moves made
+                         in the current period
+ squares     64 bytes    piece codes, a1 first (see Board.snapshot())
+ moves       2 bytes     per packed move, little-endian
+
+Files from before clocks were saved (format version 1) have no status
+or clock part, and are read as games in progress without a clock.
+
+The whole file is read at once and the board is set up straight from
+the squares, so resuming a game takes the same time however many moves
+have been played. Files are replaced in one step, so a crash while
+saving leaves the previous save intact. For example:
+
+ $ ./savegame.py game.sav
+"""
+import argparse
+import os
+import struct
+import sys
+import tempfile
+from array import array
+
+import clock
+import constants
+import fen
+import moves
+from position import Position
+
+#Start of every saved game; the last byte is the format version
+_MAGIC = b"CHESSSAV"
+_VERSION = 2
+_HEADER = _MAGIC + chr(_VERSION)
+
+#Game number, player to move, number of moves
+_STATE = struct.Struct("<IBH")
+
+#Status of the game
+_STATUS = struct.Struct("<B")
+
+#On a clock or not; base time, increment and moves per period; then
+#time left and moves in the period for white and for black
+_CLOCK = struct.Struct("<BIIHIHIH")
+
+#Largest number of milliseconds stored
+_MAX_MILLISECONDS = 0xFFFFFFFF
+
+def _milliseconds(seconds):
+    return min(max(int(round(seconds * 1000)), 0), _MAX_MILLISECONDS)
+
+_SWAP_BYTES = sys.byteorder != "little"
+
+class SavedGame(object):
+    """
+    A game read from a file.
+
+    squares:    64 piece codes indexed by square (a bytearray).
+    player:     Player to move (e.g. constants.WHITE_PLAYER).
+    history:    array('H') of the packed moves played, in order.
+    gameId:     Number identifying the game in the move log.
+    clock:      Stopped Clock (see clock.py) holding each player's time
+                left, or None if the game is not played on a clock.
+    status:     The game's status when it was saved (see
+                Game.getStatus()).
+    """
+    __slots__ = ("squares", "player", "history", "gameId", "clock", "status")
+
+    def __init__(self, squares, player, history, gameId=0, clock=None, status=0):
+        self.squares = squares
+        self.player = player
+        self.history = history
+        self.gameId = gameId
+        self.clock = clock
+        self.status = status
+
+    def toBoard(self):
+        """
+        Sets up a Board holding the saved position.
+
+        @return:    A new Board instance.
+        """
+        return Position(self.squares, self.player).toBoard()
+
+def _packClock(gameClock):
+    """
+    Packs the time control and each player's time left (the clock part
+    of the file).
+    """
+    if gameClock is None:
+        return _CLOCK.pack(0, 0, 0, 0, 0, 0, 0, 0)
+    control = gameClock.getControl()
+    times = []
+    for player in (constants.WHITE_PLAYER, constants.BLACK_PLAYER):
+        movesMade = 0
+        if control.moves is not None:
+            movesMade = gameClock.getMoves(player) % control.moves
+        times += [_milliseconds(gameClock.remaining(player)), movesMade]
+    return _CLOCK.pack(1, _milliseconds(control.base), _milliseconds(control.increment),
+                       control.moves or 0, *times)
+
+def _unpackClock(data, offset):
+    """
+    Reads the clock part of a file.
+
+    @return:    A stopped Clock, or None.
+    """
+    onClock, base, increment, perPeriod, whiteLeft, whiteMoves, blackLeft, blackMoves = \
+        _CLOCK.unpack_from(data, offset)
+    if not onClock:
+        return None
+    control = clock.TimeControl(base / 1000.0, increment / 1000.0, perPeriod or None)
+    gameClock = clock.Clock(control)
+    gameClock.setTime(constants.WHITE_PLAYER, whiteLeft / 1000.0, whiteMoves)
+    gameClock.setTime(constants.BLACK_PLAYER, blackLeft / 1000.0, blackMoves)
+    return gameClock
+
+def save(path, board, player, history, gameId=0, gameClock=None, status=0):
+    """
+    Saves a game, replacing any file already at path.
+
+    @param path:        File name.
+    @param board:       The game board (a Board instance).
+    @param player:      Player to move (e.g. constants.WHITE_PLAYER).
+    @param history:     Packed moves played so far (see moves.py).
+    @param gameId:      Number identifying the game in the move log.
+    @param gameClock:   Clock the game is played on (see clock.py), or
+                        None. The time left is saved to the millisecond,
+                        counting any that has run down for the player
+                        to move.
+    @param status:      The game's status (see Game.getStatus()), so
+                        that a game lost on time stays lost.
+    """
+    if player not in (constants.WHITE_PLAYER, constants.BLACK_PLAYER):
+        raise ValueError("invalid player %r" % (player,))
+    history = moves.moveList(history)
+    if _SWAP_BYTES:
+        history.byteswap()
+    data = _HEADER + _STATE.pack(gameId, player, len(history)) + _STATUS.pack(status) + \
+           _packClock(gameClock) + board.snapshot() + history.tostring()
+
+    #Write a temporary file beside the save, then move it into place
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temporary = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        written = 0
+        while written < len(data):
+            written += os.write(fd, data[written:])
+        os.close(fd)
+        fd = None
+        os.rename(temporary, path)
+    except:
+        if fd is not None:
+            os.close(fd)
+        os.remove(temporary)
+        raise
+
+def load(path):
+    """
+    Reads a game written by save().
+
+    @param path:    File name.
+    @return:        A SavedGame.
+    @raise ValueError:  If the file is not a saved game.
+    """
+    with open(path, "rb") as saved:
+        data = saved.read()
+
+    if data[:len(_MAGIC)] != _MAGIC or len(data) < len(_HEADER) or \
+       ord(data[len(_MAGIC)]) not in (1, _VERSION):
+        raise ValueError("%s is not a saved game" % path)
+    version = ord(data[len(_MAGIC)])
+    start = len(_HEADER) + _STATE.size
+    if version > 1:
+        start += _STATUS.size + _CLOCK.size
+    if len(data) < start + 64:
+        raise ValueError("%s is not a saved game" % path)
+    gameId, player, count = _STATE.unpack_from(data, len(_HEADER))
+    if player not in (constants.WHITE_PLAYER, constants.BLACK_PLAYER):
+        raise ValueError("%s is not a saved game" % path)
+    if len(data) != start + 64 + 2 * count:
+        raise ValueError("%s holds %d bytes of moves, not %d" %
+                         (path, len(data) - start - 64, 2 * count))
+
+    gameClock = None
+    status = 0
+    if version > 1:
+        status, = _STATUS.unpack_from(data, len(_HEADER) + _STATE.size)
+        gameClock = _unpackClock(data, len(_HEADER) + _STATE.size + _STATUS.size)
+    history = array('H', data[start + 64:])
+    if _SWAP_BYTES:
+        history.byteswap()
+    return SavedGame(bytearray(data[start:start + 64]), player, history, gameId, gameClock,
+                     status)
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Print a saved game.")
+    parser.add_argument("path", help="saved game file name")
+    args = parser.parse_args(argv)
+
+    saved = load(args.path)
+    print("game %d, %d moves: %s" % (saved.gameId, len(saved.history),
+                                     " ".join(moves.toText(move) for move in saved.history)))
+    print(fen.boardToFen(saved.toBoard(), saved.player))
+    if saved.clock is not None:
+        print("white %s, black %s" % (clock.formatTime(saved.clock.remaining(constants.WHITE_PLAYER)),
+                                      clock.formatTime(saved.clock.remaining(constants.BLACK_PLAYER))))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,280 @@
+#!/usr/bin/python
+
+"""
+Server hosting many games at once over TCP.
+
+Every connection is handled by one event loop in a single process, so
+thousands of games can be played at the same time without a process or
+thread each. Players are paired as they connect: the first to wait
+plays white. Messages are lines of text:
+
+ From the player:
+  b1c3      Move a piece, as in the terminal game.
+  board     Ask for the position (answered with "board <FEN>").
+  new       Wait for another game once one has ended.
+  quit      Leave, resigning any game in progress.
+
+ From the server:
+  wait                      Waiting for an opponent.
+  start <colour> <game>     A game has started, and this player plays
+                            white or black. The game's number is the
+                            one it is recorded under in the move log.
+  move <move>               A move was played (by either player).
+  end <result> <reason>     The game is over. The result is white, black
+                            or draw, and the reason checkmate, stalemate,
+                            repetition, fifty-moves, material, resigned or
+                            disconnected.
+  error <text>              The last line was not accepted.
+
+For example:
+
+ $ ./server.py --port 8023 --log games.log
+ $ nc localhost 8023
+"""
+import argparse
+import asynchat
+import asyncore
+import socket
+import sys
+
+import constants
+import fen
+from game import Game, parseMove, IN_PROGRESS, CHECKMATE, DRAW, REPETITION, FIFTY_MOVES, \
+    MATERIAL
+from movelog import MoveLog, newGameId
+
+#Longest line accepted from a player
+_MAX_LINE = 256
+
+_COLOURS = {constants.WHITE_PLAYER: "white", constants.BLACK_PLAYER: "black"}
+
+#Reason sent for each kind of draw (see Game.getDrawReason())
+_DRAW_REASONS = {REPETITION: b"repetition", FIFTY_MOVES: b"fifty-moves", MATERIAL: b"material"}
+
+_OPPONENT = {constants.WHITE_PLAYER: constants.BLACK_PLAYER,
+             constants.BLACK_PLAYER: constants.WHITE_PLAYER}
+
+class _Session(asynchat.async_chat):
+    """
+    One connected player.
+    """
+    def __init__(self, server, sock):
+        asynchat.async_chat.__init__(self, sock, map=server._socketMap)
+        self.set_terminator(b"\n")
+        self._server = server
+        self._incoming = []
+        self._length = 0
+        self._hangingUp = False
+
+        #Game being played, which side, and the other player's session
+        self.game = None
+        self.player = None
+        self.opponent = None
+
+    def tell(self, line):
+        """
+        Sends a line to the player.
+        """
+        self.push(line + b"\n")
+
+    def collect_incoming_data(self, data):
+        if self._hangingUp:
+            return
+        self._length += len(data)
+        if self._length > _MAX_LINE:
+            #Drop the line, and anything after it, and hang up once the
+            #error has been sent
+            self._incoming = []
+            self._length = 0
+            self._hangingUp = True
+            self.tell(b"error line too long")
+            self._server._leave(self, b"disconnected")
+            self.close_when_done()
+            return
+        self._incoming.append(data)
+
+    def found_terminator(self):
+        if self._hangingUp:
+            return
+        line = b"".join(self._incoming).strip()
+        self._incoming = []
+        self._length = 0
+        self._server._handleLine(self, line)
+
+    def handle_close(self):
+        self._server._leave(self, b"disconnected")
+        self.close()
+
+class GameServer(asyncore.dispatcher):
+    def __init__(self, host="127.0.0.1", port=8023, log=None):
+        """
+        Starts listening for players.
+
+        @param host:    Address to listen on.
+        @param port:    Port to listen on, or 0 for any free port.
+        @param log:     Optional MoveLog (see movelog.py) to record every
+                        game's moves in.
+        """
+        self._socketMap = {}
+        asyncore.dispatcher.__init__(self, map=self._socketMap)
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.set_reuse_addr()
+        self.bind((host, port))
+        self.listen(socket.SOMAXCONN)
+
+        self._log = log
+        self._waiting = None
+
+        #Games are numbered on from a random start, so that servers
+        #sharing a log do not reuse each other's numbers
+        self._nextGameId = newGameId()
+
+    def getAddress(self):
+        """
+        Returns the (host, port) the server is listening on.
+        """
+        return self.socket.getsockname()
+
+    def serve(self, timeout=30.0, count=None):
+        """
+        Handles players until the server is closed.
+
+        @param timeout: Seconds to wait for activity at a time.
+        @param count:   If given, return after this many waits.
+        """
+        asyncore.loop(timeout, use_poll=True, map=self._socketMap, count=count)
+
+    def handle_accept(self):
+        pair = self.accept()
+        if pair is None:
+            return
+        sock, address = pair
+        self._pair(_Session(self, sock))
+
+    def _pair(self, session):
+        """
+        Starts a game for a player if another is waiting.
+        """
+        waiting = self._waiting
+        if waiting is None:
+            self._waiting = session
+            session.tell(b"wait")
+            return
+
+        self._waiting = None
+        gameId = self._nextGameId
+        self._nextGameId = (gameId + 1) & 0xFFFFFFFF
+        game = Game(log=self._log, gameId=gameId)
+        for playerSession, player, opponent in ((waiting, constants.WHITE_PLAYER, session),
+                                                (session, constants.BLACK_PLAYER, waiting)):
+            playerSession.game = game
+            playerSession.player = player
+            playerSession.opponent = opponent
+            playerSession.tell(b"start %s %d" % (_COLOURS[player], gameId))
+
+    def _end(self, session, result, reason):
+        """
+        Tells both players how a game ended and leaves them free to start
+        another.
+        """
+        message = b"end %s %s" % (result, reason)
+        for playerSession in (session, session.opponent):
+            playerSession.tell(message)
+            playerSession.game = None
+            playerSession.player = None
+            playerSession.opponent = None
+
+    def _leave(self, session, reason):
+        """
+        Takes a player out of the waiting list or their game.
+        """
+        if self._waiting is session:
+            self._waiting = None
+        elif session.game is not None:
+            self._end(session, _COLOURS[_OPPONENT[session.player]], reason)
+
+    def _handleLine(self, session, line):
+        if not line:
+            return
+        command = line.lower()
+
+        if command == b"quit":
+            self._leave(session, b"resigned")
+            session.tell(b"bye")
+            session.close_when_done()
+        elif command == b"new":
+            if session.game is not None or self._waiting is session:
+                session.tell(b"error already playing")
+            else:
+                self._pair(session)
+        elif command == b"board":
+            if session.game is None:
+                session.tell(b"error no game")
+            else:
+                game = session.game
+                session.tell(b"board " + fen.boardToFen(game.getBoard(), game.getCurrentPlayer()))
+        else:
+            self._move(session, command)
+
+    def _move(self, session, text):
+        game = session.game
+        move = parseMove(text)
+        if move is None:
+            session.tell(b"error unknown command")
+            return
+        if game is None:
+            session.tell(b"error no game")
+            return
+        if game.getCurrentPlayer() != session.player:
+            session.tell(b"error not your turn")
+            return
+        try:
+            status = game.playMove(move)
+        except ValueError as error:
+            session.tell(b"error " + str(error))
+            return
+
+        session.tell(b"move " + text)
+        session.opponent.tell(b"move " + text)
+        if status == CHECKMATE:
+            self._end(session, _COLOURS[session.player], b"checkmate")
+        elif status == DRAW:
+            self._end(session, b"draw", _DRAW_REASONS[game.getDrawReason()])
+        elif status != IN_PROGRESS:
+            self._end(session, b"draw", b"stalemate")
+
+    def close(self):
+        """
+        Stops listening and disconnects every player.
+        """
+        for channel in list(self._socketMap.values()):
+            if channel is not self:
+                channel.close()
+        asyncore.dispatcher.close(self)
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Host games of chess over TCP.")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="address to listen on (default 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8023,
+                        help="port to listen on (default 8023)")
+    parser.add_argument("--log", metavar="FILE",
+                        help="append every game's moves to a move log (see movelog.py)")
+    args = parser.parse_args(argv)
+
+    log = None
+    if args.log:
+        log = MoveLog(args.log)
+    server = GameServer(args.host, args.port, log)
+    try:
+        server.serve()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        if log is not None:
+            log.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,667 @@
+#!/usr/bin/python
+
+"""
+Endgame tablebases.
+
+A tablebase holds the result of every position with a given set of
+pieces (e.g. KQK: white king and queen against the black king), so that
+those endgames are played perfectly without searching. Tables are
+generated by retrograde analysis: checkmates are found first, then the
+positions one move before them, and so on backwards until no more
+results change. Everything left over is a draw.
+
+Each table is a file of one byte per position, indexed by the square of
+each piece and the player to move, so a probe reads a single byte of a
+memory-mapped file. The byte holds the distance to mate in plies plus
+one (odd if the player to move is mated, even if they mate), 0 for a
+draw, or ILLEGAL.
+
+The tables follow this game's rules, so pawns are never promoted. A
+table with n pieces has 2 * 64 ** n entries, which limits tables to
+MAX_PIECES pieces. On one core, three-piece tables take about twenty
+seconds to generate and four-piece tables about a quarter of an hour.
+Generation can be spread over several processes:
+
+ $ ./tablebase.py generate tables KQK KRK KPK --workers 4
+ $ ./tablebase.py probe tables "8/8/8/4k3/8/8/8/4K2Q w - - 0 1"
+"""
+import argparse
+import mmap
+import multiprocessing
+import os
+import sys
+import tempfile
+from array import array
+
+import constants
+import bitboard
+import fen
+import magic
+import moves
+
+#Results, from the point of view of the player to move
+WIN = 1
+DRAW = 0
+LOSS = -1
+
+#Largest number of pieces in a table, kings included
+MAX_PIECES = 4
+
+#Value of positions that cannot arise (e.g. the player not to move is in check)
+ILLEGAL = 0xFF
+
+#Largest distance to mate that fits in a byte, in plies
+_MAX_DISTANCE = ILLEGAL - 2
+
+#Start of every table file; the last byte is the format version
+_HEADER = b"CHESSTB\x01"
+
+_LETTERS = "KQRBNP"
+_TYPES = [constants.KING, constants.QUEEN, constants.ROOK,
+          constants.BISHOP, constants.KNIGHT, constants.PAWN]
+
+#Pieces in the order they appear in a table's index
+_PIECE_ORDER = _TYPES + [constants.BLACK_PIECE | pieceType for pieceType in _TYPES]
+
+_PLAYERS = [constants.WHITE_PLAYER, constants.BLACK_PLAYER]
+
+#Squares a pawn may move two squares from, and lands on
+_DOUBLE_STEP = {constants.WHITE_PLAYER: (8, bitboard.RANK_4),
+                constants.BLACK_PLAYER: (-8, bitboard.RANK_5)}
+
+def parseMaterial(name):
+    """
+    Reads the pieces of a table from its name (e.g. "KQK" or "KRKN").
+
+    @param name:    White's pieces, then black's, each starting with the king.
+    @return:        Tuple of piece codes in index order.
+    @raise ValueError:  If the name is not a set of pieces.
+    """
+    name = name.upper()
+    split = name.find("K", 1)
+    if not name.startswith("K") or split < 0 or "K" in name[split + 1:] or \
+       any(letter not in _LETTERS for letter in name):
+        raise ValueError("invalid material %r" % name)
+    if len(name) > MAX_PIECES:
+        raise ValueError("tables hold at most %d pieces, not %d" % (MAX_PIECES, len(name)))
+
+    pieces = [_TYPES[_LETTERS.index(letter)] for letter in name[:split]]
+    pieces += [constants.BLACK_PIECE | _TYPES[_LETTERS.index(letter)] for letter in name[split:]]
+    return tuple(sorted(pieces, key=_PIECE_ORDER.index))
+
+def materialName(pieces):
+    """
+    Names a set of pieces in index order (e.g. "KQK").
+    """
+    return "".join(_LETTERS[_TYPES.index(piece & constants.PIECE_TYPE_MASK)] for piece in pieces)
+
+def _index(squares, side):
+    """
+    Returns the position of an entry in a table.
+
+    @param squares: Square of each piece, in index order.
+    @param side:    0 if white is to move, 1 if black is.
+    """
+    index = 0
+    for sq in squares:
+        index = index << 6 | sq
+    return index << 1 | side
+
+_SLIDERS = {constants.ROOK: magic.rookAttacks, constants.BISHOP: magic.bishopAttacks,
+            constants.QUEEN: magic.queenAttacks}
+
+def _attacks(piece, sq, occupied):
+    """
+    Returns the squares a piece attacks.
+    """
+    pieceType = piece & constants.PIECE_TYPE_MASK
+    if pieceType == constants.KING:
+        return bitboard.KING_ATTACKS[sq]
+    if pieceType == constants.KNIGHT:
+        return bitboard.KNIGHT_ATTACKS[sq]
+    if pieceType == constants.PAWN:
+        return bitboard.PAWN_ATTACKS[_PLAYERS[piece >> 3]][sq]
+    if pieceType == constants.ROOK:
+        return magic.rookAttacks(sq, occupied)
+    if pieceType == constants.BISHOP:
+        return magic.bishopAttacks(sq, occupied)
+    return magic.queenAttacks(sq, occupied)
+
+class _Table(object):
+    """
+    A memory-mapped table file.
+    """
+    def __init__(self, path, pieces):
+        self._file = open(path, "rb")
+        try:
+            self._mapped = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            #Empty files cannot be mapped
+            self._file.close()
+            raise ValueError("%s is not a tablebase" % path)
+        if self._mapped[:len(_HEADER)] != _HEADER or \
+           len(self._mapped) != len(_HEADER) + 2 * 64 ** len(pieces):
+            self.close()
+            raise ValueError("%s is not a tablebase" % path)
+
+    def value(self, index):
+        return ord(self._mapped[len(_HEADER) + index])
+
+    def close(self):
+        self._mapped.close()
+        self._file.close()
+
+class _Generator(object):
+    """
+    Generates one table. Tables with one piece fewer, reached by
+    captures, must already exist.
+    """
+    def __init__(self, directory, pieces):
+        self._pieces = pieces
+        self._count = len(pieces)
+        self._sides = [[i for i, piece in enumerate(pieces) if piece >> 3 == side]
+                       for side in (0, 1)]
+        self._kings = [pieces.index(constants.KING),
+                       pieces.index(constants.BLACK_PIECE | constants.KING)]
+
+        #Squares each piece attacks on an empty board, and for sliding
+        #pieces the function finding what they attack past blockers
+        self._reach = [[_attacks(piece, sq, 0) for sq in range(64)] for piece in pieces]
+        self._sliders = [_SLIDERS.get(piece & constants.PIECE_TYPE_MASK) for piece in pieces]
+
+        #Position of each piece's square within an index
+        self._shifts = [6 * (self._count - 1 - i) + 1 for i in range(self._count)]
+
+        #Tables reached by capturing each piece
+        self._captures = {}
+        for i, piece in enumerate(pieces):
+            if piece & constants.PIECE_TYPE_MASK != constants.KING:
+                rest = pieces[:i] + pieces[i + 1:]
+                self._captures[i] = _Table(_tablePath(directory, materialName(rest)), rest)
+
+    def close(self):
+        for table in self._captures.values():
+            table.close()
+
+    def _isAttacked(self, target, side, squares, occupied, skip=-1):
+        """
+        Determines if a side's pieces (other than the one numbered skip)
+        attack a square.
+        """
+        reach = self._reach
+        sliders = self._sliders
+        for i in self._sides[side]:
+            if i != skip and reach[i][squares[i]] >> target & 1:
+                slider = sliders[i]
+                if slider is None or slider(squares[i], occupied) >> target & 1:
+                    return True
+        return False
+
+    def _decode(self, index):
+        squares = [0] * self._count
+        rest = index >> 1
+        for i in range(self._count - 1, -1, -1):
+            squares[i] = rest & 63
+            rest >>= 6
+        return squares, index & 1
+
+    def analyse(self, first):
+        """
+        Examines the positions whose first piece is on a given square:
+        which are illegal, how many moves each has, and what captures
+        into smaller tables lead to.
+
+        @param first:   Square of the first piece (the white king).
+        @return:        Tuple (values, counts, events, floors) for the
+                        entries from first * stride on: values holds
+                        ILLEGAL or 0; counts the moves not yet known to
+                        lose; events (distance, entry) for results
+                        known in advance; floors the least
+                        distance of positions lost through captures.
+        """
+        pieces = self._pieces
+        count = self._count
+        stride = 2 * 64 ** (count - 1)
+        values = bytearray(stride)
+        counts = bytearray(stride)
+        events = []
+        floors = {}
+
+        for entry in range(stride):
+            squares, side = self._decode(first * stride + entry)
+            occupied = 0
+            for sq in squares:
+                occupied |= 1 << sq
+            if bitboard.popCount(occupied) != count or \
+               self._isAttacked(squares[self._kings[1 - side]], side, squares, occupied):
+                values[entry] = ILLEGAL
+                continue
+
+            own = 0
+            for i in self._sides[side]:
+                own |= 1 << squares[i]
+            owner = dict((sq, i) for i, sq in enumerate(squares))
+            king = self._kings[side]
+            kingSq = squares[king]
+            inCheck = self._isAttacked(kingSq, 1 - side, squares, occupied)
+
+            #Squares the king may not step to, and squares of pieces
+            #that may be pinned
+            withoutKing = occupied & ~(1 << kingSq)
+            danger = 0
+            pinnable = 0
+            for j in self._sides[1 - side]:
+                sq = squares[j]
+                slider = self._sliders[j]
+                if slider is None:
+                    danger |= self._reach[j][sq]
+                else:
+                    danger |= slider(sq, withoutKing)
+                    if self._reach[j][sq] >> kingSq & 1:
+                        pinnable |= bitboard.BETWEEN[sq][kingSq]
+
+            legal = 0
+            quiet = 0
+            bestWin = 0
+            worstLoss = 0
+            drawn = False
+
+            for i in self._sides[side]:
+                piece = pieces[i]
+                fromSq = squares[i]
+                if piece & constants.PIECE_TYPE_MASK == constants.PAWN:
+                    targets = self._pawnTargets(piece, fromSq, occupied, own)
+                else:
+                    targets = _attacks(piece, fromSq, occupied) & ~own
+                if i == king:
+                    targets &= ~danger
+                    check = False
+                else:
+                    check = inCheck or pinnable >> fromSq & 1
+
+                while targets:
+                    bit = targets & -targets
+                    targets ^= bit
+                    toSq = bit.bit_length() - 1
+                    captured = owner.get(toSq, -1)
+                    if check:
+                        moved = list(squares)
+                        moved[i] = toSq
+                        after = occupied & ~(1 << fromSq) | bit
+                        if self._isAttacked(kingSq, 1 - side, moved, after, captured):
+                            continue
+                    legal += 1
+                    if captured < 0:
+                        quiet += 1
+                        continue
+
+                    #The capture leads into a smaller table
+                    moved = list(squares)
+                    moved[i] = toSq
+                    del moved[captured]
+                    value = self._captures[captured].value(_index(moved, 1 - side))
+                    if value == 0:
+                        drawn = True
+                    elif value & 1:
+                        if not bestWin or value < bestWin:
+                            bestWin = value
+                    else:
+                        worstLoss = max(worstLoss, value)
+
+            if not legal:
+                if inCheck:
+                    events.append((0, entry))
+                continue
+
+            if bestWin:
+                events.append((bestWin, entry))
+                #Keep the count from reaching zero
+                quiet += 1
+            elif not quiet and not drawn:
+                events.append((worstLoss, entry))
+            elif worstLoss:
+                floors[entry] = worstLoss
+            counts[entry] = quiet + drawn
+        return values, counts, events, floors
+
+    def _pawnTargets(self, piece, fromSq, occupied, own):
+        player = _PLAYERS[piece >> 3]
+        step, landing = _DOUBLE_STEP[player]
+        empty = bitboard.FULL ^ occupied
+        if step > 0:
+            single = (1 << fromSq + step) & empty
+            double = (single << step) & empty & landing
+        else:
+            single = (1 << fromSq >> -step) & empty
+            double = (single >> -step) & empty & landing
+        enemy = occupied & ~own
+        return single | double | bitboard.PAWN_ATTACKS[player][fromSq] & enemy
+
+    def predecessors(self, index):
+        """
+        Yields the entries of positions with a move (but not a capture)
+        leading to a position.
+        """
+        pieces = self._pieces
+        reach = self._reach
+        sliders = self._sliders
+        squares, side = self._decode(index)
+        mover = 1 - side
+        occupied = 0
+        for sq in squares:
+            occupied |= 1 << sq
+        empty = bitboard.FULL ^ occupied
+        king = self._kings[side]
+        kingSq = squares[king]
+        shifts = self._shifts
+        previous = index ^ 1
+
+        for i in self._sides[mover]:
+            piece = pieces[i]
+            toSq = squares[i]
+            if piece & constants.PIECE_TYPE_MASK == constants.PAWN:
+                step, landing = _DOUBLE_STEP[_PLAYERS[mover]]
+                origins = 0
+                fromSq = toSq - step
+                if 0 <= fromSq < 64 and empty >> fromSq & 1:
+                    origins = 1 << fromSq
+                    if landing >> toSq & 1 and empty >> (fromSq - step) & 1:
+                        origins |= 1 << (fromSq - step)
+            else:
+                origins = _attacks(piece, toSq, occupied) & empty
+
+            #The player to move here must not have been in check before
+            #the move, so any other piece attacking their king once this
+            #one has left must have been blocked by it
+            vacated = occupied & ~(1 << toSq)
+            for k in self._sides[mover]:
+                if k != i and reach[k][squares[k]] >> kingSq & 1:
+                    slider = sliders[k]
+                    if slider is None:
+                        origins = 0
+                    elif slider(squares[k], vacated) >> kingSq & 1:
+                        origins &= bitboard.BETWEEN[squares[k]][kingSq]
+
+            while origins:
+                bit = origins & -origins
+                origins ^= bit
+                fromSq = bit.bit_length() - 1
+                if reach[i][fromSq] >> kingSq & 1:
+                    slider = sliders[i]
+                    if slider is None or slider(fromSq, vacated | bit) >> kingSq & 1:
+                        continue
+                yield previous + (fromSq - toSq << shifts[i])
+
+def _tablePath(directory, name):
+    return os.path.join(directory, name + ".tb")
+
+#Generator for the table being built (in each worker process)
+_generator = None
+
+def _initWorker(directory, pieces):
+    global _generator
+    _generator = _Generator(directory, pieces)
+
+def _serialMap(function, items):
+    for item in items:
+        yield function(item)
+
+def _analyse(first):
+    return _generator.analyse(first)
+
+def _expand(indices):
+    found = array('I')
+    for index in indices:
+        found.extend(_generator.predecessors(index))
+    return found
+
+#Decided positions handed to a worker at a time
+_EXPAND_CHUNK = 4096
+
+def _generateTable(directory, pieces, workers):
+    """
+    Generates one table and writes it to its file.
+    """
+    stride = 2 * 64 ** (len(pieces) - 1)
+    values = bytearray()
+    counts = bytearray()
+    buckets = {}
+    floors = {}
+
+    pool = None
+    if workers > 1:
+        pool = multiprocessing.Pool(workers, _initWorker, (directory, pieces))
+        parallelMap = pool.imap
+    else:
+        _initWorker(directory, pieces)
+        parallelMap = _serialMap
+
+    try:
+        for first, (chunkValues, chunkCounts, events, chunkFloors) in \
+                enumerate(parallelMap(_analyse, range(64))):
+            start = first * stride
+            values += chunkValues
+            counts += chunkCounts
+            for distance, entry in events:
+                buckets.setdefault(distance, []).append(start + entry)
+            for entry, floor in chunkFloors.items():
+                floors[start + entry] = floor
+
+        #Work back from the positions already decided, one ply at a time
+        distance = 0
+        while buckets:
+            if distance > _MAX_DISTANCE:
+                raise ValueError("%s has mates longer than %d plies" %
+                                 (materialName(pieces), _MAX_DISTANCE))
+            decided = []
+            for index in buckets.pop(distance, ()):
+                if not values[index]:
+                    values[index] = distance + 1
+                    decided.append(index)
+
+            chunks = [decided[start:start + _EXPAND_CHUNK]
+                      for start in range(0, len(decided), _EXPAND_CHUNK)]
+            for found in parallelMap(_expand, chunks):
+                for previous in found:
+                    if values[previous]:
+                        continue
+                    if distance & 1 == 0:
+                        #The player to move here is mated, so the previous
+                        #player wins by moving here
+                        buckets.setdefault(distance + 1, []).append(previous)
+                    else:
+                        counts[previous] -= 1
+                        if not counts[previous]:
+                            later = max(distance + 1, floors.get(previous, 0))
+                            buckets.setdefault(later, []).append(previous)
+            distance += 1
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        else:
+            _generator.close()
+
+
+    #Write a temporary file beside the table, then move it into place
+    path = _tablePath(directory, materialName(pieces))
+    fd, temporary = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as output:
+            output.write(_HEADER)
+            output.write(values)
+        os.chmod(temporary, 0o644)
+        os.rename(temporary, path)
+    except:
+        os.remove(temporary)
+        raise
+
+def generate(directory, names, workers=1):
+    """
+    Generates tables, along with the smaller tables they need, unless
+    they already exist.
+
+    @param directory:   Directory to keep the tables in.
+    @param names:       Names of the tables (e.g. ["KQK", "KRK"]).
+    @param workers:     Number of processes to generate each table with.
+    @return:            Names of the tables generated, in order.
+    @raise ValueError:  If a name is not a set of pieces.
+    """
+    generated = []
+
+    def build(pieces):
+        name = materialName(pieces)
+        if name in generated or os.path.exists(_tablePath(directory, name)):
+            return
+        for i, piece in enumerate(pieces):
+            if piece & constants.PIECE_TYPE_MASK != constants.KING:
+                build(pieces[:i] + pieces[i + 1:])
+        _generateTable(directory, pieces, workers)
+        generated.append(name)
+
+    for name in names:
+        build(parseMaterial(name))
+    return generated
+
+class Tablebases(object):
+    def __init__(self, directory):
+        """
+        Opens the tables in a directory. Tables are mapped when first
+        probed.
+
+        @param directory:   Directory the tables were generated in.
+        """
+        self._directory = directory
+        self._tables = {}
+
+    def _table(self, pieces):
+        name = materialName(pieces)
+        if name not in self._tables:
+            path = _tablePath(self._directory, name)
+            self._tables[name] = _Table(path, pieces) if os.path.exists(path) else None
+        return self._tables[name]
+
+    def probe(self, board, player):
+        """
+        Looks a position up.
+
+        @param board:   The game board (a Board instance).
+        @param player:  Player to move (e.g. constants.WHITE_PLAYER).
+        @return:        Tuple (WIN, DRAW or LOSS for the player to move,
+                        distance to mate in plies or None for a draw), or
+                        None if there is no table for the position.
+        """
+        if bitboard.popCount(board.getOccupancy()) > MAX_PIECES:
+            return None
+        pieces = []
+        squares = []
+        for piece in _PIECE_ORDER:
+            for sq in bitboard.squares(board.getBitboard(piece)):
+                pieces.append(piece)
+                squares.append(sq)
+        if pieces.count(constants.KING) != 1 or \
+           pieces.count(constants.BLACK_PIECE | constants.KING) != 1:
+            return None
+
+        table = self._table(tuple(pieces))
+        if table is None:
+            return None
+        value = table.value(_index(squares, _PLAYERS.index(player)))
+        if value == ILLEGAL:
+            return None
+        if value == 0:
+            return DRAW, None
+        if value & 1:
+            return LOSS, value - 1
+        return WIN, value - 1
+
+    def bestMove(self, board, player):
+        """
+        Picks the move that keeps the best result: the quickest mate when
+        winning, a drawing move when drawing, and the slowest defeat when
+        losing.
+
+        @param board:   The game board (a Board instance). It is left unchanged.
+        @param player:  Player to move (e.g. constants.WHITE_PLAYER).
+        @return:        Packed move, or None if there is no table for the
+                        position or it has no legal move.
+        """
+        if self.probe(board, player) is None:
+            return None
+
+        best = None
+        bestScore = None
+        opponent = _PLAYERS[1 - _PLAYERS.index(player)]
+        for move in board.getLegalMoves(player):
+            board.makeMove(move)
+            try:
+                found = self.probe(board, opponent)
+            finally:
+                board.unmakeMove()
+            if found is None:
+                continue
+
+            #Rank the results of the opponent: losing soonest is best
+            result, distance = found
+            if result == LOSS:
+                score = 1000 - distance
+            elif result == DRAW:
+                score = 0
+            else:
+                score = distance - 1000
+            if bestScore is None or score > bestScore:
+                best, bestScore = move, score
+        return best
+
+    def close(self):
+        """
+        Unmaps the table files.
+        """
+        for table in self._tables.values():
+            if table is not None:
+                table.close()
+        self._tables = {}
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Generate or probe endgame tablebases.")
+    commands = parser.add_subparsers(dest="command")
+
+    build = commands.add_parser("generate", help="generate tables")
+    build.add_argument("directory", help="directory to keep the tables in")
+    build.add_argument("names", nargs="+", help="tables to generate (e.g. KQK)")
+    build.add_argument("--workers", type=int, default=1,
+                       help="processes to generate each table with (default 1)")
+
+    probe = commands.add_parser("probe", help="look a position up")
+    probe.add_argument("directory", help="directory holding the tables")
+    probe.add_argument("fen", help="position")
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        if not os.path.isdir(args.directory):
+            os.makedirs(args.directory)
+        for name in generate(args.directory, args.names, args.workers):
+            print("generated %s" % name)
+        return 0
+
+    tables = Tablebases(args.directory)
+    try:
+        board, player = fen.boardFromFen(args.fen)
+        found = tables.probe(board, player)
+        if found is None:
+            print("not in the tables")
+            return 1
+        result, distance = found
+        move = tables.bestMove(board, player)
+        if result == DRAW:
+            print("draw")
+        else:
+            print("%s in %d plies" % ("win" if result == WIN else "loss", distance))
+        if move is not None:
+            print("best move %s" % moves.toText(move))
+    finally:
+        tables.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
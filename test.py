@@ -3,6 +3,11 @@
 import unittest
 from mock import MagicMock
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 class ChessTest(unittest.TestCase):
     """
     Unit tests for chess.
@@ -131,6 +136,15 @@ class ChessTest(unittest.TestCase):
                        ['' ,'' ,'' ,'' ,''  ,''  ,'r' ,''],
                        ['' ,'' ,'' ,'' ,''  ,'r' ,''  ,''] ]
 
+    stalemate1     = [ ['k','' ,'' ,'' ,''  ,''  ,''  ,''  ],
+                       ['' ,'' ,'' ,'' ,''  ,''  ,''  ,''  ],
+                       ['' ,'' ,'' ,'' ,''  ,''  ,''  ,''  ],
+                       ['' ,'' ,'' ,'' ,''  ,''  ,''  ,''  ],
+                       ['' ,'' ,'' ,'' ,''  ,''  ,''  ,''  ],
+                       ['' ,'' ,'' ,'' ,''  ,''  ,''  ,''  ],
+                       ['' ,'' ,'' ,'' ,''  ,'q' ,''  ,''  ],
+                       ['' ,'' ,'' ,'' ,''  ,''  ,''  ,'*k'] ]
+
     def setUp(self):
         """
         Setup test fixture.
@@ -191,7 +205,121 @@ class ChessTest(unittest.TestCase):
 
         b.isLegalMove.assert_called_with(constants.WHITE_PLAYER, [1, 0, 2, 2])
         self.assertEqual(g._currentPlayer, constants.BLACK_PLAYER)
-    
+
+    def test_next_turn_engine(self):
+        from game import Game
+        import constants
+
+        #Get game with the computer playing white
+        engine = MagicMock()
+        engine.chooseMove = MagicMock(return_value=[1, 0, 2, 2])
+        g = Game({constants.WHITE_PLAYER: engine})
+        g._getPlayersNextMove = MagicMock(return_value="b1c3")
+
+        g._nextTurn()
+
+        engine.chooseMove.assert_called_with(g._board, constants.WHITE_PLAYER)
+        self.assertFalse(g._getPlayersNextMove.called)
+        self.assertEqual(g._board.getBoard()[2][2], 'n')
+        self.assertEqual(g._currentPlayer, constants.BLACK_PLAYER)
+
+    def test_game_clock(self):
+        from clock import Clock, TimeControl
+        from game import Game, IN_PROGRESS, FLAGGED
+        import constants
+
+        now = [0.0]
+        clock = Clock(TimeControl(60, 2), timer=lambda: now[0])
+        engine = MagicMock()
+        engine.chooseMove = MagicMock(return_value=[1, 0, 2, 2])
+        display = MagicMock()
+        g = Game({constants.WHITE_PLAYER: engine}, display=display, clock=clock)
+
+        #The engine is given the clock, which passes to black after the move
+        g._nextTurn()
+        engine.chooseMove.assert_called_with(g._board, constants.WHITE_PLAYER, clock)
+        self.assertEqual(clock.getRunning(), constants.BLACK_PLAYER)
+        self.assertEqual(clock.remaining(constants.WHITE_PLAYER), 62)
+        display.showBoard.assert_called_once_with(g._board, footer="White 1:02  Black 1:00")
+
+        #A move made too late loses, and is not played
+        now[0] = 61.0
+        self.assertEqual(g.playMove([1, 6, 1, 5]), FLAGGED)
+        self.assertEqual(g.getStatus(), FLAGGED)
+        self.assertEqual(clock.getFlagged(), constants.BLACK_PLAYER)
+        self.assertEqual(g._board.getBoard()[1][6], '*p')
+        self.assertRaises(ValueError, g.playMove, [6, 1, 5, 1])
+
+    def test_game_draws(self):
+        import os
+        import shutil
+        import tempfile
+        import constants
+        import fen
+        from game import Game, IN_PROGRESS, DRAW, REPETITION, FIFTY_MOVES, MATERIAL
+
+        #Shuffling knights brings the starting position round a third time
+        shuffle = [[6, 0, 5, 2], [6, 7, 5, 5], [5, 2, 6, 0], [5, 5, 6, 7]] * 2
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "game.sav")
+            g = Game(savePath=path)
+            for move in shuffle[:-1]:
+                self.assertEqual(g.playMove(move), IN_PROGRESS)
+
+            #A resumed game still knows which positions have come up
+            g = Game.resume(path)
+            self.assertEqual(g.playMove(shuffle[-1]), DRAW)
+            self.assertEqual(g.getDrawReason(), REPETITION)
+            self.assertRaises(ValueError, g.playMove, [4, 1, 4, 3])
+        finally:
+            shutil.rmtree(directory)
+
+        #A pawn move starts the count again
+        g = Game()
+        for move in shuffle[:4] + [[4, 1, 4, 3], [6, 7, 5, 5], [6, 0, 5, 2], [5, 5, 6, 7]]:
+            self.assertEqual(g.playMove(move), IN_PROGRESS)
+        self.assertEqual(g._halfmoves, 3)
+        self.assertIsNone(g.getDrawReason())
+
+        #Fifty moves each without a capture or pawn move
+        g = Game()
+        g._halfmoves = 99
+        self.assertEqual(g.playMove([6, 0, 5, 2]), DRAW)
+        self.assertEqual(g.getDrawReason(), FIFTY_MOVES)
+
+        #Taking the last rook leaves only a knight, which cannot mate
+        g = Game()
+        g._board, g._currentPlayer = fen.boardFromFen("4k3/8/8/8/8/8/3r4/4K1N1 w - - 0 1")
+        self.assertEqual(g.playMove([4, 0, 3, 1]), DRAW)
+        self.assertEqual(g.getDrawReason(), MATERIAL)
+
+    def test_renderers(self):
+        from StringIO import StringIO
+        from board import Board
+        from game import Game
+        import renderer
+
+        b = Board()
+        stream = StringIO()
+        stream.write = MagicMock(side_effect=stream.write)
+        renderer.TextRenderer(stream).showBoard(b, header="Hello", footer="Bye")
+        self.assertEqual(stream.write.call_count, 1)
+        self.assertEqual(stream.getvalue(), "Hello\n" + b.formatBoard() + "\nBye\n")
+        self.assertEqual(b.formatBoard().splitlines()[1], "8 | *r | *n | *b | *q | *k | *b | *n | *r |")
+
+        stream = StringIO()
+        renderer.AnsiRenderer(stream).showBoard(b)
+        self.assertTrue(stream.getvalue().startswith("\x1b[H\x1b[2J"))
+
+        #Each turn shows the board once
+        display = MagicMock()
+        g = Game(display=display)
+        g._getPlayersNextMove = MagicMock(return_value="b1c3")
+        g._nextTurn()
+        display.showBoard.assert_called_once_with(g._board)
+        renderer.NullRenderer().showBoard(b)
+
     #########################
     # Tests for Board class #
     #########################
@@ -241,6 +369,254 @@ class ChessTest(unittest.TestCase):
         self.assertEqual(b._board[3][3], "")
         self.assertEqual(b._board[5][3], "q")
         
+    #Tests for makeMove() and unmakeMove()
+    def test_make_unmake_move(self):
+        from board import Board
+        import constants
+        b = Board()
+        b._board = ChessTest.board1
+
+        b.makeMove([3, 3, 5, 3])
+        b.makeMove([6, 4, 6, 3])
+        self.assertEqual(b._board[5][3], "q")
+        self.assertEqual(b._board[6][3], "*p")
+
+        b.unmakeMove()
+        b.unmakeMove()
+        self.assertEqual(b._board, ChessTest.board1)
+
+        fresh = Board()
+        fresh._board = ChessTest.board1
+        for piece in constants.WHITE_PIECES + constants.BLACK_PIECES:
+            self.assertEqual(b.getBitboard(piece), fresh.getBitboard(piece))
+        self.assertEqual(b.getOccupancy(), fresh.getOccupancy())
+
+    def test_is_check_leaves_board_unchanged(self):
+        import board_analyzer
+        from board import Board
+        import constants
+        b = Board()
+        b._board = ChessTest.check1
+
+        #Moving the f2 pawn does not address the check, d4-d5 blocks it
+        self.assertTrue(board_analyzer.isCheck(b, constants.WHITE_PLAYER, [5, 1, 5, 2]))
+        self.assertFalse(board_analyzer.isCheck(b, constants.WHITE_PLAYER, [3, 3, 3, 4]))
+        self.assertEqual(b._board, ChessTest.check1)
+
+    #Tests for attack maps
+    def test_attack_maps_follow_moves(self):
+        from board import Board
+        import bitboard
+        import constants
+        b = Board()
+        a6 = bitboard.square(0, 5)
+
+        #Bishop on f1 is blocked by the e2 pawn until it moves
+        self.assertFalse(b.isSquareAttacked(a6, constants.WHITE_PLAYER))
+        b.makeMove([4, 1, 4, 3])
+        self.assertTrue(b.isSquareAttacked(a6, constants.WHITE_PLAYER))
+
+        #A black pawn on b5 cuts the ray again
+        b.makeMove([1, 6, 1, 4])
+        self.assertFalse(b.isSquareAttacked(a6, constants.WHITE_PLAYER))
+        self.assertTrue(b.isSquareAttacked(bitboard.square(1, 4), constants.WHITE_PLAYER))
+
+        b.unmakeMove()
+        b.unmakeMove()
+        fresh = Board()
+        for player in [constants.WHITE_PLAYER, constants.BLACK_PLAYER]:
+            self.assertEqual(b.getAttackMap(player), fresh.getAttackMap(player))
+
+    def test_attack_maps_after_capture(self):
+        from board import Board
+        import bitboard
+        import constants
+        b = Board()
+        b._board = ChessTest.board1
+
+        #Black queen on f4 attacks c1 until the white queen takes her
+        c1 = bitboard.square(2, 0)
+        self.assertTrue(b.isSquareAttacked(c1, constants.BLACK_PLAYER))
+        b.movePiece(constants.WHITE_PLAYER, [3, 3, 5, 3])
+        self.assertFalse(b.isSquareAttacked(c1, constants.BLACK_PLAYER))
+
+        fresh = Board()
+        fresh._board = b._board
+        for player in [constants.WHITE_PLAYER, constants.BLACK_PLAYER]:
+            self.assertEqual(b.getAttackMap(player), fresh.getAttackMap(player))
+
+    #Tests for Zobrist keys
+    def test_zobrist_key_follows_moves(self):
+        from board import Board
+        import constants
+        import zobrist
+        b = Board()
+        start = b.getKey(constants.WHITE_PLAYER)
+
+        self.assertEqual(start, zobrist.computeKey(ChessTest.STARTING_BOARD))
+        self.assertNotEqual(start, b.getKey(constants.BLACK_PLAYER))
+
+        b.makeMove([6, 0, 5, 2])
+        self.assertEqual(b.getKey(constants.WHITE_PLAYER), zobrist.computeKey(b._board))
+        b.unmakeMove()
+        self.assertEqual(b.getKey(constants.WHITE_PLAYER), start)
+
+        #Knights out and back again reach the same key
+        for move in [[6, 0, 5, 2], [1, 7, 2, 5], [5, 2, 6, 0], [2, 5, 1, 7]]:
+            b.movePiece(constants.WHITE_PLAYER, move)
+        self.assertEqual(b.getKey(constants.WHITE_PLAYER), start)
+
+    #Tests for TranspositionTable
+    def test_transposition_table(self):
+        import transposition
+        table = transposition.TranspositionTable(sizeMB=1)
+
+        self.assertEqual(len(table), 1024 * 1024 // transposition.SLOT_BYTES)
+        self.assertEqual(table.probe(12345), None)
+
+        table.store(12345, -250, depth=3, flag=transposition.LOWER_BOUND, move=777)
+        self.assertEqual(table.probe(12345), (-250, 3, transposition.LOWER_BOUND, 777))
+
+        table.clear()
+        self.assertEqual(table.probe(12345), None)
+
+    def test_transposition_table_replacement(self):
+        import transposition
+        table = transposition.TranspositionTable(sizeMB=1)
+        buckets = len(table) // transposition.SLOTS_PER_BUCKET
+
+        #Keys one table-length apart share a bucket
+        deep, shallow, newest = 7, 7 + buckets, 7 + 2 * buckets
+        table.store(deep, 1, depth=6)
+        table.store(shallow, 2, depth=2)
+        table.store(newest, 3, depth=1)
+
+        #The deep entry survives, the always-replace slot holds the newest
+        self.assertEqual(table.probe(deep)[0], 1)
+        self.assertEqual(table.probe(shallow), None)
+        self.assertEqual(table.probe(newest)[0], 3)
+
+        #A deeper result takes over the depth-preferred slot
+        table.store(shallow, 4, depth=9)
+        self.assertEqual(table.probe(shallow)[0], 4)
+        self.assertEqual(table.probe(deep), None)
+
+    def test_has_legal_move_memoised(self):
+        from board import Board
+        import board_analyzer
+        import constants
+        import transposition
+        table = transposition.TranspositionTable(sizeMB=1)
+        b = Board()
+        b._board = ChessTest.checkmate1
+
+        self.assertTrue(board_analyzer.isCheckMate(b, constants.WHITE_PLAYER, table))
+        self.assertEqual(table.probe(b.getKey(constants.WHITE_PLAYER))[0], 0)
+        self.assertTrue(board_analyzer.isCheckMate(b, constants.WHITE_PLAYER, table))
+
+    #Tests for bitboards
+    def test_bitboards_initialization(self):
+        from board import Board
+        import bitboard
+        import constants
+        b = Board()
+
+        self.assertEqual(b.getOccupancy(constants.WHITE_PLAYER), bitboard.RANKS[0] | bitboard.RANKS[1])
+        self.assertEqual(b.getOccupancy(constants.BLACK_PLAYER), bitboard.RANKS[6] | bitboard.RANKS[7])
+        self.assertEqual(b.getBitboard(constants.BLACK_PIECE | constants.KING), 1 << bitboard.square(4, 7))
+
+    def test_bitboards_follow_moves(self):
+        from board import Board
+        import bitboard
+        import constants
+        b = Board()
+        b._board = ChessTest.board1
+
+        b.movePiece(constants.WHITE_PLAYER, [3, 3, 5, 3])
+        self.assertEqual(b.getBitboard(constants.BLACK_PIECE | constants.QUEEN), 0)
+        self.assertEqual(b.getBitboard(constants.QUEEN), 1 << bitboard.square(5, 3))
+        self.assertFalse(b.getOccupancy(constants.BLACK_PLAYER) & (1 << bitboard.square(5, 3)))
+        self.assertFalse(b.getOccupancy() & (1 << bitboard.square(3, 3)))
+
+    def test_bitboard_attacks(self):
+        import bitboard
+        import constants
+        a1 = 1 << bitboard.square(0, 0)
+        d4 = 1 << bitboard.square(3, 3)
+
+        self.assertEqual(bitboard.knightAttacks(a1),
+                         (1 << bitboard.square(1, 2)) | (1 << bitboard.square(2, 1)))
+        self.assertEqual(bitboard.popCount(bitboard.kingAttacks(d4)), 8)
+        self.assertEqual(bitboard.pawnAttacks(a1, constants.WHITE_PLAYER), 1 << bitboard.square(1, 1))
+
+        #Rook on a1 blocked by a piece on a3
+        attacks = bitboard.rookAttacks(a1, 1 << bitboard.square(0, 2))
+        self.assertEqual(attacks, (bitboard.RANKS[0] ^ a1) | (1 << bitboard.square(0, 1)) | (1 << bitboard.square(0, 2)))
+
+    def test_attack_tables(self):
+        import random
+        import bitboard
+        import constants
+
+        #Lookups agree with the set-wise attack functions on every square
+        rng = random.Random(7)
+        for sq in range(64):
+            self.assertEqual(bitboard.KNIGHT_ATTACKS[sq], bitboard.knightAttacks(1 << sq))
+            self.assertEqual(bitboard.KING_ATTACKS[sq], bitboard.kingAttacks(1 << sq))
+            for player in [constants.WHITE_PLAYER, constants.BLACK_PLAYER]:
+                self.assertEqual(bitboard.PAWN_ATTACKS[player][sq],
+                                 bitboard.pawnAttacks(1 << sq, player))
+            for trial in range(4):
+                occupied = rng.getrandbits(64) & rng.getrandbits(64)
+                self.assertEqual(bitboard.rookAttacksFrom(sq, occupied),
+                                 bitboard.rookAttacks(1 << sq, occupied))
+                self.assertEqual(bitboard.bishopAttacksFrom(sq, occupied),
+                                 bitboard.bishopAttacks(1 << sq, occupied))
+
+        #Ray from d4 heading north-west
+        self.assertEqual(bitboard.RAYS[bitboard.NORTH_WEST][bitboard.square(3, 3)],
+                         (1 << bitboard.square(2, 4)) | (1 << bitboard.square(1, 5)) |
+                         (1 << bitboard.square(0, 6)))
+
+    def test_magic_attacks(self):
+        import os
+        import random
+        import shutil
+        import tempfile
+        import bitboard
+        import magic
+
+        #Magic lookups agree with walking the rays
+        rng = random.Random(11)
+        for sq in range(64):
+            for trial in range(8):
+                occupied = rng.getrandbits(64) & rng.getrandbits(64)
+                self.assertEqual(magic.rookAttacks(sq, occupied),
+                                 bitboard.rookAttacksFrom(sq, occupied))
+                self.assertEqual(magic.bishopAttacks(sq, occupied),
+                                 bitboard.bishopAttacksFrom(sq, occupied))
+                self.assertEqual(magic.queenAttacks(sq, occupied),
+                                 bitboard.rookAttacksFrom(sq, occupied) |
+                                 bitboard.bishopAttacksFrom(sq, occupied))
+
+        #The cache round-trips, and a damaged cache is ignored
+        tables = {"rook": (magic.ROOK_MASKS, magic.ROOK_MAGICS,
+                           magic.ROOK_SHIFTS, magic.ROOK_TABLES),
+                  "bishop": (magic.BISHOP_MASKS, magic.BISHOP_MAGICS,
+                             magic.BISHOP_SHIFTS, magic.BISHOP_TABLES)}
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "cache", "magic.pickle")
+            magic._saveCache(path, tables)
+            self.assertEqual(magic._loadCache(path), tables)
+
+            with open(path, "wb") as cache:
+                cache.write(b"damaged")
+            self.assertEqual(magic._loadCache(path), None)
+            self.assertEqual(magic._loadCache(os.path.join(directory, "missing")), None)
+        finally:
+            shutil.rmtree(directory)
+
     """
     #Tests for isLegalMove().
     """
@@ -684,10 +1060,938 @@ class ChessTest(unittest.TestCase):
         self.assertFalse(board_analyzer.isCheckMate(board1, constants.BLACK_PLAYER))
         self.assertFalse(board_analyzer.isCheckMate(board2, constants.WHITE_PLAYER))
         self.assertFalse(board_analyzer.isCheckMate(board2, constants.BLACK_PLAYER))
+
+    #Tests for isStaleMate()
+    def test_is_stale_mate(self):
+        import board_analyzer
+        import constants
+        from board import Board
+
+        b = Board()
+        b._board = ChessTest.stalemate1
+
+        self.assertTrue(board_analyzer.isStaleMate(b, constants.BLACK_PLAYER))
+        self.assertFalse(board_analyzer.isCheckMate(b, constants.BLACK_PLAYER))
+        self.assertFalse(board_analyzer.isStaleMate(b, constants.WHITE_PLAYER))
+
+        b._board = ChessTest.checkmate1
+        self.assertFalse(board_analyzer.isStaleMate(b, constants.WHITE_PLAYER))
+
+    #Tests for generateLegalMoves()
+    def test_generate_legal_moves(self):
+        import constants
+        from board import Board
+
+        b = Board()
+        moves = list(b.generateLegalMoves(constants.WHITE_PLAYER))
+        self.assertEqual(len(moves), 20)
+        self.assertTrue([1, 0, 2, 2] in moves)
+        self.assertTrue([4, 1, 4, 3] in moves)
+
+        #Every generated move passes isLegalMove and nothing else does
+        b._board = ChessTest.board1
+        for player in [constants.WHITE_PLAYER, constants.BLACK_PLAYER]:
+            moves = list(b.generateLegalMoves(player))
+            allMoves = [[c1, r1, c2, r2] for c1 in range(8) for r1 in range(8)
+                                         for c2 in range(8) for r2 in range(8)]
+            self.assertEqual(sorted(moves),
+                             sorted([m for m in allMoves if b.isLegalMove(player, m)]))
+
+        b._board = ChessTest.checkmate1
+        self.assertEqual(list(b.generateLegalMoves(constants.WHITE_PLAYER)), [])
+        
+
+    #Tests for fen.py
+    def test_fen_round_trip(self):
+        import constants
+        import fen
+        from board import Board
+
+        b, player = fen.boardFromFen(fen.STARTING_FEN)
+        self.assertEqual(b.getBoard(), ChessTest.STARTING_BOARD)
+        self.assertEqual(player, constants.WHITE_PLAYER)
+        self.assertEqual(fen.boardToFen(b, player), fen.STARTING_FEN)
+
+        b = Board()
+        b._board = ChessTest.board1
+        text = fen.boardToFen(b, constants.BLACK_PLAYER)
+        b, player = fen.boardFromFen(text)
+        self.assertEqual(b.getBoard(), ChessTest.board1)
+        self.assertEqual(player, constants.BLACK_PLAYER)
+
+        self.assertRaises(ValueError, fen.boardFromFen, "8/8/8 w")
+        self.assertRaises(ValueError, fen.boardFromFen, "9/8/8/8/8/8/8/8 w")
+        self.assertRaises(ValueError, fen.boardFromFen, "8/8/8/8/8/8/8/8 x")
+
+    #Tests for perft.py
+    def test_perft(self):
+        import fen
+        import perft
+
+        for name, fenString, counts in perft.REFERENCE_POSITIONS:
+            b, player = fen.boardFromFen(fenString)
+            before = [col[:] for col in b.getBoard()]
+            for depth, expected in enumerate(counts[:2], 1):
+                self.assertEqual(perft.perft(b, player, depth), expected)
+            self.assertEqual(b.getBoard(), before)
+
+        b, player = fen.boardFromFen(fen.STARTING_FEN)
+        results = perft.divide(b, player, 3)
+        self.assertEqual(len(results), 20)
+        self.assertEqual(sum(count for move, count in results), 8902)
+        
+
+    #Tests for engine.py
+    def test_engine_finds_mate(self):
+        import constants
+        import engine
+        import fen
+
+        #Qa8 mates
+        b, player = fen.boardFromFen("7k/8/6K1/8/8/8/Q7/8 w - - 0 1")
+        e = engine.Engine(maxDepth=4)
+        move, score = e.search(b, player)
+        self.assertEqual(move, [0, 1, 0, 7])
+        self.assertTrue(score > engine.MATE_SCORE - 10)
+
+        #Black is stalemated
+        b, player = fen.boardFromFen("7k/8/6K1/8/8/8/Q7/8 b - - 0 1")
+        self.assertEqual(e.search(b, player), (None, 0))
+
+    def test_engine_wins_material(self):
+        import engine
+        import fen
+
+        #The rook takes the undefended queen
+        b, player = fen.boardFromFen("4k3/8/8/3q4/8/8/3R4/4K3 w - - 0 1")
+        before = [col[:] for col in b.getBoard()]
+        e = engine.Engine(maxDepth=3)
+        self.assertEqual(e.chooseMove(b, player), [3, 1, 3, 4])
+        self.assertEqual(e.getDepth(), 3)
+        self.assertEqual(b.getBoard(), before)
+
+    def test_engine_time_limit(self):
+        import constants
+        import engine
+        from board import Board
+
+        #The first iteration always completes, deeper ones are cut short
+        #once the clock is checked
+        e = engine.Engine(timeLimit=0)
+        move = e.chooseMove(Board(), constants.WHITE_PLAYER)
+        self.assertTrue(move in list(Board().generateLegalMoves(constants.WHITE_PLAYER)))
+        self.assertTrue(1 <= e.getDepth() < 4)
+        
+
+    def test_engine_stop_flag(self):
+        import constants
+        import engine
+        from board import Board
+
+        class Flag(object):
+            value = 1
+
+        #A stopped search gives up before completing any iteration
+        e = engine.Engine(maxDepth=4, stop=Flag())
+        self.assertEqual(e.search(Board(), constants.WHITE_PLAYER), (None, 0))
+        self.assertEqual(e.getDepth(), 0)
+
+    #Tests for clock.py
+    def test_clock(self):
+        import clock
+        import constants
+        import engine
+        from board import Board
+
+        control = clock.parseTimeControl("40/90+30")
+        self.assertEqual((control.base, control.increment, control.moves), (5400, 30, 40))
+        control = clock.parseTimeControl("5+3")
+        self.assertEqual((control.base, control.increment, control.moves), (300, 3, None))
+        for text in ("", "5+", "0", "0/5", "-5", "5 minutes"):
+            self.assertRaises(ValueError, clock.parseTimeControl, text)
+        self.assertEqual(clock.formatTime(247.9), "4:07")
+        self.assertEqual(clock.formatTime(9.34), "0:09.3")
+
+        #Time only runs for the player to move, and comes back every 2 moves
+        now = [100.0]
+        c = clock.Clock(clock.TimeControl(10, moves=2), timer=lambda: now[0])
+        c.start(constants.WHITE_PLAYER)
+        self.assertRaises(ValueError, c.start, constants.BLACK_PLAYER)
+        now[0] += 4
+        self.assertEqual(c.remaining(constants.WHITE_PLAYER), 6)
+        self.assertEqual(c.remaining(constants.BLACK_PLAYER), 10)
+        self.assertTrue(c.stop())
+        self.assertRaises(ValueError, c.stop)
+        self.assertEqual(c.movesToGo(constants.WHITE_PLAYER), 1)
+
+        #The plan leaves time for later moves, except on the last one
+        soft, hard = c.budget(constants.WHITE_PLAYER)
+        self.assertTrue(5.9 < soft == hard < 6)
+        c.start(constants.WHITE_PLAYER)
+        now[0] += 1
+        self.assertTrue(c.stop())
+        self.assertEqual(c.remaining(constants.WHITE_PLAYER), 15)
+        self.assertEqual(c.movesToGo(constants.WHITE_PLAYER), 2)
+        soft, hard = c.budget(constants.WHITE_PLAYER)
+        self.assertTrue(0 < soft <= hard <= 7.5)
+        c.start(constants.WHITE_PLAYER)
+        now[0] += 15
+        self.assertEqual(c.remaining(constants.WHITE_PLAYER), 0)
+        self.assertFalse(c.stop())
+        self.assertEqual(c.getFlagged(), constants.WHITE_PLAYER)
+
+        #The monotonic timer never goes backwards
+        first = clock.monotonic()
+        self.assertTrue(clock.monotonic() >= first)
+
+        #An engine with almost no time left still moves, and promptly
+        c = clock.Clock(clock.TimeControl(0.2))
+        c.start(constants.WHITE_PLAYER)
+        e = engine.Engine()
+        move = e.chooseMove(Board(), constants.WHITE_PLAYER, c)
+        self.assertTrue(c.stop())
+        self.assertTrue(move in list(Board().generateLegalMoves(constants.WHITE_PLAYER)))
+
+    #Tests for parallel_engine.py
+    def test_parallel_engine(self):
+        import fen
+        import parallel_engine
+
+        b, player = fen.boardFromFen("4k3/8/8/3q4/8/8/3R4/4K3 w - - 0 1")
+        e = parallel_engine.ParallelEngine(2, maxDepth=3, sizeMB=1)
+        try:
+            self.assertEqual(e.chooseMove(b, player), [3, 1, 3, 4])
+            self.assertEqual(e.getDepth(), 3)
+
+            #Workers share their results through the table
+            self.assertTrue(any(e._storage))
+        finally:
+            e.close()
+        
+
+    def test_incremental_evaluation(self):
+        import random
+        import constants
+        import evaluation
+        import fen
+        from board import Board
+
+        #Scores every piece afresh from the value and piece-square tables
+        def recount(board):
+            scores = [0, 0, 0]
+            for sq in range(64):
+                piece = board.getPiece(sq)
+                if piece == constants.EMPTY:
+                    continue
+                pieceType = piece & constants.PIECE_TYPE_MASK
+                sign, own = 1, sq
+                if piece & constants.BLACK_PIECE:
+                    sign, own = -1, sq ^ 56
+                scores[0] += sign * (evaluation.PIECE_VALUES[pieceType] +
+                                     evaluation.PIECE_SQUARE_TABLES[pieceType][own])
+                scores[1] += sign * (evaluation.ENDGAME_PIECE_VALUES[pieceType] +
+                                     evaluation.ENDGAME_SQUARE_TABLES[pieceType][own])
+                scores[2] += evaluation.PHASE_WEIGHTS[pieceType]
+            return tuple(scores)
+
+        #The starting position is even, and all middlegame
+        b = Board()
+        self.assertEqual(b.getPieceScores(), (0, 0, evaluation.MAX_PHASE))
+        self.assertEqual(evaluation.evaluate(b, constants.WHITE_PLAYER), 0)
+
+        #With only rooks left, the endgame values count for most
+        b, player = fen.boardFromFen("4k3/8/8/8/8/8/4P3/R3K3 w - - 0 1")
+        middlegame, endgame, phase = b.getPieceScores()
+        self.assertEqual(phase, 2)
+        self.assertEqual((middlegame, endgame, phase), recount(b))
+        self.assertEqual(evaluation.evaluate(b, player), (middlegame * 2 + endgame * 22) // 24)
+        self.assertEqual(evaluation.evaluate(b, constants.BLACK_PLAYER), -evaluation.evaluate(b, player))
+
+        #The totals follow moves, captures and take-backs
+        rng = random.Random(3)
+        b = Board()
+        player = constants.WHITE_PLAYER
+        history = []
+        for ply in range(80):
+            legalMoves = b.getLegalMoves(player)
+            if not legalMoves:
+                break
+            b.makeMove(rng.choice(legalMoves))
+            history.append(recount(b))
+            self.assertEqual(b.getPieceScores(), history[-1])
+            player = 3 - player
+        self.assertTrue(history[-1][2] < evaluation.MAX_PHASE)
+        while history:
+            self.assertEqual(b.getPieceScores(), history.pop())
+            b.unmakeMove()
+        self.assertEqual(b.getPieceScores(), (0, 0, evaluation.MAX_PHASE))
+
+    #Tests for batch_evaluation.py
+    @unittest.skipIf(numpy is None, "NumPy is not installed")
+    def test_batch_evaluation(self):
+        import batch_evaluation
+        import constants
+        import evaluation
+        import fen
+        from board import Board
+
+        b1 = Board()
+        b2, player = fen.boardFromFen("rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b - - 0 1")
+        b3 = Board()
+        b3._board = ChessTest.board1
+        b4, player = fen.boardFromFen("8/5k2/8/3P4/8/8/2K5/7R b - - 0 1")
+        boards = [b1, b2, b3, b4]
+
+        planes = batch_evaluation.packBoards(boards)
+        self.assertEqual(planes.shape, (4, 12, 64))
+        self.assertEqual(list(batch_evaluation.phases(planes)), [24, 24, 24, 2])
+        self.assertEqual(planes[0, 0].sum(), 8)
+        self.assertEqual(planes[1, 0, 12], 0)
+        self.assertEqual(planes[1, 0, 28], 1)
+
+        #Without mobility the scores match evaluation.evaluate()
+        players = [constants.WHITE_PLAYER, constants.BLACK_PLAYER, constants.BLACK_PLAYER,
+                   constants.BLACK_PLAYER]
+        scores = batch_evaluation.evaluateBatch(boards, players, 0)
+        self.assertEqual(list(scores), [evaluation.evaluate(b, p) for b, p in zip(boards, players)])
+
+        #After e4 the bishop and queen can move, so white has ten more squares
+        self.assertEqual(list(batch_evaluation.mobilityScores(planes[:2])), [0, 10])
+        scores = batch_evaluation.evaluateBatch(planes[:2])
+        self.assertEqual(list(scores), [0, 40 + 10 * batch_evaluation.MOBILITY_WEIGHT])
         
+
+    #Tests for getCheckers(), getPinned() and generateEvasions()
+    #Tests for batch_analysis.py
+    def test_batch_analysis(self):
+        import json
+        import batch_analysis
+        import fen
+
+        lines = [fen.STARTING_FEN + "\n", "\n",
+                 "7k/6Q1/6K1/8/8/8/8/8 b - - 0 1\n",
+                 "7k/8/6QK/8/8/8/8/8 b - - 0 1\n",
+                 "7k/8/8/8/8/8/8/K6R b - - 0 1\n",
+                 "not a position\n",
+                 "8/8/8/8/8/8/8/K7 w - - 0 1\n"] * 3
+
+        #Results come back one per position, in order, however they are split up
+        serial = list(batch_analysis.analyseLines(lines))
+        self.assertEqual(len(serial), 18)
+        self.assertEqual(list(batch_analysis.analyseLines(lines, workers=2, chunkSize=2)), serial)
+
+        results = [json.loads(line) for line in serial[:6]]
+        self.assertEqual(results[0]["fen"], fen.STARTING_FEN)
+        self.assertEqual(len(results[0]["moves"]), 20)
+        self.assertTrue("b1c3" in results[0]["moves"])
+        self.assertEqual([(r["check"], r["checkmate"], r["stalemate"]) for r in results[:4]],
+                         [(False, False, False), (True, True, False),
+                          (False, False, True), (True, False, False)])
+        self.assertEqual(results[2]["moves"], [])
+        self.assertEqual(sorted(results[3]["moves"]), ["h8g7", "h8g8"])
+        self.assertTrue("error" in results[4] and "error" in results[5])
+
+        #Chunks must hold at least one position
+        self.assertRaises(ValueError, list, batch_analysis.analyseLines(lines, chunkSize=0))
+        for size in ("0", "-3"):
+            self.assertRaises(SystemExit, batch_analysis.main, ["--chunk-size", size])
+
+    def test_pins_and_checks(self):
+        import bitboard
+        import constants
+        import fen
+
+        #The rook on e4 is pinned to its king by the rook on e8
+        b, player = fen.boardFromFen("k3r3/8/8/8/4R3/8/8/4K3 w - - 0 1")
+        e4 = bitboard.square(4, 3)
+        self.assertEqual(b.getPinned(player), 1 << e4)
+        self.assertEqual(b.getCheckers(player), 0)
+        rookMoves = [move for move in b.generateLegalMoves(player) if move[:2] == [4, 3]]
+        self.assertEqual(sorted(rookMoves), [[4, 3, 4, row] for row in [1, 2, 4, 5, 6, 7]])
+
+        #Double check by the rook and the bishop: only the king may move,
+        #even though the queen could take the bishop
+        b, player = fen.boardFromFen("k3r3/8/8/8/Qb6/8/8/4K3 w - - 0 1")
+        self.assertEqual(b.getCheckers(player),
+                         1 << bitboard.square(4, 7) | 1 << bitboard.square(1, 3))
+        self.assertEqual(sorted(b.generateLegalMoves(player)),
+                         [[4, 0, 3, 0], [4, 0, 5, 0], [4, 0, 5, 1]])
+
+        #Single check: the queen may only take the bishop or block on c3
+        b, player = fen.boardFromFen("k7/8/8/8/1b6/Q7/8/4K3 w - - 0 1")
+        queenMoves = [move for move in b.generateEvasions(player) if move[:2] == [0, 2]]
+        self.assertEqual(sorted(queenMoves), [[0, 2, 1, 3], [0, 2, 2, 2]])
+
+        #The king cannot step back along the line of the checking rook
+        b, player = fen.boardFromFen("k7/8/8/8/r2K4/8/8/8 w - - 0 1")
+        self.assertEqual(sorted(move[2:] for move in b.generateLegalMoves(player)),
+                         [[2, 2], [2, 4], [3, 2], [3, 4], [4, 2], [4, 4]])
+        self.assertFalse([4, 3] in [move[2:] for move in b.generateLegalMoves(player)])
+        for move in b.generateLegalMoves(player):
+            self.assertTrue(b.isLegalMove(player, move))
+
+    def test_piece_codes(self):
+        import bitboard
+        import constants
+        from board import Board
+
+        #Codes and symbols convert both ways
+        for piece, symbol in zip(constants.WHITE_PIECES + constants.BLACK_PIECES,
+                                 constants.WHITE_SYMBOLS + constants.BLACK_SYMBOLS):
+            self.assertEqual(constants.PIECE_SYMBOLS[piece], symbol)
+            self.assertEqual(constants.SYMBOL_PIECES[symbol], piece)
+        self.assertEqual(constants.PIECE_SYMBOLS[constants.EMPTY], constants.EMPTY_SYMBOL)
+
+        #Type and colour are separate bits
+        blackQueen = constants.SYMBOL_PIECES[constants.BLACK_QUEEN_SYMBOL]
+        self.assertEqual(blackQueen & constants.PIECE_TYPE_MASK, constants.QUEEN)
+        self.assertTrue(blackQueen & constants.BLACK_PIECE)
+        self.assertFalse(constants.QUEEN & constants.BLACK_PIECE)
+
+        #The board stores codes but still reads and writes symbols
+        b = Board()
+        self.assertEqual(b.getPiece(bitboard.square(3, 7)), blackQueen)
+        self.assertEqual(b.getPiece(bitboard.square(3, 3)), constants.EMPTY)
+        self.assertEqual(b.getBoard(), ChessTest.STARTING_BOARD)
+        b.makeMove([1, 0, 2, 2])
+        self.assertEqual(b.getBoard()[2][2], constants.KNIGHT_SYMBOL)
+        self.assertEqual(b.getPiece(bitboard.square(2, 2)), constants.KNIGHT)
+
+    def test_snapshots(self):
+        import pickle
+        import constants
+        import fen
+        import position
+        from board import Board
+
+        b, player = fen.boardFromFen("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R b - - 0 1")
+        snapshot = b.snapshot()
+        self.assertEqual(len(snapshot), 64)
+
+        #Restoring rebuilds the same position, keys included
+        restored = Board()
+        restored.restore(snapshot)
+        self.assertEqual(restored.getBoard(), b.getBoard())
+        self.assertEqual(restored.getKey(player), b.getKey(player))
+        self.assertEqual(sorted(restored.generateLegalMoves(player)),
+                         sorted(b.generateLegalMoves(player)))
+        self.assertRaises(ValueError, restored.restore, snapshot[:63])
+        self.assertRaises(ValueError, restored.restore, b"\x07" * 64)
+
+        #Positions survive pickling and shared buffers unchanged
+        pos = position.Position.fromBoard(b, player)
+        self.assertEqual(pickle.loads(pickle.dumps(pos, 2)), pos)
+        buf = bytearray(position.RECORD_SIZE * 2)
+        pos.writeTo(buf, 1)
+        self.assertEqual(position.Position.fromBuffer(buf, 1), pos)
+        self.assertEqual(position.Position.fromBuffer(buf, 1).getPlayer(), constants.BLACK_PLAYER)
+        self.assertEqual(fen.boardToFen(pos.toBoard(), pos.getPlayer()), fen.boardToFen(b, player))
+        self.assertFalse(hasattr(pos, "__dict__"))
+
+    def test_packed_moves(self):
+        import bitboard
+        import constants
+        import moves
+        from board import Board
+
+        #Text, lists and packed moves convert both ways
+        move = moves.fromText("b1c3")
+        self.assertEqual(moves.fromSquare(move), bitboard.square(1, 0))
+        self.assertEqual(moves.toSquare(move), bitboard.square(2, 2))
+        self.assertEqual(moves.toText(move), "b1c3")
+        self.assertEqual(moves.toList(move), [1, 0, 2, 2])
+        self.assertEqual(moves.fromList([1, 0, 2, 2]), move)
+        self.assertEqual(moves.toText(moves.fromText("e7e8q")), "e7e8q")
+        self.assertTrue(moves.fromText("e7e8q") & moves.PROMOTION)
+        for text in ["b1c", "b1c9", "i1c3", "b1c3k", None]:
+            self.assertRaises(ValueError, moves.fromText, text)
+        for sq in range(64):
+            self.assertEqual(moves.fromText(moves.SQUARE_NAMES[sq] + "a1"), sq)
+
+        #The board lists packed moves, and makes them like lists
+        b = Board()
+        moveList = b.getLegalMoves(constants.WHITE_PLAYER)
+        self.assertEqual(moveList.typecode, 'H')
+        self.assertEqual(sorted(moves.toList(move) for move in moveList),
+                         sorted(b.generateLegalMoves(constants.WHITE_PLAYER)))
+        b.makeMove(move)
+        self.assertEqual(b.getBoard()[2][2], constants.KNIGHT_SYMBOL)
+        b.unmakeMove()
+        self.assertEqual(b.getBoard(), ChessTest.STARTING_BOARD)
+        self.assertEqual(b._moveConverter("b1c3"), [1, 0, 2, 2])
+
+    def test_move_log(self):
+        import os
+        import shutil
+        import tempfile
+        import constants
+        import moves
+        import movelog
+        from game import Game
+
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "games.log")
+
+            #Moves are held back until a batch is complete
+            log = movelog.MoveLog(path, batchSize=3, flushInterval=3600)
+            log.record(7, 0, moves.fromText("e2e4"), 100.0)
+            log.record(8, 0, moves.fromText("d2d4"), 100.5)
+            self.assertEqual(list(movelog.readLog(path)), [])
+            log.record(7, 1, moves.fromText("e7e5"), 101.0)
+            self.assertEqual(len(list(movelog.readLog(path))), 3)
+
+            #Closing writes the rest, and reopening appends
+            log.record(8, 1, moves.fromText("d7d5"), 102.0)
+            log.close()
+            with movelog.MoveLog(path) as log:
+                log.record(9, 0, moves.fromText("g1f3"), 103.0)
+            entries = list(movelog.readLog(path, chunkRecords=2))
+            self.assertEqual([(gameId, ply, moves.toText(move)) for gameId, ply, move, t in entries],
+                             [(7, 0, "e2e4"), (8, 0, "d2d4"), (7, 1, "e7e5"),
+                              (8, 1, "d7d5"), (9, 0, "g1f3")])
+            self.assertEqual(entries[2][3], 101.0)
+
+            #A torn last record is skipped
+            with open(path, "ab") as damaged:
+                damaged.write(b"\x01\x02\x03")
+            self.assertEqual(len(list(movelog.readLog(path))), 5)
+
+            #and cut off when the log is next opened, so later moves read back
+            with movelog.MoveLog(path) as log:
+                log.record(10, 0, moves.fromText("c2c4"), 104.0)
+            entries = list(movelog.readLog(path))
+            self.assertEqual(entries[-1], (10, 0, moves.fromText("c2c4"), 104.0))
+            self.assertEqual(len(entries), 6)
+            self.assertEqual(sorted(os.listdir(directory)), ["games.log"])
+
+            #Other files are refused
+            otherPath = os.path.join(directory, "other.txt")
+            with open(otherPath, "wb") as other:
+                other.write(b"not a log")
+            self.assertRaises(ValueError, movelog.MoveLog, otherPath)
+            os.remove(otherPath)
+
+            #Games record each move they play
+            gamePath = os.path.join(directory, "game.log")
+            with movelog.MoveLog(gamePath) as log:
+                g = Game(log=log, gameId=42)
+                g._getPlayersNextMove = MagicMock(side_effect=["b1c3", "g8f6"])
+                g._nextTurn()
+                g._nextTurn()
+            self.assertEqual([(gameId, ply, moves.toText(move))
+                              for gameId, ply, move, t in movelog.readLog(gamePath)],
+                             [(42, 0, "b1c3"), (42, 1, "g8f6")])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_pgn_import(self):
+        import os
+        import tempfile
+        import fen
+        import moves
+        import pgn
+
+        archive = ('[Event "Scholar"]\n'
+                   '[White "A \\"Quoted\\" Name"]\n\n'
+                   '1. e4 e5 2. Bc4 {a comment} Nc6 3. Qh5 Nf6?? (3... g6 4. Qf3)\n'
+                   '4. Qxf7# 1-0\n\n'
+                   '[Event "Castles"]\n\n'
+                   '1. e4 e5 2. Nf3 Nc6 3. Bc4 Bc5 4. O-O *\n\n'
+                   '[Event "Endgame"]\n'
+                   '[FEN "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1"]\n\n'
+                   '1. Rb1 $1 Rh6 2. g3+ Kg4 ; a line comment\n'
+                   '3. gxf4 1/2-1/2\n')
+        handle, path = tempfile.mkstemp(suffix=".pgn")
+        try:
+            os.write(handle, archive)
+            os.close(handle)
+
+            for workers, chunkSize in [(1, pgn.CHUNK_SIZE), (2, 10)]:
+                games = list(pgn.importGames(path, workers, chunkSize))
+                self.assertEqual([len(game.moves) for game in games], [7, 6, 5])
+                self.assertEqual([game.result for game in games], ["1-0", None, "1/2-1/2"])
+                self.assertEqual(games[0].tags["White"], 'A "Quoted" Name')
+                self.assertEqual(games[0].error, None)
+                self.assertTrue("castling" in games[1].error)
+                self.assertEqual(moves.toText(games[2].moves[-1]), "g3f4")
+
+            positions = list(pgn.gamePositions(games[2]))
+            self.assertEqual(positions[0], games[2].fen)
+            self.assertEqual(positions[-1], "8/2p5/3p3r/KP6/5Pk1/8/4P3/1R6 b - - 0 1")
+        finally:
+            os.remove(path)
+
+        #SAN names the file or rank only when needed, and marks checks
+        b, player = fen.boardFromFen("4k3/8/8/8/8/8/4K3/R6R w - - 0 1")
+        self.assertEqual(pgn.moveToSan(b, player, moves.fromText("a1d1")), "Rad1")
+        self.assertEqual(pgn.moveToSan(b, player, moves.fromText("h1h8")), "Rh8+")
+        self.assertEqual(pgn.sanToMove(b, player, "Rad1"), moves.fromText("a1d1"))
+        self.assertRaises(ValueError, pgn.sanToMove, b, player, "Rd1")
+        self.assertRaises(ValueError, pgn.sanToMove, b, player, "Qd1")
+
+    def test_opening_book(self):
+        import os
+        import shutil
+        import tempfile
+        import book
+        import constants
+        import fen
+        import moves
+        import movelog
+        from board import Board
+        from engine import Engine
+
+        directory = tempfile.mkdtemp()
+        try:
+            archive = os.path.join(directory, "games.pgn")
+            with open(archive, "wb") as games:
+                games.write(b'[Event "1"]\n\n1. e4 e5 2. Nf3 *\n\n'
+                            b'[Event "2"]\n\n1. e4 c5 *\n\n'
+                            b'[Event "3"]\n\n1. d4 d5 *\n')
+            log = os.path.join(directory, "games.log")
+            with movelog.MoveLog(log) as records:
+                records.record(5, 0, moves.fromText("e2e4"))
+                records.record(5, 1, moves.fromText("e7e5"))
+
+            path = os.path.join(directory, "openings.book")
+            self.assertEqual(book.buildBook(path, [archive], [log], plies=2), 5)
+            openings = book.OpeningBook(path, seed=1)
+            self.assertEqual(len(openings), 5)
+
+            #Moves are found by position, most played first
+            b = Board()
+            self.assertEqual([(moves.toText(move), weight)
+                              for move, weight in openings.getMoves(b, constants.WHITE_PLAYER)],
+                             [("e2e4", 3), ("d2d4", 1)])
+            b.movePiece(constants.WHITE_PLAYER, moves.fromText("e2e4"))
+            self.assertEqual([moves.toText(move) for move, weight in
+                              openings.getMoves(b, constants.BLACK_PLAYER)], ["e7e5", "c7c5"])
+
+            #Only the first plies are kept
+            b.movePiece(constants.BLACK_PLAYER, moves.fromText("e7e5"))
+            self.assertEqual(openings.getMoves(b, constants.WHITE_PLAYER), [])
+            self.assertEqual(openings.chooseMove(b, constants.WHITE_PLAYER), None)
+
+            #The engine plays book moves without searching
+            searcher = Engine(maxDepth=3, book=openings)
+            b = Board()
+            self.assertTrue(searcher.chooseMove(b, constants.WHITE_PLAYER) in ([4, 1, 4, 3], [3, 1, 3, 3]))
+            self.assertEqual(searcher.getNodes(), 0)
+
+            #Rare moves can be left out
+            self.assertEqual(book.buildBook(path, [archive], [log], plies=2, minGames=2), 2)
+            openings.close()
+
+            with open(archive, "wb") as other:
+                other.write(b"not a book")
+            self.assertRaises(ValueError, book.OpeningBook, archive)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_tablebase(self):
+        import os
+        import shutil
+        import tempfile
+        import constants
+        import fen
+        import moves
+        import tablebase
+
+        king = constants.KING
+        blackKing = constants.BLACK_PIECE | constants.KING
+        self.assertEqual(tablebase.parseMaterial("kqk"), (king, constants.QUEEN, blackKing))
+        self.assertEqual(tablebase.materialName(tablebase.parseMaterial("KRKN")), "KRKN")
+        self.assertRaises(ValueError, tablebase.parseMaterial, "QK")
+        self.assertRaises(ValueError, tablebase.parseMaterial, "KXK")
+        self.assertRaises(ValueError, tablebase.parseMaterial, "KQRKR")
+
+        directory = tempfile.mkdtemp()
+        try:
+            #Lone kings can never be mated
+            self.assertEqual(tablebase.generate(directory, ["KK"]), ["KK"])
+            self.assertEqual(tablebase.generate(directory, ["KK"]), [])
+            tables = tablebase.Tablebases(directory)
+            b, player = fen.boardFromFen("8/8/8/4k3/8/8/8/4K3 w - - 0 1")
+            self.assertEqual(tables.probe(b, player), (tablebase.DRAW, None))
+            self.assertTrue(b.isLegalMove(player, moves.toList(tables.bestMove(b, player))))
+            b, player = fen.boardFromFen("8/8/8/8/8/8/8/3kK3 w - - 0 1")
+            self.assertEqual(tables.probe(b, player), None)
+            b, player = fen.boardFromFen(fen.STARTING_FEN)
+            self.assertEqual(tables.probe(b, player), None)
+            tables.close()
+
+            #King and queen mate the lone king in at most ten moves
+            self.assertEqual(tablebase.generate(directory, ["KQK"]), ["KQK"])
+            tables = tablebase.Tablebases(directory)
+            b, player = fen.boardFromFen("7k/8/6K1/8/8/8/Q7/8 w - - 0 1")
+            self.assertEqual(tables.probe(b, player), (tablebase.WIN, 1))
+            self.assertEqual(moves.toText(tables.bestMove(b, player)), "a2a8")
+            b, player = fen.boardFromFen("Q6k/8/6K1/8/8/8/8/8 b - - 0 1")
+            self.assertEqual(tables.probe(b, player), (tablebase.LOSS, 0))
+            #An undefended queen next to the king is simply taken
+            b, player = fen.boardFromFen("8/8/8/8/8/8/8/Qk2K3 b - - 0 1")
+            self.assertEqual(tables.probe(b, player), (tablebase.DRAW, None))
+            tables.close()
+
+            #White to move entries are the even ones (see tablebase._index())
+            with open(os.path.join(directory, "KQK.tb"), "rb") as table:
+                values = bytearray(table.read())[len(b"CHESSTB\x01"):]
+            self.assertEqual(max(value - 1 for value in values[0::2]
+                                 if value != tablebase.ILLEGAL), 19)
+
+            #Checkmates are found first, and captures lead into smaller tables
+            pieces = tablebase.parseMaterial("KQK")
+            generator = tablebase._Generator(directory, pieces)
+            g6, g7, h8 = 46, 54, 63
+            stride = 2 * 64 ** 2
+            values, counts, events, floors = generator.analyse(g6)
+            mated = tablebase._index([g6, g7, h8], 1) - g6 * stride
+            self.assertTrue((0, mated) in events)
+            self.assertEqual(values[tablebase._index([g6, g6, h8], 0) - g6 * stride],
+                             tablebase.ILLEGAL)
+            previous = list(generator.predecessors(tablebase._index([g6, g7, h8], 1)))
+            self.assertTrue(tablebase._index([g6, 49, h8], 0) in previous)
+            self.assertFalse(tablebase._index([g6, 55, h8], 0) in previous)
+            generator.close()
+        finally:
+            shutil.rmtree(directory)
+
+    def test_game_server(self):
+        import socket
+        import server
+
+        host = server.GameServer(port=0)
+        clients = []
+        received = {}
+
+        def connect():
+            client = socket.create_connection(host.getAddress())
+            client.setblocking(False)
+            clients.append(client)
+            received[client] = b""
+            return client
+
+        def readLine(client):
+            for attempt in range(500):
+                if b"\n" in received[client]:
+                    line, received[client] = received[client].split(b"\n", 1)
+                    return line
+                host.serve(timeout=0.01, count=1)
+                try:
+                    received[client] += client.recv(4096)
+                except socket.error:
+                    pass
+            self.fail("no reply")
+
+        try:
+            white = connect()
+            self.assertEqual(readLine(white), b"wait")
+            black = connect()
+            start = readLine(white).split()
+            self.assertEqual(start[:2], [b"start", b"white"])
+            gameId = int(start[2])
+            self.assertEqual(readLine(black), b"start black %d" % gameId)
+
+            #Moves are checked and passed on to both players
+            black.sendall(b"e7e5\n")
+            self.assertEqual(readLine(black), b"error not your turn")
+            white.sendall(b"e2e5\n")
+            self.assertEqual(readLine(white), b"error illegal move")
+            white.sendall(b"hello\n")
+            self.assertEqual(readLine(white), b"error unknown command")
+            for mover, text in [(white, b"f2f3"), (black, b"e7e5"), (white, b"g2g4")]:
+                mover.sendall(text + b"\r\n")
+                self.assertEqual(readLine(white), b"move " + text)
+                self.assertEqual(readLine(black), b"move " + text)
+            black.sendall(b"board\n")
+            self.assertEqual(readLine(black),
+                             b"board rnbqkbnr/pppp1ppp/8/4p3/6P1/5P2/PPPPP2P/RNBQKBNR b - - 0 1")
+
+            black.sendall(b"d8h4\n")
+            self.assertEqual(readLine(white), b"move d8h4")
+            self.assertEqual(readLine(white), b"end black checkmate")
+            self.assertEqual(readLine(black), b"move d8h4")
+            self.assertEqual(readLine(black), b"end black checkmate")
+
+            #A new game starts once both players ask, and leaving resigns it
+            white.sendall(b"new\n")
+            self.assertEqual(readLine(white), b"wait")
+            black.sendall(b"new\n")
+            gameId = (gameId + 1) & 0xFFFFFFFF
+            self.assertEqual(readLine(white), b"start white %d" % gameId)
+            self.assertEqual(readLine(black), b"start black %d" % gameId)
+            black.close()
+            clients.remove(black)
+            self.assertEqual(readLine(white), b"end white disconnected")
+
+            #Overlong lines are refused once every earlier reply has been
+            #sent, even with replies backed up, and the rest is ignored
+            noisy = connect()
+            self.assertEqual(readLine(noisy), b"wait")
+            noisy.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1024)
+            for channel in list(host._socketMap.values()):
+                if channel is not host and channel.game is None:
+                    channel.socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1024)
+            outgoing = b"board\n" * 5000 + b"x" * 300 + b"\nquit\n"
+            for attempt in range(2000):
+                try:
+                    outgoing = outgoing[noisy.send(outgoing):]
+                except socket.error:
+                    pass
+                host.serve(timeout=0.01, count=1)
+                try:
+                    data = noisy.recv(4096)
+                except socket.error:
+                    continue
+                if not data:
+                    break
+                received[noisy] += data
+            lines = received[noisy].splitlines()
+            self.assertEqual(lines[:-1], [b"error no game"] * 5000)
+            self.assertEqual(lines[-1], b"error line too long")
+            white.sendall(b"quit\n")
+            self.assertEqual(readLine(white), b"bye")
+        finally:
+            for client in clients:
+                client.close()
+            host.close()
+
+    def test_server_game_ids(self):
+        import os
+        import shutil
+        import tempfile
+        import movelog
+        import server
+
+        #Two servers logging to one file number their games apart
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "games.log")
+            log = movelog.MoveLog(path)
+            hosts = [server.GameServer(port=0, log=log) for index in range(2)]
+            try:
+                for host in hosts:
+                    white = MagicMock()
+                    host._pair(white)
+                    host._pair(MagicMock())
+                    white.game.playMove([4, 1, 4, 3])
+            finally:
+                for host in hosts:
+                    host.close()
+            log.close()
+
+            gameIds = [record[0] for record in movelog.readLog(path)]
+            self.assertEqual(len(gameIds), 2)
+            self.assertNotEqual(gameIds[0], gameIds[1])
+        finally:
+            shutil.rmtree(directory)
+
     """
     #Tests for isCheck().
     """
+    def test_save_game(self):
+        import os
+        import shutil
+        import tempfile
+        import constants
+        import fen
+        import moves
+        import savegame
+        from clock import Clock, TimeControl
+        from game import Game, IN_PROGRESS, FLAGGED
+
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "game.sav")
+
+            #Games save themselves after every move
+            g = Game(gameId=42, savePath=path)
+            g._getPlayersNextMove = MagicMock(side_effect=["b1c3", "g8f6", "e2e4"])
+            g._nextTurn()
+            g._nextTurn()
+            g._nextTurn()
+            saved = savegame.load(path)
+            self.assertEqual(saved.gameId, 42)
+            self.assertEqual(saved.player, constants.BLACK_PLAYER)
+            self.assertEqual([moves.toText(move) for move in saved.history],
+                             ["b1c3", "g8f6", "e2e4"])
+            self.assertEqual(fen.boardToFen(saved.toBoard(), saved.player),
+                             fen.boardToFen(g._board, constants.BLACK_PLAYER))
+            self.assertEqual(os.listdir(directory), ["game.sav"])
+
+            #A resumed game carries on where it left off
+            resumed = Game.resume(path)
+            self.assertEqual(resumed._board.getBoard(), g._board.getBoard())
+            self.assertEqual(resumed._currentPlayer, constants.BLACK_PLAYER)
+            resumed._getPlayersNextMove = MagicMock(side_effect=["f6e4"])
+            resumed._nextTurn()
+            self.assertEqual(resumed._board.getPiece(moves.squareIndex("e4")),
+                             constants.BLACK_PIECE | constants.KNIGHT)
+            self.assertEqual(len(savegame.load(path).history), 4)
+            self.assertEqual(savegame.load(path).player, constants.WHITE_PLAYER)
+
+            #Games on a clock carry on with the time each player had left
+            now = [0.0]
+            timed = Clock(TimeControl(60, 2, 40), timer=lambda: now[0])
+            g = Game(savePath=path, clock=timed)
+            g._getPlayersNextMove = MagicMock(side_effect=["e2e4", "e7e5"])
+            timed.start(constants.WHITE_PLAYER)
+            now[0] = 5.0
+            g._nextTurn()
+            now[0] = 15.25
+            g._nextTurn()
+            saved = savegame.load(path)
+            self.assertEqual(saved.clock.remaining(constants.WHITE_PLAYER), 57)
+            self.assertEqual(saved.clock.remaining(constants.BLACK_PLAYER), 51.75)
+            self.assertEqual(saved.clock.movesToGo(constants.BLACK_PLAYER), 39)
+            resumed = Game.resume(path, clock=Clock(TimeControl(300)))
+            control = resumed._clock.getControl()
+            self.assertEqual((control.base, control.increment, control.moves), (60, 2, 40))
+            self.assertEqual(resumed._clock.remaining(constants.WHITE_PLAYER), 57)
+            self.assertEqual(resumed._clock.remaining(constants.BLACK_PLAYER), 51.75)
+            self.assertEqual(resumed._clock.getRunning(), None)
+
+            #A player whose time runs out before they move loses without
+            #being asked for one, and the game stays lost when resumed
+            now[0] = 72.25
+            display = MagicMock()
+            g._display = display
+            g._waitForQuit = MagicMock()
+            g._nextTurn()
+            self.assertEqual(g.getStatus(), FLAGGED)
+            self.assertEqual(g._getPlayersNextMove.call_count, 2)
+            display.showBoard.assert_called_once_with(
+                g._board, footer="Player 1 has run out of time. Player 2 has won the game!")
+            self.assertEqual(savegame.load(path).status, FLAGGED)
+            resumed = Game.resume(path, display=display)
+            self.assertEqual(resumed.getStatus(), FLAGGED)
+            self.assertRaises(ValueError, resumed.playMove, [6, 0, 5, 2])
+            resumed._waitForQuit = MagicMock(side_effect=SystemExit)
+            self.assertRaises(SystemExit, resumed.play)
+            self.assertEqual(display.showBoard.call_args[1]["footer"],
+                             "Player 1 has run out of time. Player 2 has won the game!")
+
+            #Saves from before clocks still load, without one
+            with open(path, "rb") as saved:
+                data = saved.read()
+            with open(path, "wb") as old:
+                old.write(data[:8] + b"\x01" + data[9:16] + data[40:])
+            saved = savegame.load(path)
+            self.assertEqual(saved.clock, None)
+            self.assertEqual(saved.status, IN_PROGRESS)
+            self.assertEqual(len(saved.history), 2)
+
+            #Other files are refused
+            with open(path, "r+b") as damaged:
+                damaged.truncate(os.path.getsize(path) - 1)
+            self.assertRaises(ValueError, savegame.load, path)
+            with open(path, "wb") as other:
+                other.write(b"not a saved game")
+            self.assertRaises(ValueError, savegame.load, path)
+        finally:
+            shutil.rmtree(directory)
+
     def test_is_check(self):
         import board_analyzer
         import constants
@@ -0,0 +1,132 @@
+#!/usr/bin/python
+
+"""
+Fixed-size transposition table keyed on Zobrist keys.
+
+The table is split into buckets of two slots. The first slot keeps the
+entry searched to the greatest depth, the second always takes the newest
+entry that did not qualify for the first. The number of buckets is fixed
+when the table is created, so its memory use never grows.
+"""
+import ctypes
+
+#Kinds of stored value
+EXACT = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
+#Each slot holds two 64-bit words: a check word and the packed data
+SLOT_BYTES = 16
+SLOTS_PER_BUCKET = 2
+
+#Set in every stored entry, so that no entry packs to zero (an empty slot)
+_USED = 1 << 58
+
+def _pack(value, depth, flag, move):
+    """
+    Packs an entry into 64 bits: 32-bit value, 8-bit depth, 2-bit flag
+    and 16-bit move.
+    """
+    return (value & 0xFFFFFFFF) | (depth & 0xFF) << 32 | flag << 40 | move << 42 | _USED
+
+def _unpack(data):
+    """
+    Unpacks an entry packed by _pack().
+
+    @return:    Tuple (value, depth, flag, move).
+    """
+    value = int(data & 0xFFFFFFFF)
+    if value & 0x80000000:
+        value -= 0x100000000
+    return value, int(data >> 32 & 0xFF), int(data >> 40 & 0x3), int(data >> 42 & 0xFFFF)
+
+def storageWords(sizeMB):
+    """
+    Returns the number of 64-bit words a table of the given memory limit
+    uses. The bucket count is rounded down to a power of two.
+
+    @param sizeMB:  Memory limit for the table, in megabytes.
+    @return:        Length of the table's storage array.
+    """
+    buckets = 1
+    while (buckets * 2) * SLOTS_PER_BUCKET * SLOT_BYTES <= sizeMB * 1024 * 1024:
+        buckets *= 2
+    return buckets * SLOTS_PER_BUCKET * 2
+
+class TranspositionTable(object):
+    def __init__(self, sizeMB=16, storage=None):
+        """
+        Creates an empty table.
+
+        @param sizeMB:  Memory limit for the table, in megabytes.
+        @param storage: Optional pre-allocated array of 64-bit words
+                        (e.g. in shared memory) to use instead of
+                        allocating one. Its length fixes the size
+                        (see storageWords()).
+        """
+        if storage is None:
+            storage = (ctypes.c_uint64 * storageWords(sizeMB))()
+
+        #Bucket count is a power of two so a key maps to a bucket by masking
+        self._storage = storage
+        self._bucketMask = len(storage) // (SLOTS_PER_BUCKET * 2) - 1
+
+    def getStorage(self):
+        """
+        Returns the array of 64-bit words backing the table.
+        """
+        return self._storage
+
+    def __len__(self):
+        """
+        Returns the number of entries the table can hold.
+        """
+        return (self._bucketMask + 1) * SLOTS_PER_BUCKET
+
+    def clear(self):
+        """
+        Removes every entry.
+        """
+        ctypes.memset(self._storage, 0, ctypes.sizeof(self._storage))
+
+    def probe(self, key):
+        """
+        Looks up a position.
+
+        @param key:     64-bit Zobrist key (e.g. from Board.getKey()).
+        @return:        Tuple (value, depth, flag, move), or None if the
+                        position is not in the table.
+        """
+        storage = self._storage
+        index = (key & self._bucketMask) * SLOTS_PER_BUCKET * 2
+        for slot in range(index, index + SLOTS_PER_BUCKET * 2, 2):
+            data = storage[slot + 1]
+            #Keys are stored XORed with their data, so a slot half-written
+            #by another process never matches
+            if data and storage[slot] ^ data == key:
+                return _unpack(data)
+        return None
+
+    def store(self, key, value, depth=0, flag=EXACT, move=0):
+        """
+        Stores a result for a position.
+
+        @param key:     64-bit Zobrist key (e.g. from Board.getKey()).
+        @param value:   Result to store (signed 32-bit integer).
+        @param depth:   Depth the result was searched to (0-255).
+        @param flag:    EXACT, LOWER_BOUND or UPPER_BOUND.
+        @param move:    Best move found, as a 16-bit integer (0 for none).
+        """
+        storage = self._storage
+        index = (key & self._bucketMask) * SLOTS_PER_BUCKET * 2
+        data = _pack(value, depth, flag, move)
+
+        #Depth-preferred slot: same position, or at least as deep
+        stored = storage[index + 1]
+        if not stored or storage[index] ^ stored == key or depth >= (stored >> 32) & 0xFF:
+            slot = index
+        else:
+            slot = index + 2
+
+        storage[slot] = key ^ data
+        storage[slot + 1] = data
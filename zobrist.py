@@ -0,0 +1,62 @@
+#!/usr/bin/python
+
+"""
+Zobrist keys used to identify positions.
+
+Every (piece, square) pair has a fixed random 64-bit key, and a position's
+key is the XOR of the keys of the pieces on it. Board keeps its key up to
+date as pieces are added and removed.
+
+The keys are generated from a fixed seed so that they are identical on
+every run and any stored keys stay valid.
+"""
+import constants
+
+_MASK = 0xFFFFFFFFFFFFFFFF
+
+def _splitMix64(seed):
+    """
+    Yields an endless stream of 64-bit pseudo-random numbers.
+    """
+    while True:
+        seed = (seed + 0x9E3779B97F4A7C15) & _MASK
+        value = seed
+        value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+        value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _MASK
+        yield value ^ (value >> 31)
+
+_numbers = _splitMix64(0x5EED)
+
+#Key of each piece on each square, indexed [piece code][square]
+PIECE_KEYS = [None] * 16
+for _piece in constants.WHITE_PIECES + constants.BLACK_PIECES:
+    PIECE_KEYS[_piece] = [next(_numbers) for _sq in range(64)]
+
+#XORed into the key when black is to move
+BLACK_TO_MOVE = next(_numbers)
+
+def sideKey(player):
+    """
+    Returns the key component for the player to move.
+
+    @param player:  Player to move (e.g. constants.WHITE_PLAYER).
+    @return:        64-bit key.
+    """
+    if player == constants.BLACK_PLAYER:
+        return BLACK_TO_MOVE
+    return 0
+
+def computeKey(squares):
+    """
+    Computes the key of a position from scratch.
+
+    @param squares: List of lists of piece symbols, indexed [col][row].
+    @return:        64-bit key (without the side to move).
+    """
+    key = 0
+    for col in range(8):
+        for row in range(8):
+            piece = squares[col][row]
+            if piece != constants.EMPTY_SYMBOL:
+                key ^= PIECE_KEYS[constants.SYMBOL_PIECES[piece]][row * 8 + col]
+    return key